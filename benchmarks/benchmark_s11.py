@@ -0,0 +1,302 @@
+"""Benchmarks for the S11 processing pipeline of the NQRduck AutoTM module.
+
+The benchmarks run on synthetic sweeps, no hardware is needed.
+For every sweep size the run time and the peak memory of each processing stage are reported.
+
+Usage:
+    python benchmarks/benchmark_s11.py --save baseline.json
+    python benchmarks/benchmark_s11.py --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+import scipy
+from nqrduck_autotm.model import S11Data
+from nqrduck_autotm.controller import AutoTMController
+from nqrduck_autotm.serial_io import (
+    SWEEP_SAMPLE_DTYPE,
+    SerialMessage,
+    decode_frame,
+    encode_frame,
+)
+
+SIZES = [400, 4_000, 40_000, 400_000]
+START_FREQUENCY = 35e6  # Hz
+STOP_FREQUENCY = 200e6  # Hz
+
+
+def synthetic_sweep(n_points: int, seed: int = 0, coupling: float = 1.0) -> list:
+    """Creates the data points of a synthetic sweep of a probe coil.
+
+    The probe coil is modelled as a resonator behind a cable, the data points are converted to mV like the readings of the AD8302.
+
+    Args:
+        n_points (int): The number of data points.
+        seed (int): The seed of the measurement noise.
+        coupling (float): The coupling of the resonator. 1 is critically coupled, 0 is a short, a large value an open.
+
+    Returns:
+        list: The data points as (frequency, return loss, phase) tuples in Hz and mV.
+    """
+    rng = np.random.default_rng(seed)
+    frequency = np.linspace(START_FREQUENCY, STOP_FREQUENCY, n_points)
+
+    resonance_frequency = 83.56e6  # Hz
+    quality_factor = 80
+    cable_delay = 15e-9  # s
+    detuning = frequency / resonance_frequency - resonance_frequency / frequency
+    gamma = (coupling - 1 - 1j * quality_factor * detuning) / (
+        coupling + 1 + 1j * quality_factor * detuning
+    )
+    gamma *= np.exp(-2j * np.pi * frequency * cable_delay)
+
+    # The return loss is positive, the host calculates |gamma| = 10 ** (-return_loss_db / 20)
+    return_loss_db = -20 * np.log10(np.abs(gamma) + 1e-6)
+    return_loss_mv = (
+        S11Data.CENTER_POINT_MAGNITUDE
+        + S11Data.MAGNITUDE_SLOPE * return_loss_db
+        + rng.normal(0, 2, n_points)
+    )
+    phase_mv = (
+        S11Data.CENTER_POINT_PHASE
+        + S11Data.PHASE_SLOPE * np.abs(np.degrees(np.angle(gamma)))
+        + rng.normal(0, 5, n_points)
+    )
+
+    return list(zip(frequency.tolist(), return_loss_mv.tolist(), phase_mv.tolist()))
+
+
+def calibration_controller(n_points: int) -> AutoTMController:
+    """Creates a controller with synthetic short, open and load standards.
+
+    Args:
+        n_points (int): The number of data points of the standards.
+
+    Returns:
+        AutoTMController: The controller. Only the model part of the module is populated.
+    """
+    model = SimpleNamespace(
+        short_calibration=S11Data(synthetic_sweep(n_points, seed=1, coupling=0)),
+        open_calibration=S11Data(synthetic_sweep(n_points, seed=2, coupling=1e6)),
+        load_calibration=S11Data(synthetic_sweep(n_points, seed=3, coupling=1)),
+        calibration=None,
+        calibration_store=None,
+        standard_keys={},
+        standard_variances={},
+        standard_definitions=None,
+    )
+    view = SimpleNamespace(add_info_text=print, add_error_text=print)
+    return AutoTMController(SimpleNamespace(model=model, view=view))
+
+
+def stages(n_points: int) -> dict:
+    """The stages of the S11 processing pipeline.
+
+    Every stage is a pair of a setup function and the benchmarked function.
+    The setup creates fresh objects so that no cached results are reused between runs.
+
+    Args:
+        n_points (int): The number of data points.
+
+    Returns:
+        dict: The stages by name.
+    """
+    data_points = synthetic_sweep(n_points)
+    columns = [np.array(column) for column in zip(*data_points)]
+
+    def fresh_data():
+        return S11Data.from_arrays(*columns)
+
+    # The sweep as it is received from the ATM system, as text lines and as binary frames
+    lines = [
+        f"f{frequency}r{return_loss:.1f}p{phase:.1f}"
+        for frequency, return_loss, phase in data_points
+    ]
+    samples = np.empty(n_points, dtype=SWEEP_SAMPLE_DTYPE)
+    samples["frequency"], samples["return_loss"], samples["phase"] = columns
+    frames = b"".join(
+        encode_frame(sequence, samples[start : start + 256])
+        for sequence, start in enumerate(range(0, n_points, 256))
+    )
+
+    def parse_frames(buffer):
+        # The frames are not copied when they are sliced off the buffer
+        buffer = memoryview(buffer)
+        messages = []
+        while buffer:
+            message, size = decode_frame(buffer)
+            messages.append(message)
+            buffer = buffer[size:]
+        return messages
+
+    def calibrated():
+        controller = calibration_controller(n_points)
+        controller.calculate_calibration()
+        data = fresh_data()
+        data.gamma
+        return data, controller.module.model.calibration
+
+    return {
+        "parse_text": (
+            lambda: lines,
+            lambda lines: [SerialMessage.parse(line) for line in lines],
+        ),
+        "parse_frames": (lambda: frames, parse_frames),
+        "construction": (lambda: data_points, S11Data),
+        "return_loss_db": (fresh_data, lambda data: data.return_loss_db),
+        "phase_correction": (fresh_data, lambda data: data.phase_deg),
+        # Includes the phase correction, gamma is calculated from the corrected phase
+        "gamma": (fresh_data, lambda data: data.gamma),
+        "calculate_calibration": (
+            lambda: calibration_controller(n_points),
+            lambda controller: controller.calculate_calibration(),
+        ),
+        # The calibration as it is applied in AutoTMView.plot_measurement
+        "plot_correction": (
+            calibrated,
+            lambda args: args[1].apply(args[0]),
+        ),
+    }
+
+
+def measure(setup, function, repeat: int) -> dict:
+    """Measures the run time and the peak memory of a function.
+
+    Args:
+        setup (callable): Creates the argument of the function.
+        function (callable): The benchmarked function.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: The median and minimal run time in s and the peak memory in bytes.
+    """
+    # The first run is not timed, it includes imports and the allocation of the numpy buffers
+    function(setup())
+
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run, tracing slows down the timed runs
+    argument = setup()
+    tracemalloc.start()
+    function(argument)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "time_s": statistics.median(times),
+        "min_time_s": min(times),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run(sizes: list, repeat: int) -> dict:
+    """Runs all benchmarks.
+
+    Args:
+        sizes (list): The sweep sizes in points.
+        repeat (int): The number of timed runs per stage.
+
+    Returns:
+        dict: The results by sweep size and stage.
+    """
+    results = {}
+    for n_points in sizes:
+        results[str(n_points)] = {}
+        for name, (setup, function) in stages(n_points).items():
+            result = measure(setup, function, repeat)
+            results[str(n_points)][name] = result
+            print(
+                f"{n_points:>8} {name:<22} {result['time_s'] * 1e3:>12.3f} ms {result['peak_memory_bytes'] / 2**20:>10.2f} MiB"
+            )
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Compares results to a baseline.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The baseline results.
+        threshold (float): The ratio to the baseline above which a stage counts as regression.
+
+    Returns:
+        bool: True if no stage regressed.
+    """
+    passed = True
+    print(f"\n{'points':>8} {'stage':<22} {'time':>8} {'memory':>8}")
+    for n_points, stage_results in results["results"].items():
+        for name, result in stage_results.items():
+            reference = baseline["results"].get(n_points, {}).get(name)
+            if reference is None:
+                continue
+
+            # The minimal run time is least affected by other load on the machine
+            time_ratio = result["min_time_s"] / reference["min_time_s"]
+            memory_ratio = result["peak_memory_bytes"] / max(
+                reference["peak_memory_bytes"], 1
+            )
+            regression = time_ratio > threshold or memory_ratio > threshold
+            passed &= not regression
+            print(
+                f"{n_points:>8} {name:<22} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x"
+                + ("  REGRESSION" if regression else "")
+            )
+
+    return passed
+
+
+def main() -> int:
+    """Runs the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="Save the results as baseline JSON file")
+    parser.add_argument("--compare", help="Compare the results to a baseline JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.5,
+        help="Ratio to the baseline above which a stage counts as regression",
+    )
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,15 @@
 """The NQRduck AutoTM module. It is used to automatically tune and match magnetic resonance probe coils."""
 
-from .autotm import AutoTM as Module
-
 __all__ = ["Module"]
+
+
+def __getattr__(name: str):
+    """Import the module when it is first accessed.
+
+    Creating the module builds its widgets, which needs a QApplication. The simulator and the benchmarks only import the submodules they use.
+    """
+    if name == "Module":
+        from .autotm import AutoTM
+
+        return AutoTM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
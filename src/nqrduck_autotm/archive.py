@@ -0,0 +1,238 @@
+"""Append-only on-disk archive of the S11 sweeps measured with the AutoTM module.
+
+The archive consists of two files. The data file contains the raw frequency, return loss and phase arrays of all sweeps back to back.
+The index file contains one fixed size entry per sweep with the position of the sweep in the data file, the timestamp, the sweep range and the tuning and matching setting.
+The index is small enough to be kept in memory, range queries by time and frequency window only read the matching sweeps from the data file.
+"""
+
+import logging
+import struct
+import time
+from pathlib import Path
+import numpy as np
+from .model import S11Data
+
+logger = logging.getLogger(__name__)
+
+
+class SweepRecord:
+    """A single sweep stored in the sweep archive."""
+
+    def __init__(
+        self,
+        timestamp: float,
+        start_frequency: float,
+        stop_frequency: float,
+        tuning: float,
+        matching: float,
+        data: S11Data,
+    ) -> None:
+        """Initialize the sweep record."""
+        self.timestamp = timestamp
+        self.start_frequency = start_frequency
+        self.stop_frequency = stop_frequency
+        self.tuning = tuning
+        self.matching = matching
+        self.data = data
+
+
+class SweepArchive:
+    """This class is used to append S11 sweeps to an on-disk archive and to query them by time and frequency window."""
+
+    DEFAULT_DIRECTORY = Path.home() / ".nqrduck" / "autotm" / "sweeps"
+    DATA_FILE = "sweeps.dat"
+    INDEX_FILE = "sweeps.idx"
+
+    INDEX_MAGIC = b"S11I"
+    INDEX_VERSION = 1
+    INDEX_HEADER = struct.Struct("<4sH10x")  # magic, version, padding
+    INDEX_DTYPE = np.dtype(
+        [
+            ("offset", "<u8"),  # bytes
+            ("n_points", "<u8"),
+            ("timestamp", "<f8"),  # s since epoch
+            ("start_frequency", "<f8"),  # Hz
+            ("stop_frequency", "<f8"),  # Hz
+            ("tuning", "<f8"),  # V or steps, NaN if unknown
+            ("matching", "<f8"),  # V or steps, NaN if unknown
+        ]
+    )
+    DATA_DTYPE = S11Data.BINARY_DTYPE
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY) -> None:
+        """Initialize the sweep archive. The archive files are created if they don't exist yet.
+
+        Args:
+            directory (str): The directory of the archive.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.data_file = self.directory / self.DATA_FILE
+        self.index_file = self.directory / self.INDEX_FILE
+
+        self.data_file.touch()
+        if not self.index_file.exists() or self.index_file.stat().st_size == 0:
+            with open(self.index_file, "wb") as f:
+                f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION))
+
+        self.index = self._read_index()
+        # The archive is append-only so the timestamps are sorted unless the clock was changed
+        timestamps = self.index["timestamp"]
+        self.sorted = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+    def _read_index(self) -> np.ndarray:
+        """Read the index file. A partially written entry at its end is truncated.
+
+        Returns:
+            np.ndarray: The index entries.
+        """
+        with open(self.index_file, "rb") as f:
+            magic, version = self.INDEX_HEADER.unpack(
+                f.read(self.INDEX_HEADER.size)
+            )
+            if magic != self.INDEX_MAGIC:
+                raise ValueError(f"{self.index_file} is not a sweep archive index")
+            if version > self.INDEX_VERSION:
+                raise ValueError(
+                    f"Unsupported sweep archive version {version} in {self.index_file}"
+                )
+            index = np.frombuffer(f.read(), dtype=np.uint8)
+
+        # An entry that was only partially written is removed, so the next entry is appended at the right position
+        n_entries = len(index) // self.INDEX_DTYPE.itemsize
+        size = n_entries * self.INDEX_DTYPE.itemsize
+        if size < len(index):
+            logger.warning(
+                "Removing a partially written entry from %s", self.index_file
+            )
+            with open(self.index_file, "r+b") as f:
+                f.truncate(self.INDEX_HEADER.size + size)
+        return index[:size].view(self.INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        """The number of sweeps in the archive."""
+        return len(self.index)
+
+    def append(
+        self, data: S11Data, timestamp: float = None, lut_entry: tuple = (None, None)
+    ) -> None:
+        """Append a sweep to the archive.
+
+        The data is written before the index entry, so an interrupted write never leaves an index entry without data.
+
+        Args:
+            data (S11Data): The S11 data of the sweep.
+            timestamp (float): The time of the sweep in seconds since the epoch. Defaults to now.
+            lut_entry (tuple): The tuning and matching setting during the sweep.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        frequency = data.frequency
+        tuning, matching = (np.nan if value is None else value for value in lut_entry)
+        entry = np.array(
+            [
+                (
+                    self.data_file.stat().st_size,
+                    len(frequency),
+                    timestamp,
+                    frequency.min() if len(frequency) else np.nan,
+                    frequency.max() if len(frequency) else np.nan,
+                    tuning,
+                    matching,
+                )
+            ],
+            dtype=self.INDEX_DTYPE,
+        )
+
+        with open(self.data_file, "ab") as f:
+            for column in data.millivolts:
+                np.asarray(column, dtype=self.DATA_DTYPE).tofile(f)
+
+        with open(self.index_file, "ab") as f:
+            entry.tofile(f)
+
+        if len(self.index) and timestamp < self.index["timestamp"][-1]:
+            self.sorted = False
+        self.index = np.concatenate((self.index, entry))
+        logger.debug("Archived sweep %s with %s points", len(self), len(frequency))
+
+    def query(
+        self,
+        start_time: float = None,
+        stop_time: float = None,
+        start_frequency: float = None,
+        stop_frequency: float = None,
+    ) -> list:
+        """Return the sweeps in the given time range that overlap with the given frequency window.
+
+        Only the index is searched, the data of the matching sweeps is memory-mapped from the data file.
+
+        Args:
+            start_time (float): The earliest timestamp in seconds since the epoch. Defaults to no limit.
+            stop_time (float): The latest timestamp in seconds since the epoch. Defaults to no limit.
+            start_frequency (float): The lower edge of the frequency window in Hz. Defaults to no limit.
+            stop_frequency (float): The upper edge of the frequency window in Hz. Defaults to no limit.
+
+        Returns:
+            list: The matching sweeps as SweepRecord objects, ordered by time.
+        """
+        index = self.index
+        timestamps = index["timestamp"]
+
+        if self.sorted:
+            first = 0 if start_time is None else np.searchsorted(timestamps, start_time)
+            last = (
+                len(index)
+                if stop_time is None
+                else np.searchsorted(timestamps, stop_time, side="right")
+            )
+            positions = np.arange(first, last)
+        else:
+            mask = np.ones(len(index), dtype=bool)
+            if start_time is not None:
+                mask &= timestamps >= start_time
+            if stop_time is not None:
+                mask &= timestamps <= stop_time
+            positions = np.flatnonzero(mask)
+            positions = positions[np.argsort(timestamps[positions], kind="stable")]
+
+        entries = index[positions]
+        mask = np.ones(len(entries), dtype=bool)
+        if start_frequency is not None:
+            mask &= entries["stop_frequency"] >= start_frequency
+        if stop_frequency is not None:
+            mask &= entries["start_frequency"] <= stop_frequency
+
+        return [self._read_record(entry) for entry in entries[mask]]
+
+    def _read_record(self, entry: np.void) -> SweepRecord:
+        """Read the sweep of an index entry from the data file.
+
+        Args:
+            entry (np.void): The index entry.
+
+        Returns:
+            SweepRecord: The sweep.
+        """
+        n_points = int(entry["n_points"])
+        if n_points == 0:
+            data = S11Data.from_arrays(*np.empty((3, 0), dtype=self.DATA_DTYPE))
+        else:
+            columns = np.memmap(
+                self.data_file,
+                dtype=self.DATA_DTYPE,
+                mode="r",
+                offset=int(entry["offset"]),
+                shape=(3, n_points),
+            )
+            data = S11Data.from_arrays(columns[0], columns[1], columns[2])
+
+        return SweepRecord(
+            float(entry["timestamp"]),
+            float(entry["start_frequency"]),
+            float(entry["stop_frequency"]),
+            float(entry["tuning"]),
+            float(entry["matching"]),
+            data,
+        )
@@ -0,0 +1,139 @@
+"""Store of the calibrations calculated with the AutoTM module.
+
+Calibrations are kept by the settings of the frequency sweep they have been calculated for.
+The most recently used calibrations are kept in memory, all calibrations are written to disk so they are available after a restart.
+"""
+
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from .model import Calibration
+
+logger = logging.getLogger(__name__)
+
+
+class CalibrationStore:
+    """This class is used to store calculated calibrations by start frequency, stop frequency, number of points and signal path of the frequency sweep."""
+
+    DEFAULT_DIRECTORY = Path.home() / ".nqrduck" / "autotm" / "calibrations"
+    DEFAULT_CAPACITY = 8  # calibrations kept in memory
+    FILE_EXTENSION = "npz"
+
+    def __init__(
+        self, directory: str = DEFAULT_DIRECTORY, capacity: int = DEFAULT_CAPACITY
+    ) -> None:
+        """Initialize the calibration store. The directory is created if it doesn't exist yet.
+
+        Args:
+            directory (str): The directory the calibrations are written to.
+            capacity (int): The maximum number of calibrations kept in memory.
+        """
+        if capacity < 1:
+            raise ValueError("The capacity of the calibration store must be at least 1")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.capacity = capacity
+        # Ordered from least to most recently used
+        self.calibrations = OrderedDict()
+
+    @staticmethod
+    def make_key(
+        start_frequency: float,
+        stop_frequency: float,
+        n_points: int,
+        signal_path: str = None,
+    ) -> tuple:
+        """Create the key of a frequency sweep.
+
+        Args:
+            start_frequency (float): The start frequency of the sweep in Hz.
+            stop_frequency (float): The stop frequency of the sweep in Hz.
+            n_points (int): The number of points of the sweep.
+            signal_path (str): The signal path during the sweep.
+
+        Returns:
+            tuple: The key of the frequency sweep.
+        """
+        # The frequencies are rounded to Hz so the same range always gives the same key
+        return (
+            int(round(start_frequency)),
+            int(round(stop_frequency)),
+            int(n_points),
+            signal_path or "",
+        )
+
+    def filename(self, key: tuple) -> Path:
+        """The file a calibration is written to.
+
+        Args:
+            key (tuple): The key of the frequency sweep.
+
+        Returns:
+            Path: The path of the calibration file.
+        """
+        start_frequency, stop_frequency, n_points, signal_path = key
+        name = f"{start_frequency}_{stop_frequency}_{n_points}"
+        if signal_path:
+            name += f"_{signal_path}"
+        return self.directory / f"{name}.{self.FILE_EXTENSION}"
+
+    def __len__(self) -> int:
+        """The number of calibrations kept in memory."""
+        return len(self.calibrations)
+
+    def __contains__(self, key: tuple) -> bool:
+        """Check if there is a calibration for the key in memory or on disk."""
+        return key in self.calibrations or self.filename(key).exists()
+
+    def get(self, key: tuple) -> Calibration:
+        """Return the calibration for a frequency sweep.
+
+        Calibrations that are not in memory are loaded from disk.
+
+        Args:
+            key (tuple): The key of the frequency sweep.
+
+        Returns:
+            Calibration: The calibration or None if there is no calibration for the key.
+        """
+        if key in self.calibrations:
+            self.calibrations.move_to_end(key)
+            return self.calibrations[key]
+
+        filename = self.filename(key)
+        if not filename.exists():
+            return None
+
+        try:
+            calibration = Calibration.load(filename)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Could not load calibration from %s: %s", filename, e)
+            return None
+
+        self._insert(key, calibration)
+        return calibration
+
+    def put(self, key: tuple, calibration: Calibration) -> None:
+        """Add a calibration to the store and write it to disk.
+
+        Args:
+            key (tuple): The key of the frequency sweep.
+            calibration (Calibration): The calibration.
+        """
+        self._insert(key, calibration)
+        calibration.save(self.filename(key))
+        logger.debug("Stored calibration for %s", key)
+
+    def _insert(self, key: tuple, calibration: Calibration) -> None:
+        """Insert a calibration as most recently used and evict the least recently used ones from memory.
+
+        Args:
+            key (tuple): The key of the frequency sweep.
+            calibration (Calibration): The calibration.
+        """
+        self.calibrations[key] = calibration
+        self.calibrations.move_to_end(key)
+        while len(self.calibrations) > self.capacity:
+            evicted, _ = self.calibrations.popitem(last=False)
+            logger.debug("Evicted calibration for %s from memory", evicted)
@@ -0,0 +1,242 @@
+"""Asynchronous commands to the ATM system.
+
+Every command is confirmed by the ATM system with a 'c'. The confirmations arrive in the order the commands were written,
+so they are matched to the oldest unconfirmed command.
+
+The firmware has no command terminator, it separates commands by the time between them. Commands that are written back to back
+would be read as one command, so the commands are serialized: a command is written when the previous one is confirmed.
+The callers don't wait for the confirmation, they get a future of the command.
+"""
+
+import logging
+import time
+from collections import deque
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+logger = logging.getLogger(__name__)
+
+
+class CommandFuture(QObject):
+    """The pending result of a command. The command is done when it was confirmed or failed."""
+
+    PENDING = "pending"
+    SENT = "sent"
+    CONFIRMED = "confirmed"
+    FAILED = "failed"
+
+    finished = pyqtSignal(object)
+
+    def __init__(self, command: str, timeout: float) -> None:
+        """Initialize the future.
+
+        Args:
+            command (str): The command.
+            timeout (float): The time in s the ATM system may be silent before the command is confirmed.
+        """
+        super().__init__()
+        self.command = command
+        self.timeout = timeout
+        self.state = self.PENDING
+        self.error = None
+        self.sent_at = None
+        self.confirmed_at = None
+
+    @property
+    def letter(self) -> str:
+        """The first character of the command, it defines the type of the command."""
+        return self.command[:1]
+
+    def done(self) -> bool:
+        """Returns True if the command was confirmed or failed."""
+        return self.state in (self.CONFIRMED, self.FAILED)
+
+    def confirmed(self) -> bool:
+        """Returns True if the command was confirmed."""
+        return self.state == self.CONFIRMED
+
+    def failed(self) -> bool:
+        """Returns True if the command failed."""
+        return self.state == self.FAILED
+
+    def add_done_callback(self, callback) -> None:
+        """Call the callback with the future when the command is done. If it is already done the callback is called right away.
+
+        Args:
+            callback (callable): Called with the future.
+        """
+        if self.done():
+            callback(self)
+        else:
+            self.finished.connect(callback)
+
+    def set_sent(self) -> None:
+        """Mark the command as written to the serial connection."""
+        self.state = self.SENT
+        self.sent_at = time.monotonic()
+
+    def set_confirmed(self, confirmed_at: float = None) -> None:
+        """Mark the command as confirmed by the ATM system.
+
+        Args:
+            confirmed_at (float): The monotonic time the confirmation was received at. Defaults to now.
+        """
+        self.state = self.CONFIRMED
+        self.confirmed_at = time.monotonic() if confirmed_at is None else confirmed_at
+        self.finished.emit(self)
+
+    def set_failed(self, error: str) -> None:
+        """Mark the command as failed.
+
+        Args:
+            error (str): The reason why the command failed.
+        """
+        self.state = self.FAILED
+        self.error = error
+        self.finished.emit(self)
+
+
+class CommandEngine(QObject):
+    """This class writes the commands to the serial connection and matches the confirmations to them.
+
+    The timeout of a command is the time the ATM system may stay silent while the command is the oldest unconfirmed one.
+    Data received from the ATM system, like the points of a frequency sweep, restarts the timeout.
+    """
+
+    DEFAULT_TIMEOUT = 10  # s
+    # Timeouts by the first character of the command
+    TIMEOUTS = {
+        "c": 2,  # signal path
+        "v": 2,  # voltages
+        "r": 2,  # reflection
+        "f": 10,  # frequency sweep
+        "s": 10,  # voltage sweep
+        "p": 10,  # position sweep
+        "m": 30,  # stepper move
+        "h": 60,  # homing
+        "b": 2,  # binary frames
+    }
+    # Only one command is unconfirmed at a time, because the firmware can't tell commands apart that are written back to back.
+    # A larger window is only possible with firmware that delimits its commands.
+    DEFAULT_MAX_IN_FLIGHT = 1  # commands
+
+    command_written = pyqtSignal(object)
+
+    def __init__(
+        self,
+        serial,
+        timeouts: dict = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ) -> None:
+        """Initialize the command engine.
+
+        Args:
+            serial (SerialReader): The serial connection the commands are written to.
+            timeouts (dict): The timeouts in s by the first character of the command. Defaults to TIMEOUTS.
+            max_in_flight (int): The maximum number of commands that are written but not confirmed yet.
+        """
+        super().__init__()
+        if max_in_flight < 1:
+            raise ValueError("At least one command must be allowed in flight")
+
+        self.serial = serial
+        self.timeouts = dict(self.TIMEOUTS if timeouts is None else timeouts)
+        self.max_in_flight = max_in_flight
+
+        # Commands that wait for a free slot and commands that wait for their confirmation
+        self.queued = deque()
+        self.in_flight = deque()
+        self.last_activity = time.monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.check_timeout)
+
+    def submit(self, command: str) -> CommandFuture:
+        """Queue a command. It is written as soon as less than max_in_flight commands are unconfirmed.
+
+        Args:
+            command (str): The command.
+
+        Returns:
+            CommandFuture: The future of the command.
+        """
+        future = CommandFuture(
+            command, self.timeouts.get(command[:1], self.DEFAULT_TIMEOUT)
+        )
+        self.queued.append(future)
+        self.write_queued()
+        return future
+
+    def write_queued(self) -> None:
+        """Write the queued commands while there are free slots."""
+        while self.queued and len(self.in_flight) < self.max_in_flight:
+            future = self.queued.popleft()
+            if not self.in_flight:
+                self.last_activity = time.monotonic()
+            self.in_flight.append(future)
+            future.set_sent()
+            logger.debug("Writing command %s", future.command)
+            self.serial.write(future.command.encode("utf-8"))
+            self.command_written.emit(future)
+
+        self.schedule_timeout()
+
+    def on_confirmation(self, received: float = None) -> None:
+        """This method is called when a confirmation is received. It belongs to the oldest unconfirmed command.
+
+        Args:
+            received (float): The monotonic time the confirmation was read at. Defaults to now.
+        """
+        if not self.in_flight:
+            logger.warning("Received a confirmation without an unconfirmed command")
+            return
+
+        self.last_activity = time.monotonic()
+        future = self.in_flight.popleft()
+        logger.debug("Command %s confirmed", future.command)
+        future.set_confirmed(received)
+        self.write_queued()
+
+    def on_activity(self) -> None:
+        """This method is called when data is received. It restarts the timeout of the oldest unconfirmed command."""
+        self.last_activity = time.monotonic()
+
+    def schedule_timeout(self) -> None:
+        """Start the timer for the timeout of the oldest unconfirmed command."""
+        if not self.in_flight:
+            self.timer.stop()
+            return
+
+        deadline = self.last_activity + self.in_flight[0].timeout
+        self.timer.start(max(0, int((deadline - time.monotonic()) * 1000)))
+
+    @pyqtSlot()
+    def check_timeout(self) -> None:
+        """This method is called when the timer of the oldest unconfirmed command expires.
+
+        If data was received in the meantime, the timer is restarted. Otherwise the command and all commands after it fail,
+        because their confirmations can't be matched anymore.
+        """
+        if not self.in_flight:
+            return
+
+        future = self.in_flight[0]
+        if time.monotonic() - self.last_activity < future.timeout:
+            self.schedule_timeout()
+            return
+
+        logger.error("Command %s timed out after %s s", future.command, future.timeout)
+        self.cancel_all(f"Command {future.command} timed out after {future.timeout} s")
+
+    def cancel_all(self, error: str) -> None:
+        """Fail all commands that are queued or unconfirmed, e.g. when the serial connection is closed.
+
+        Args:
+            error (str): The reason why the commands failed.
+        """
+        self.timer.stop()
+        futures = list(self.in_flight) + list(self.queued)
+        self.in_flight.clear()
+        self.queued.clear()
+        for future in futures:
+            future.set_failed(error)
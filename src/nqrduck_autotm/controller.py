@@ -1,22 +1,35 @@
 """The controller for the NQRduck AutoTM module."""
 
+import copy
 import logging
+import os
+import struct
 import time
+from collections import Counter
 import numpy as np
 import json
+import zipfile
 from serial.tools.list_ports import comports
-from PyQt6 import QtSerialPort
 from PyQt6.QtCore import pyqtSlot
-from PyQt6.QtCore import QTimer
-from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QEventLoop, QTimer, QThreadPool
 from nqrduck.module.module_controller import ModuleController
 from .model import (
     S11Data,
+    Calibration,
+    CalibrationStandard,
+    SweepAverager,
     ElectricalLookupTable,
     MechanicalLookupTable,
     SavedPosition,
     Stepper,
 )
+from .archive import SweepArchive
+from .calibration_store import CalibrationStore
+from .worker import Worker
+from .serial_io import FRAME_VERSION, LINE_PARSERS, SerialMessage, SerialReader
+from .commands import CommandEngine, CommandFuture
+from .recorder import SessionRecorder, SessionReplay
+from .latency import CommandLatency
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +38,44 @@ class AutoTMController(ModuleController):
     """The controller for the NQRduck AutoTM module. It handles the serial connection and the signals and slots."""
 
     BAUDRATE = 115200
+    # Additional devices that are not found by the scan, e.g. the simulator, separated by os.pathsep
+    DEVICES_VARIABLE = "NQRDUCK_AUTOTM_DEVICES"
+    # Lines that wait for the GUI thread beyond the high-water mark are dropped
+    HIGH_WATER_MARK = SerialReader.DEFAULT_HIGH_WATER_MARK  # lines
+    LATE_LINE_THRESHOLD = SerialReader.DEFAULT_LATE_THRESHOLD  # s
+    # Ask the ATM system to send the points of frequency sweeps as binary frames, the text lines are the fallback
+    BINARY_FRAMES = False
+    # Record the serial traffic of every connection to a file in this directory
+    RECORDING_VARIABLE = "NQRDUCK_AUTOTM_RECORDING"
+
+    def __init__(self, module) -> None:
+        """Initialize the AutoTM controller."""
+        super().__init__(module)
+        # The background workers that are running
+        self.workers = set()
+        # The handlers of the serial lines by their first character and the number of lines routed to them
+        self.line_handlers = {}
+        self.line_parsers = dict(LINE_PARSERS)
+        self.line_counts = Counter()
+        # The round-trip latencies of the commands
+        self.command_latency = CommandLatency()
+        # Writes the commands to the open serial connection and matches the confirmations to them
+        self.command_engine = None
+        # The conditions that are waited for and the event loops that wait for them
+        self.waiters = []
+        # The recording of the serial traffic and the replay of a recording
+        self.recorder = None
+        self.replay = None
+        # The serial reader whose port is being opened. A reference is kept, its thread must not be deleted while it runs
+        self.pending_serial = None
+        # The sequence numbers of the last measurement that was submitted for processing and the last one that was shown
+        self.measurement_sequence = 0
+        self.shown_sequence = 0
+
+    @property
+    def replaying(self) -> bool:
+        """True while a recording is replayed. Replayed sweeps are neither archived nor is their calibration stored."""
+        return self.replay is not None
 
     def on_loading(self) -> None:
         """This method is called when the module is loaded.
@@ -34,22 +85,76 @@ class AutoTMController(ModuleController):
         logger.debug("Setting up serial connection")
         self.find_devices()
 
-        # Connect signals
-        self.module.model.serial_data_received.connect(
-            self.process_frequency_sweep_data
-        )
-        self.module.model.serial_data_received.connect(self.process_measurement_data)
-        self.module.model.serial_data_received.connect(self.process_calibration_data)
-        self.module.model.serial_data_received.connect(
-            self.process_voltage_sweep_result
-        )
-        self.module.model.serial_data_received.connect(self.print_info)
-        self.module.model.serial_data_received.connect(self.read_position_data)
-        self.module.model.serial_data_received.connect(self.process_reflection_data)
-        self.module.model.serial_data_received.connect(
-            self.process_position_sweep_result
-        )
-        self.module.model.serial_data_received.connect(self.process_signalpath_data)
+        # Every line from the device is routed to one parser by its first character
+        self.register_line_handler("f", self.process_frequency_sweep_data)
+        self.register_line_handler("F", self.process_frequency_sweep_frame)
+        self.register_line_handler("b", self.process_frame_mode_data)
+        self.register_line_handler("r", self.process_sweep_end)
+        self.register_line_handler("v", self.process_voltage_sweep_result)
+        self.register_line_handler("i", self.print_info)
+        self.register_line_handler("e", self.print_info)
+        self.register_line_handler("p", self.read_position_data)
+        self.register_line_handler("m", self.process_reflection_data)
+        self.register_line_handler("z", self.process_position_sweep_result)
+        self.register_line_handler("c", self.process_signalpath_data)
+
+        # Every finished frequency sweep is appended to the sweep archive
+        try:
+            self.module.model.sweep_archive = SweepArchive()
+        except (OSError, ValueError) as e:
+            logger.error("Could not open sweep archive: %s", e)
+
+        # Calculated calibrations are reused when a frequency range is measured again
+        try:
+            self.module.model.calibration_store = CalibrationStore()
+        except OSError as e:
+            logger.error("Could not open calibration store: %s", e)
+
+    def register_line_handler(self, prefix: str, handler, parser=None) -> None:
+        """Register the handler for the serial lines starting with the given character.
+
+        A handler that is registered for a prefix that already has one replaces it.
+
+        Args:
+            prefix (str): The first character of the lines.
+            handler (callable): Called with the SerialMessage of the line.
+            parser (callable, optional): Called in the serial thread with the line without its first character, returns the values of the message.
+        """
+        if len(prefix) != 1:
+            raise ValueError("The prefix of a serial line must be a single character")
+
+        if prefix in self.line_handlers:
+            logger.debug("Replacing the handler for serial lines starting with %s", prefix)
+        self.line_handlers[prefix] = handler
+        if parser is not None:
+            self.line_parsers[prefix] = parser
+
+    def dispatch_message(self, message: SerialMessage) -> None:
+        """This method is called when a line is received from the serial connection.
+
+        It passes the message to the handler registered for its first character.
+
+        Args:
+            message (SerialMessage): The message received from the serial connection.
+        """
+        prefix = message.prefix
+        self.line_counts[prefix] += 1
+
+        handler = self.line_handlers.get(prefix)
+        if handler is None:
+            logger.debug("No handler for serial line %s", message.text)
+            return
+
+        if message.error is not None:
+            logger.error(
+                "Could not parse serial line %s: %s", message.text, message.error
+            )
+            return
+
+        try:
+            handler(message)
+        except (ValueError, IndexError):
+            logger.exception("Could not process serial line %s", message.text)
 
     @pyqtSlot(str, object)
     def process_signals(self, key: str, value: object) -> None:
@@ -111,7 +216,13 @@ class AutoTMController(ModuleController):
         """Scan for available serial devices and add them to the model as available devices."""
         logger.debug("Scanning for available serial devices")
         ports = comports()
-        self.module.model.available_devices = [port.device for port in ports]
+        devices = [port.device for port in ports]
+        devices += [
+            device
+            for device in os.environ.get(self.DEVICES_VARIABLE, "").split(os.pathsep)
+            if device
+        ]
+        self.module.model.available_devices = devices
         logger.debug("Found %s devices", len(self.module.model.available_devices))
         for device in self.module.model.available_devices:
             logger.debug("Found device: %s", device)
@@ -133,6 +244,8 @@ class AutoTMController(ModuleController):
                 serial = self.module.model.serial
                 serial.close()
                 self.module.model.serial = serial
+                self.close_command_engine()
+                self.stop_recording()
             else:
                 self.open_connection(device)
         # This is just for the first time the user connects to the device
@@ -142,25 +255,100 @@ class AutoTMController(ModuleController):
     def open_connection(self, device: str) -> None:
         """Open a connection to the specified device.
 
+        The port is opened in the thread of the serial reader, on_connection_changed is called with the result.
+
         Args:
             device (str): The device port to connect to.
         """
+        # The replayed messages would be mixed with the ones of the device
+        if self.replay is not None:
+            self.replay.stop()
+
         try:
-            serial = QtSerialPort.QSerialPort(
-                device, baudRate=self.BAUDRATE, readyRead=self.on_ready_read
+            serial = SerialReader(
+                device,
+                self.BAUDRATE,
+                self.line_parsers,
+                high_water_mark=self.HIGH_WATER_MARK,
+                late_threshold=self.LATE_LINE_THRESHOLD,
             )
-            serial.open(QtSerialPort.QSerialPort.OpenModeFlag.ReadWrite)
-            self.module.model.serial = serial
+            serial.messages_available.connect(self.on_ready_read)
+            serial.connection_changed.connect(self.on_connection_changed)
+            self.pending_serial = serial
+            serial.start()
 
-            logger.debug("Connected to device %s", device)
+        except Exception as e:
+            logger.error("Could not connect to device %s: %s", device, e)
 
-            # On opening of the command we set the switch position to atm
-            self.switch_to_atm()
+    @pyqtSlot(bool, str)
+    def on_connection_changed(self, is_open: bool, error: str) -> None:
+        """This method is called when the serial reader opened its port, couldn't open it or lost the connection.
 
-            self.set_voltages("0", "0")
+        Args:
+            is_open (bool): True if the connection is open.
+            error (str): The error of the port if the connection isn't open.
+        """
+        serial = self.sender()
+        if serial is self.pending_serial:
+            # From now on the reader is referenced by the model or it is closed
+            self.pending_serial = None
 
-        except Exception as e:
-            logger.error("Could not connect to device %s: %s", device, e)
+        if not is_open:
+            error = f"Could not connect to device {serial.portName()}: {error}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            serial.close()
+            if self.module.model.serial is serial:
+                self.module.model.serial = serial
+                self.close_command_engine()
+                self.stop_recording()
+            return
+
+        self.command_engine = CommandEngine(serial)
+        self.command_engine.command_written.connect(self.on_command_written)
+        directory = os.environ.get(self.RECORDING_VARIABLE)
+        if directory:
+            filename = time.strftime("autotm_%Y%m%d_%H%M%S.rec")
+            self.start_recording(os.path.join(directory, filename))
+        self.module.model.binary_frames = False
+        self.module.model.serial = serial
+        logger.debug("Connected to device %s", serial.portName())
+
+        # On opening of the command we set the switch position to atm
+        self.switch_to_atm()
+
+        self.set_voltages("0", "0")
+
+        if self.BINARY_FRAMES:
+            self.negotiate_binary_frames()
+
+    def negotiate_binary_frames(self) -> None:
+        """Ask the ATM system to send the points of frequency sweeps as binary frames.
+
+        The command is b<version>. An ATM system that supports the version answers with the line b<version>, otherwise with b0.
+        Until the answer is received the points are expected as text lines.
+        """
+        logger.debug("Requesting binary frames version %s", FRAME_VERSION)
+        self.send_command(f"b{FRAME_VERSION}")
+
+    def process_frame_mode_data(self, message: SerialMessage) -> None:
+        """This method is called when the ATM system answers the request for binary frames.
+
+        Args:
+            message (SerialMessage): The data received from the serial connection.
+        """
+        version = int(message.payload)
+        self.module.model.binary_frames = version == FRAME_VERSION
+        if self.module.model.binary_frames:
+            self.module.view.add_info_text("Frequency sweeps are sent as binary frames")
+        else:
+            logger.debug("Binary frames are not supported, using text lines")
+
+    def close_command_engine(self) -> None:
+        """Fail the commands that weren't confirmed before the serial connection was closed."""
+        if self.command_engine is not None:
+            self.command_engine.cancel_all("Serial connection closed")
+            self.command_engine = None
 
     def start_frequency_sweep(self, start_frequency: str, stop_frequency: str) -> None:
         """This starts a frequency sweep on the device in the specified range.
@@ -217,108 +405,236 @@ class AutoTMController(ModuleController):
         # Print the command 'f<start>f<stop>f<step>' to the serial connection
         command = f"f{start_frequency}f{stop_frequency}f{frequency_step}"
         self.module.model.frequency_sweep_start = time.time()
-        confirmation = self.send_command(command)
-        if confirmation:
-            # We create the frequency sweep spinner dialog
-            self.module.model.clear_data_points()
-            self.module.view.create_frequency_sweep_spinner_dialog()
+        key = CalibrationStore.make_key(
+            start_frequency, stop_frequency, N_POINTS, self.module.model.signal_path
+        )
+        self.send_command(command).add_done_callback(
+            lambda future: self.on_frequency_sweep_started(future, key, N_POINTS)
+        )
 
-    @pyqtSlot(str)
-    def process_frequency_sweep_data(self, text: str) -> None:
+    def on_frequency_sweep_started(
+        self, future: CommandFuture, key: tuple, n_points: int
+    ) -> None:
+        """This method is called when the command of a frequency sweep was confirmed or failed.
+
+        The confirmation is handled before the first data point of the sweep.
+
+        Args:
+            future (CommandFuture): The command of the frequency sweep.
+            key (tuple): The settings of the frequency sweep.
+            n_points (int): The expected number of data points.
+        """
+        if not future.confirmed():
+            return
+
+        self.prepare_frequency_sweep(key, n_points)
+
+    def prepare_frequency_sweep(self, key: tuple, n_points: int) -> None:
+        """Prepare the model and the view for the data points of a frequency sweep.
+
+        Args:
+            key (tuple): The settings of the frequency sweep.
+            n_points (int): The expected number of data points.
+        """
+        self.module.model.frequency_sweep_key = key
+        if self.module.model.active_calibration is None:
+            self.load_stored_calibration(key)
+
+        # We create the frequency sweep spinner dialog
+        self.module.model.clear_data_points(n_points)
+        self.module.view.create_frequency_sweep_spinner_dialog()
+
+    def process_frequency_sweep_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection during a frequency sweep.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if (
-            text.startswith("f")
-            and self.module.view.frequency_sweep_spinner.isVisible()
-        ):
-            text = text[1:].split("r")
-            frequency = float(text[0])
-            return_loss, phase = map(float, text[1].split("p"))
+        if self.module.view.frequency_sweep_spinner.isVisible():
+            frequency, return_loss, phase = message.values
             self.module.model.add_data_point(frequency, return_loss, phase)
 
-    @pyqtSlot(str)
-    def process_measurement_data(self, text: str) -> None:
+    def process_frequency_sweep_frame(self, message: SerialMessage) -> None:
+        """This method is called when a binary frame of a frequency sweep is received.
+
+        Args:
+            message (SerialMessage): The sequence number and the samples of the frame.
+        """
+        if self.module.view.frequency_sweep_spinner.isVisible():
+            _, samples = message.values
+            self.module.model.add_data_points(
+                samples["frequency"], samples["return_loss"], samples["phase"]
+            )
+
+    def process_sweep_end(self, message: SerialMessage) -> None:
+        """This method is called when the end of a frequency sweep is received from the serial connection.
+
+        The sweep is either a measurement or the sweep of a calibration standard.
+
+        Args:
+            message (SerialMessage): The data received from the serial connection.
+        """
+        # The data points that are still waiting for the next notification are announced first
+        self.module.model.flush_data_points()
+        if self.module.model.active_calibration in Calibration.STANDARDS:
+            self.process_calibration_data(message)
+        else:
+            self.process_measurement_data(message)
+
+    def process_measurement_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection during a measurement.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if self.module.model.active_calibration is None and text.startswith("r"):
+        if self.module.model.active_calibration is None:
             logger.debug("Measurement finished")
-            self.module.model.measurement = S11Data(
-                self.module.model.data_points.copy()
+            measurement = self.module.model.get_s11_data()
+            key = self.module.model.frequency_sweep_key
+            if self.replaying:
+                # Without key the calibration recalculated for the replayed sweep isn't stored
+                key = None
+                self.finish_frequency_sweep(message.received)
+            else:
+                self.archive_measurement(measurement)
+                self.finish_frequency_sweep()
+            # The measurement is set when the phase correction and calibration have been calculated
+            self.run_in_background(
+                self.process_measurement,
+                self.on_measurement_processed,
+                *self.get_processing_inputs(measurement, key),
+                error_text="Could not process measurement.",
             )
-            self.finish_frequency_sweep()
 
-    @pyqtSlot(str)
-    def process_calibration_data(self, text: str) -> None:
+    def archive_measurement(self, data: S11Data) -> None:
+        """This method is called when a frequency sweep is finished.
+
+        It appends the measurement to the sweep archive. Measurements that are loaded from a file or replayed from a recording are not archived.
+
+        Args:
+            data (S11Data): The measured S11 data.
+        """
+        archive = self.module.model.sweep_archive
+        if archive is None:
+            return
+
+        try:
+            archive.append(
+                data,
+                timestamp=self.module.model.frequency_sweep_start,
+                lut_entry=self.get_active_lut_entry(),
+            )
+        except OSError as e:
+            logger.error("Could not archive measurement: %s", e)
+
+    def get_active_lut_entry(self) -> tuple:
+        """Returns the tuning and matching setting that is currently applied to the probe coil.
+
+        Returns:
+            tuple: The stepper positions for mechanical probe coils, otherwise the tuning and matching voltages.
+        """
+        LUT = self.module.model.LUT
+        if LUT is not None and LUT.TYPE == "Mechanical":
+            return (
+                self.module.model.tuning_stepper.position,
+                self.module.model.matching_stepper.position,
+            )
+
+        return self.module.model.tuning_voltage, self.module.model.matching_voltage
+
+    def process_calibration_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection during a calibration.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if text.startswith("r") and self.module.model.active_calibration in [
-            "short",
-            "open",
-            "load",
-        ]:
+        if self.module.model.active_calibration in Calibration.STANDARDS:
             calibration_type = self.module.model.active_calibration
+            averager = self.module.model.standard_averager
+            if averager is None:
+                averager = self.module.model.standard_averager = SweepAverager()
+
+            # The sweep is folded into the average, the single sweeps are not kept
+            try:
+                averager.add(self.module.model.get_s11_data())
+            except ValueError as e:
+                error = f"Could not average {calibration_type} calibration. {e}"
+                logger.error(error)
+                self.module.view.add_error_text(error)
+                self.module.model.active_calibration = None
+                self.module.model.standard_averager = None
+                self.module.view.frequency_sweep_spinner.hide()
+                return
+
+            self.module.view.frequency_sweep_spinner.hide()
+            if not averager.finished:
+                logger.debug(
+                    "%s calibration sweep %s of %s finished",
+                    calibration_type.capitalize(),
+                    averager.count,
+                    averager.n_sweeps,
+                )
+                self.start_frequency_sweep(*self.module.model.calibration_sweep_range)
+                return
+
             logger.debug(f"{calibration_type.capitalize()} calibration finished")
+            # The variance is set first, the standard is plotted as soon as it is set
+            self.module.model.standard_variances[calibration_type] = averager.variance
             setattr(
                 self.module.model,
                 f"{calibration_type}_calibration",
-                S11Data(self.module.model.data_points.copy()),
+                averager.mean,
+            )
+            self.module.model.standard_keys[calibration_type] = (
+                self.module.model.frequency_sweep_key
             )
             self.module.model.active_calibration = None
-            self.module.view.frequency_sweep_spinner.hide()
+            self.module.model.standard_averager = None
 
-    @pyqtSlot(str)
-    def process_voltage_sweep_result(self, text: str) -> None:
+    def process_voltage_sweep_result(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection during a voltage sweep.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
-        """
-        if text.startswith("v"):
-            text = text[1:].split("t")
-            tuning_voltage, matching_voltage = map(float, text)
-            LUT = self.module.model.el_lut
-            if LUT is not None:
-                if LUT.is_incomplete():
-                    logger.debug(
-                        "Received voltage sweep result: Tuning %s Matching %s",
-                        tuning_voltage,
-                        matching_voltage,
-                    )
-                    LUT.add_voltages(tuning_voltage, matching_voltage)
-                    self.continue_or_finish_voltage_sweep(LUT)
-
-            self.module.model.tuning_voltage = tuning_voltage
-            self.module.model.matching_voltage = matching_voltage
-            logger.debug(
-                "Updated voltages: Tuning %s Matching %s",
-                self.module.model.tuning_voltage,
-                self.module.model.matching_voltage,
-            )
+            message (SerialMessage): The data received from the serial connection.
+        """
+        tuning_voltage, matching_voltage = message.values
+        LUT = self.module.model.el_lut
+        if LUT is not None:
+            if LUT.is_incomplete():
+                logger.debug(
+                    "Received voltage sweep result: Tuning %s Matching %s",
+                    tuning_voltage,
+                    matching_voltage,
+                )
+                LUT.add_voltages(tuning_voltage, matching_voltage)
+                self.continue_or_finish_voltage_sweep(LUT)
+
+        self.module.model.tuning_voltage = tuning_voltage
+        self.module.model.matching_voltage = matching_voltage
+        logger.debug(
+            "Updated voltages: Tuning %s Matching %s",
+            self.module.model.tuning_voltage,
+            self.module.model.matching_voltage,
+        )
 
-    def finish_frequency_sweep(self) -> None:
+    def finish_frequency_sweep(self, stop: float = None) -> None:
         """This method is called when a frequency sweep is finished.
 
         It hides the frequency sweep spinner dialog and adds the data to the model.
+
+        Args:
+            stop (float, optional): The time the sweep finished at, on the clock of the sweep start. Defaults to now.
         """
         self.module.view.frequency_sweep_spinner.hide()
-        self.module.model.frequency_sweep_stop = time.time()
+        self.module.model.frequency_sweep_stop = time.time() if stop is None else stop
         duration = (
             self.module.model.frequency_sweep_stop
             - self.module.model.frequency_sweep_start
@@ -383,69 +699,145 @@ class AutoTMController(ModuleController):
         )
         self.module.nqrduck_signal.emit("LUT_finished", LUT)
 
-    @pyqtSlot(str)
-    def print_info(self, text: str) -> None:
+    def print_info(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection.
 
         It prints the data to the info text box.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if text.startswith("i"):
-            text = text[1:]
-            self.module.view.add_info_text(text)
-        elif text.startswith("e"):
-            text = text[1:]
-            self.module.view.add_error_text(text)
+        if message.prefix == "i":
+            self.module.view.add_info_text(message.payload)
+        elif message.prefix == "e":
+            self.module.view.add_error_text(message.payload)
 
-    @pyqtSlot(str)
-    def read_position_data(self, text: str) -> None:
+    def read_position_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if text.startswith("p"):
-            # Format is p<tuning_position>m<matching_position>
-            text = text[1:].split("m")
-            tuning_position, matching_position = map(int, text)
-            self.module.model.tuning_stepper.position = tuning_position
-            self.module.model.matching_stepper.position = matching_position
-            self.module.model.tuning_stepper.homed = True
-            self.module.model.matching_stepper.homed = True
-            logger.debug(
-                "Tuning position: %s, Matching position: %s",
-                tuning_position,
-                matching_position,
-            )
-            self.module.view.on_active_stepper_changed()
+        tuning_position, matching_position = message.values
+        self.module.model.tuning_stepper.position = tuning_position
+        self.module.model.matching_stepper.position = matching_position
+        self.module.model.tuning_stepper.homed = True
+        self.module.model.matching_stepper.homed = True
+        logger.debug(
+            "Tuning position: %s, Matching position: %s",
+            tuning_position,
+            matching_position,
+        )
+        self.module.view.on_active_stepper_changed()
 
+    @pyqtSlot()
     def on_ready_read(self) -> None:
-        """This method is called when data is received from the serial connection."""
-        serial = self.module.model.serial
+        """This method is called when the serial reader has received data from the serial connection.
 
-        while serial.canReadLine():
-            text = serial.readLine().data().decode().rstrip("\r\n")
-            logger.debug("Received data: %s", text)
+        The messages that were parsed in the serial thread are handled as one batch.
+        """
+        serial = self.sender()
+        messages = serial.take_messages()
+        if self.command_engine is not None and messages:
+            self.command_engine.on_activity()
 
-            self.module.model.serial_data_received.emit(text)
+        if self.recorder is not None:
+            for message in messages:
+                self.recorder.record_message(message)
+            # The recording is complete up to the last batch if the program crashes
+            self.recorder.flush()
 
-    @pyqtSlot(str)
-    def process_reflection_data(self, text: str) -> None:
+        self.handle_messages(messages)
+
+    def handle_messages(self, messages: list) -> None:
+        """Handle a batch of messages received from the serial connection or replayed from a recording.
+
+        Args:
+            messages (list): The messages in the order they were received.
+        """
+        for message in messages:
+            logger.debug("Received data: %s", message.text)
+            if message.confirmation:
+                if self.command_engine is not None:
+                    self.command_engine.on_confirmation(message.received)
+                continue
+
+            self.command_latency.on_message(message)
+
+            self.module.model.serial_data_received.emit(message.text)
+            self.dispatch_message(message)
+
+        # The handlers update the model, the waits whose condition is now met are finished
+        for condition, loop in list(self.waiters):
+            if condition():
+                loop.quit()
+
+    def wait_for(
+        self,
+        condition,
+        timeout: float,
+        description: str,
+        future: CommandFuture = None,
+    ) -> bool:
+        """Wait until the condition is met by the data received from the serial connection.
+
+        The wait runs a local event loop that sleeps until events arrive. The condition is checked after every batch of serial messages.
+        User input is not processed while waiting, so the slots of the buttons are not called re-entrantly.
+        A timeout is reported to the info box.
+
+        Args:
+            condition (callable): Returns True when the wait is finished.
+            timeout (float): The maximum time to wait in s.
+            description (str): What is waited for, used for the timeout message.
+            future (CommandFuture, optional): The command that has to be confirmed for the condition to be met. The wait ends when it fails.
+
+        Returns:
+            bool: True if the condition was met, False after a timeout or when the command failed.
+        """
+        if condition():
+            return True
+        if future is not None and future.failed():
+            return False
+
+        loop = QEventLoop()
+        waiter = (condition, loop)
+        self.waiters.append(waiter)
+
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(loop.quit)
+        timer.start(int(timeout * 1000))
+        if future is not None:
+            # The future is also finished by its confirmation, the result line can arrive in a later read
+            future.add_done_callback(lambda future: future.failed() and loop.quit())
+
+        try:
+            loop.exec(QEventLoop.ProcessEventsFlag.ExcludeUserInputEvents)
+        finally:
+            timer.stop()
+            self.waiters.remove(waiter)
+
+        if condition():
+            return True
+
+        # A failed command is already reported when it fails
+        if future is None or not future.failed():
+            error = f"{description} timed out after {timeout} s"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+        return False
+
+    def process_reflection_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if text.startswith("m"):
-            text = text[1:]
-            return_loss, phase = map(float, text.split("p"))
-            self.module.model.last_reflection = (return_loss, phase)
+        self.module.model.last_reflection = message.values
 
     ### Calibration Stuff ###
 
@@ -462,7 +854,7 @@ class AutoTMController(ModuleController):
         """
         logger.debug("Starting short calibration")
         self.module.model.init_short_calibration()
-        self.start_frequency_sweep(start_frequency, stop_frequency)
+        self.start_standard_sweeps(start_frequency, stop_frequency)
 
     def on_open_calibration(
         self, start_frequency: float, stop_frequency: float
@@ -477,7 +869,7 @@ class AutoTMController(ModuleController):
         """
         logger.debug("Starting open calibration")
         self.module.model.init_open_calibration()
-        self.start_frequency_sweep(start_frequency, stop_frequency)
+        self.start_standard_sweeps(start_frequency, stop_frequency)
 
     def on_load_calibration(
         self, start_frequency: float, stop_frequency: float
@@ -492,127 +884,494 @@ class AutoTMController(ModuleController):
         """
         logger.debug("Starting load calibration")
         self.module.model.init_load_calibration()
+        self.start_standard_sweeps(start_frequency, stop_frequency)
+
+    def start_standard_sweeps(self, start_frequency: str, stop_frequency: str) -> None:
+        """Start the frequency sweeps of a calibration standard.
+
+        As many sweeps as set in the calibration window are averaged for the standard.
+
+        Args:
+            start_frequency (str): The start frequency in MHz.
+            stop_frequency (str): The stop frequency in MHz.
+        """
+        self.module.model.standard_averager = SweepAverager(
+            self.module.model.calibration_averages
+        )
+        self.module.model.calibration_sweep_range = (start_frequency, stop_frequency)
         self.start_frequency_sweep(start_frequency, stop_frequency)
 
-    def calculate_calibration(self) -> None:
-        """This method is called when the calculate calibration button is pressed.
+    def calculate_calibration(
+        self, frequency: np.ndarray = None, key: tuple = None, standards: tuple = None
+    ) -> None:
+        """This method is called when a calibration is needed right away, e.g. before it is exported.
 
         It calculates the calibration from the short, open and calibration data points.
+        Standards that were measured on another frequency grid are resampled, so they can be reused for other frequency ranges.
+        The calibration is added to the calibration store, so it can be reused for frequency sweeps with the same settings.
+
+        Args:
+            frequency (np.ndarray, optional): The frequency grid to calculate the calibration for. Defaults to the grid of the short calibration.
+            key (tuple, optional): The key of the frequency sweep the calibration is calculated for. Defaults to the key of the standards if they were all measured with the same settings.
+            standards (tuple, optional): The S11 data of the short, open and load standards. Defaults to the standards measured in the calibration window.
+
+        The reflection coefficients of the standards are taken from the loaded standard definitions, without definitions the standards are ideal.
 
         @TODO: Improvements to the calibrations can be made the following ways:
 
-        1. The ideal values for open, short and load  should be measured with a VNA and then be loaded for the calibration.
-        The ideal values are probably not -1, 1 and 0 but will also show frequency dependent behaviour.
-        2 The AD8302 chip only returns the absolute value of the phase. One would probably need to calculate the phase with various algorithms found in the literature.
+        1. The AD8302 chip only returns the absolute value of the phase. One would probably need to calculate the phase with various algorithms found in the literature.
         Though Im not sure if these proposed algorithms would work for the AD8302 chip.
         """
         logger.debug("Calculating calibration")
-        # First we check if the short and open calibration data points are available
-        if self.module.model.short_calibration is None:
-            logger.error(
-                "Could not calculate calibration. No short calibration data points available."
+        if key is None and frequency is None and standards is None:
+            key = self.get_standards_key()
+
+        try:
+            calibration = self.create_calibration(
+                *self.get_calibration_inputs(frequency, standards)
             )
+        except ValueError as e:
+            error = f"Could not calculate calibration. {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
             return
-        if self.module.model.open_calibration is None:
-            logger.error(
-                "Could not calculate calibration. No open calibration data points available."
+
+        self.set_calibration(calibration, key)
+
+    def calculate_calibration_in_background(self) -> None:
+        """This method is called when the apply calibration button is pressed.
+
+        It calculates the calibration from the short, open and load calibration in the thread pool, so the GUI stays responsive.
+        """
+        logger.debug("Calculating calibration in the background")
+        key = self.get_standards_key()
+        try:
+            inputs = self.get_calibration_inputs()
+        except ValueError as e:
+            error = f"Could not calculate calibration. {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return
+
+        self.run_in_background(
+            self.create_calibration,
+            lambda calibration: self.set_calibration(calibration, key),
+            *inputs,
+            error_text="Could not calculate calibration.",
+        )
+
+    def get_calibration_inputs(
+        self, frequency: np.ndarray = None, standards: tuple = None
+    ) -> tuple:
+        """Collect everything create_calibration needs from the model. This is called in the GUI thread.
+
+        The standards and their definitions are copied, so the calculation in the thread pool doesn't share any caches with the GUI thread.
+
+        Args:
+            frequency (np.ndarray, optional): The frequency grid to calculate the calibration for. Defaults to the grid of the short calibration.
+            standards (tuple, optional): The S11 data of the short, open and load standards. Defaults to the standards measured in the calibration window.
+
+        Returns:
+            tuple: The frequency grid, the standards, the standard definitions and the variances of the standards.
+
+        Raises:
+            ValueError: If a standard is missing.
+        """
+        if standards is None:
+            standards = (
+                self.module.model.short_calibration,
+                self.module.model.open_calibration,
+                self.module.model.load_calibration,
+            )
+            # First we check if the short, open and load calibration data points are available
+            for name, standard in zip(Calibration.STANDARDS, standards):
+                if standard is None:
+                    raise ValueError(f"No {name} calibration data points available.")
+
+        # The variance is only known for the standards measured in the calibration window
+        variances = None
+        if standards[0] is self.module.model.short_calibration:
+            variances = tuple(
+                self.module.model.standard_variances.get(standard)
+                for standard in Calibration.STANDARDS
             )
+
+        if frequency is None:
+            frequency = standards[0].frequency
+
+        # The definitions cache their last evaluated frequency grid
+        definitions = self.module.model.standard_definitions
+        if definitions is not None:
+            definitions = tuple(copy.copy(definition) for definition in definitions)
+
+        return (
+            frequency,
+            tuple(standard.copy() for standard in standards),
+            definitions,
+            variances,
+        )
+
+    @staticmethod
+    def create_calibration(
+        frequency: np.ndarray,
+        standards: tuple,
+        definitions: tuple = None,
+        variances: tuple = None,
+    ) -> Calibration:
+        """Calculate a calibration. It doesn't access the model or the view, so it can be run in the thread pool.
+
+        Args:
+            frequency (np.ndarray): The frequency grid to calculate the calibration for.
+            standards (tuple): The S11 data of the short, open and load standards.
+            definitions (tuple, optional): The CalibrationStandard definitions of the standards. Defaults to ideal standards.
+            variances (tuple, optional): The variances of the standards, see Calibration.from_standards.
+
+        Returns:
+            Calibration: The calculated calibration.
+
+        Raises:
+            ValueError: If the calibration can't be calculated.
+        """
+        return Calibration.from_standards(
+            frequency, *standards, definitions=definitions, variances=variances
+        )
+
+    def get_standards_key(self) -> tuple:
+        """Return the key of the frequency sweeps of the standards measured in the calibration window.
+
+        Returns:
+            tuple: The key or None if the standards were not all measured with the same settings.
+        """
+        standard_keys = {
+            self.module.model.standard_keys.get(standard)
+            for standard in Calibration.STANDARDS
+        }
+        return standard_keys.pop() if len(standard_keys) == 1 else None
+
+    def set_calibration(self, calibration: Calibration, key: tuple = None) -> None:
+        """Set the calibration of the model and add it to the calibration store.
+
+        Args:
+            calibration (Calibration): The calibration.
+            key (tuple, optional): The key of the frequency sweep the calibration has been calculated for. Without key it is not stored.
+        """
+        self.module.model.calibration = calibration
+
+        store = self.module.model.calibration_store
+        if store is not None and key is not None:
+            try:
+                store.put(key, calibration)
+            except OSError as e:
+                logger.error("Could not store calibration: %s", e)
+
+    def run_in_background(
+        self, function, on_result, *args, error_text: str = "Calculation failed."
+    ) -> None:
+        """Run a function in the thread pool. The result is passed to on_result in the GUI thread.
+
+        Args:
+            function (callable): The function to run. It must not access the view.
+            on_result (callable): Called with the result of the function.
+            *args: The arguments of the function.
+            error_text (str): The text shown in front of the error message if the function fails.
+        """
+        worker = Worker(function, *args)
+        worker.signals.result.connect(on_result)
+        worker.signals.error.connect(
+            lambda error: self.module.view.add_error_text(f"{error_text} {error}")
+        )
+        # A reference is kept until the worker has finished, otherwise its signals could be garbage collected
+        self.workers.add(worker)
+        worker.signals.finished.connect(lambda: self.workers.discard(worker))
+        QThreadPool.globalInstance().start(worker)
+
+    def load_standard_definitions(self, filename: str) -> None:
+        """This method is called when the standards button is pressed.
+
+        It loads the definitions of the short, open and load standards from a JSON file.
+        A calculated calibration is recalculated with the new definitions.
+
+        Args:
+            filename (str): The filename of the JSON file.
+        """
+        logger.debug("Loading standard definitions from %s", filename)
+        try:
+            definitions = CalibrationStandard.load_definitions(filename)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            error = f"Could not load standard definitions. {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
             return
-        if self.module.model.load_calibration is None:
-            logger.error(
-                "Could not calculate calibration. No load calibration data points available."
+
+        self.module.model.standard_definitions = definitions
+        self.module.view.add_info_text(f"Loaded standard definitions from {filename}")
+
+        calibration = self.module.model.calibration
+        standards = self.get_calibration_standards()
+        if calibration is not None and standards is not None:
+            self.run_in_background(
+                self.create_calibration,
+                self.set_calibration,
+                *self.get_calibration_inputs(calibration.frequency, standards),
+                error_text="Could not calculate calibration.",
             )
+
+    def load_stored_calibration(self, key: tuple) -> None:
+        """Use the stored calibration for a frequency sweep if the current calibration doesn't cover its frequency range.
+
+        A stored calibration is only used if it has been calculated with the current standard definitions and,
+        if standards have been measured, from these standards. Otherwise it is outdated.
+
+        Args:
+            key (tuple): The key of the frequency sweep.
+        """
+        store = self.module.model.calibration_store
+        if store is None:
+            return
+
+        # The current calibration is matched to the grid of the sweep when the measurement is processed
+        calibration = self.module.model.calibration
+        start_frequency, stop_frequency = key[:2]
+        if (
+            calibration is not None
+            and len(calibration.frequency)
+            and calibration.frequency[0] <= start_frequency
+            and stop_frequency <= calibration.frequency[-1]
+        ):
             return
 
-        # Then we calculate the calibration
-        ideal_gamma_short = -1
-        ideal_gamma_open = 1
-        ideal_gamma_load = 0
+        stored = store.get(key)
+        if stored is None:
+            return
 
-        measured_gamma_short = self.module.model.short_calibration.gamma
-        measured_gamma_open = self.module.model.open_calibration.gamma
-        measured_gamma_load = self.module.model.load_calibration.gamma
+        if not stored.uses_definitions(self.module.model.standard_definitions):
+            logger.debug("Stored calibration for %s uses other standard definitions", key)
+            return
 
-        e_00s = []
-        e_11s = []
-        delta_es = []
-        for gamma_s, gamma_o, gamma_l in zip(
-            measured_gamma_short, measured_gamma_open, measured_gamma_load
+        standards = (
+            self.module.model.short_calibration,
+            self.module.model.open_calibration,
+            self.module.model.load_calibration,
+        )
+        if all(standard is not None for standard in standards) and (
+            Calibration.hash_standards(*standards) != stored.standards_hash
         ):
-            # This is the solution from
-            A = np.array(
-                [
-                    [1, ideal_gamma_short * gamma_s, -ideal_gamma_short],
-                    [1, ideal_gamma_open * gamma_o, -ideal_gamma_open],
-                    [1, ideal_gamma_load * gamma_l, -ideal_gamma_load],
-                ]
+            logger.debug("Stored calibration for %s uses other standards", key)
+            return
+
+        logger.debug("Using stored calibration for %s", key)
+        self.module.model.calibration = stored
+
+    def get_processing_inputs(self, measurement: S11Data, key: tuple = None) -> tuple:
+        """Collect everything process_measurement needs from the model. This is called in the GUI thread.
+
+        The measurement and the standards are copied, so the processing in the thread pool doesn't share the caches of the S11 data with the GUI thread.
+        Calibrations aren't changed after they have been created, the model only replaces them.
+        Every measurement gets the next sequence number, so a result that is older than the shown measurement can be dropped.
+
+        Args:
+            measurement (S11Data): The measured S11 data.
+            key (tuple, optional): The key of the frequency sweep of the measurement.
+
+        Returns:
+            tuple: The arguments of process_measurement.
+        """
+        calibration = self.module.model.calibration
+        inputs = None
+        if calibration is not None and not calibration.covers(measurement.frequency):
+            standards = self.get_calibration_standards()
+            if standards is not None:
+                inputs = self.get_calibration_inputs(measurement.frequency, standards)
+
+        self.measurement_sequence += 1
+        return measurement.copy(), key, calibration, inputs, self.measurement_sequence
+
+    @staticmethod
+    def get_matched_calibration(
+        calibration: Calibration, data: S11Data, inputs: tuple = None
+    ) -> tuple:
+        """Return the calibration for the frequency grid of the given data. It doesn't access the model or the view, so it can be run in the thread pool.
+
+        The calibration standards are resampled onto the grid of the data, so no new standard sweeps are needed as long as they cover its frequency range.
+        If only the error terms are available they are interpolated instead.
+
+        Args:
+            calibration (Calibration): The current calibration or None.
+            data (S11Data): The S11 data the calibration should be applied to.
+            inputs (tuple, optional): The result of get_calibration_inputs for the grid of the data, None if the standards aren't available.
+
+        Returns:
+            tuple: The calibration or None if there is none, and True if it has been recalculated for the grid of the data.
+
+        Raises:
+            ValueError: If the calibration can't be calculated for the grid of the data.
+        """
+        if calibration is None or calibration.covers(data.frequency):
+            return calibration, False
+
+        if inputs is None:
+            # Only the error terms are available, e.g. for an imported calibration without standards
+            logger.debug("Interpolating calibration onto the frequency grid of the data")
+            return calibration.resample(data.frequency), True
+
+        logger.debug("Recalculating calibration for the frequency grid of the data")
+        return AutoTMController.create_calibration(*inputs), True
+
+    @staticmethod
+    def process_measurement(
+        measurement: S11Data,
+        key: tuple = None,
+        source: Calibration = None,
+        inputs: tuple = None,
+        sequence: int = 0,
+    ) -> tuple:
+        """Process a finished measurement. This is run in the thread pool on the snapshot from get_processing_inputs.
+
+        The phase correction and the calibration are calculated, so plotting the measurement only uses cached results.
+
+        Args:
+            measurement (S11Data): The measured S11 data.
+            key (tuple, optional): The key of the frequency sweep of the measurement.
+            source (Calibration, optional): The calibration of the model when the processing started.
+            inputs (tuple, optional): The inputs to recalculate the calibration for the grid of the measurement.
+            sequence (int, optional): The sequence number of the measurement.
+
+        Returns:
+            tuple: The measurement, the key, the calibration the processing started from, the calibration on the grid of the measurement or None, True if the calibration has been recalculated, an error text or None, and the sequence number.
+        """
+        # Calculates the phase correction
+        measurement.gamma
+
+        try:
+            calibration, changed = AutoTMController.get_matched_calibration(
+                source, measurement, inputs
+            )
+        except ValueError as e:
+            return measurement, key, source, None, False, str(e), sequence
+
+        if calibration is not None:
+            calibration.apply(measurement)
+        return measurement, key, source, calibration, changed, None, sequence
+
+    def on_measurement_processed(self, result: tuple) -> None:
+        """This method is called when a measurement has been processed in the background.
+
+        The measurements are processed in parallel, so they can finish out of order. A result that is older than the shown measurement is dropped.
+
+        Args:
+            result (tuple): The result of process_measurement.
+        """
+        measurement, key, source, calibration, changed, error, sequence = result
+        if sequence <= self.shown_sequence:
+            logger.debug(
+                "Dropping measurement %s, measurement %s is already shown",
+                sequence,
+                self.shown_sequence,
             )
+            return
+        self.shown_sequence = sequence
 
-            B = np.array([gamma_s, gamma_o, gamma_l])
+        if error is not None:
+            error = f"Could not calculate calibration. {error}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
 
-            # Solve the system
-            e_00, e11, delta_e = np.linalg.lstsq(A, B, rcond=None)[0]
+        # The calibration is only replaced if it hasn't been changed in the meantime
+        if changed and self.module.model.calibration is source:
+            self.set_calibration(calibration, key)
 
-            e_00s.append(e_00)
-            e_11s.append(e11)
-            delta_es.append(delta_e)
+        self.module.model.measurement = measurement
 
-        self.module.model.calibration = (e_00s, e_11s, delta_es)
+    def get_calibration_standards(self) -> tuple:
+        """Return the standards the current calibration has been calculated from.
+
+        These are the standards measured in the calibration window, unless the calibration has been calculated from other standards.
+        In that case the standards stored with the calibration are used.
+
+        Returns:
+            tuple: The S11 data of the short, open and load standards or None if they are not available.
+        """
+        calibration = self.module.model.calibration
+        standards = (
+            self.module.model.short_calibration,
+            self.module.model.open_calibration,
+            self.module.model.load_calibration,
+        )
+        measured = all(standard is not None for standard in standards)
+
+        if calibration is None or calibration.standards_hash is None:
+            return standards if measured else None
+
+        if (
+            measured
+            and Calibration.hash_standards(*standards) == calibration.standards_hash
+        ):
+            return standards
+
+        return calibration.standards
 
     def export_calibration(self, filename: str) -> None:
         """This method is called when the export calibration button is pressed.
 
-        It exports the data of the short, open and load calibration to a file.
+        It exports the calibration to a file. The file contains the error terms, so the calibration doesn't need to be calculated again when it is imported.
+        The data of the short, open and load calibration is included if it is available.
 
         Args:
             filename (str): The filename of the file to export to.
         """
         logger.debug("Exporting calibration")
-        # First we check if the short and open calibration data points are available
-        if self.module.model.short_calibration is None:
-            logger.error(
-                "Could not export calibration. No short calibration data points available."
-            )
-            return
+        if self.module.model.calibration is None:
+            self.calculate_calibration()
 
-        if self.module.model.open_calibration is None:
-            logger.error(
-                "Could not export calibration. No open calibration data points available."
-            )
-            return
-
-        if self.module.model.load_calibration is None:
-            logger.error(
-                "Could not export calibration. No load calibration data points available."
-            )
+        calibration = self.module.model.calibration
+        if calibration is None:
+            error = "Could not export calibration. No calibration available."
+            logger.error(error)
+            self.module.view.add_error_text(error)
             return
 
-        # Then we export the different calibrations as a json file
-        data = {
-            "short": self.module.model.short_calibration.to_json(),
-            "open": self.module.model.open_calibration.to_json(),
-            "load": self.module.model.load_calibration.to_json(),
-        }
-
-        with open(filename, "w") as f:
-            json.dump(data, f)
+        try:
+            calibration.save(filename, include_standards=True)
+        except OSError as e:
+            error = f"Could not export calibration. {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
 
     def import_calibration(self, filename: str) -> None:
         """This method is called when the import calibration button is pressed.
 
-        It imports the data of the short, open and load calibration from a file.
+        It imports a calibration from a file. The error terms are used as they are, the standards are only read if they are needed.
+        Older calibration files only contain the data of the short, open and load calibration, which is imported instead.
 
         Args:
             filename (str): The filename of the file to import from.
         """
         logger.debug("Importing calibration")
 
-        # We import the different calibrations from a json file
-        with open(filename) as f:
-            data = json.load(f)
-            self.module.model.short_calibration = S11Data.from_json(data["short"])
-            self.module.model.open_calibration = S11Data.from_json(data["open"])
-            self.module.model.load_calibration = S11Data.from_json(data["load"])
+        # The settings of the sweeps of imported standards are unknown
+        self.module.model.standard_keys = {}
+
+        if not zipfile.is_zipfile(filename):
+            # We import the different calibrations from a json file
+            self.module.model.standard_variances = {}
+            with open(filename) as f:
+                data = json.load(f)
+                self.module.model.short_calibration = S11Data.from_json(data["short"])
+                self.module.model.open_calibration = S11Data.from_json(data["open"])
+                self.module.model.load_calibration = S11Data.from_json(data["load"])
+            return
+
+        try:
+            calibration = Calibration.load(filename)
+        except (OSError, ValueError, KeyError) as e:
+            error = f"Could not import calibration. {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return
+
+        # Recalculations use the standard definitions of the imported calibration
+        self.module.model.standard_definitions = calibration.definitions
+        self.module.model.calibration = calibration
 
     def save_measurement(self, filename: str) -> None:
         """Save measurement to file.
@@ -625,10 +1384,7 @@ class AutoTMController(ModuleController):
             logger.debug("No measurement to save.")
             return
 
-        measurement = self.module.model.measurement.to_json()
-
-        with open(filename, "w") as f:
-            json.dump(measurement, f)
+        self.module.model.measurement.save(filename)
 
     def load_measurement(self, filename: str) -> None:
         """Load measurement from file.
@@ -638,9 +1394,13 @@ class AutoTMController(ModuleController):
         """
         logger.debug("Loading measurement.")
 
-        with open(filename) as f:
-            measurement = json.load(f)
-            self.module.model.measurement = S11Data.from_json(measurement)
+        measurement = S11Data.load(filename)
+        self.run_in_background(
+            self.process_measurement,
+            self.on_measurement_processed,
+            *self.get_processing_inputs(measurement),
+            error_text="Could not process measurement.",
+        )
 
     ### Voltage Control ###
 
@@ -655,6 +1415,8 @@ class AutoTMController(ModuleController):
         """
         logger.debug("Setting voltages")
         MAX_VOLTAGE = 5  # V
+        # The voltages reported by the atm system are rounded to the resolution of the DAC
+        VOLTAGE_TOLERANCE = 0.01  # V
         timeout_duration = 15  # timeout in seconds
 
         try:
@@ -697,24 +1459,22 @@ class AutoTMController(ModuleController):
 
         command = f"v{tuning_voltage}v{matching_voltage}"
 
-        start_time = time.time()
-
-        confirmation = self.send_command(command)
-        while (
-            matching_voltage != self.module.model.matching_voltage
-            and tuning_voltage != self.module.model.tuning_voltage
-        ):
-            QApplication.processEvents()
-            # Check for timeout
-            if time.time() - start_time > timeout_duration:
-                logger.error("Voltage setting timed out")
-                break
+        def voltages_set() -> bool:
+            return all(
+                voltage is not None and abs(voltage - target) <= VOLTAGE_TOLERANCE
+                for voltage, target in (
+                    (self.module.model.tuning_voltage, tuning_voltage),
+                    (self.module.model.matching_voltage, matching_voltage),
+                )
+            )
 
+        future = self.send_command(command)
+        if self.wait_for(voltages_set, timeout_duration, "Setting voltages", future):
             logger.debug("Voltages set successfully")
-            return confirmation
-        else:
-            logger.error("Could not set voltages")
-            return confirmation
+            return True
+
+        logger.error("Could not set voltages")
+        return False
 
     ### Electrical Lookup Table ###
 
@@ -796,9 +1556,19 @@ class AutoTMController(ModuleController):
 
         # For timing of the voltage sweep
         self.module.model.voltage_sweep_start = time.time()
-        confirmation = self.send_command(command)
+        self.send_command(command).add_done_callback(
+            lambda future: self.on_voltage_sweep_started(future, LUT)
+        )
+
+    def on_voltage_sweep_started(self, future: CommandFuture, LUT) -> None:
+        """This method is called when the command of the first voltage sweep was confirmed or failed.
+
+        Args:
+            future (CommandFuture): The command of the voltage sweep.
+            LUT (ElectricalLookupTable): The lookup table that is being generated.
+        """
         # If the command was send successfully, we set the LUT
-        if confirmation:
+        if future.confirmed():
             self.module.model.el_lut = LUT
             self.module.view.create_el_LUT_spinner_dialog()
 
@@ -813,15 +1583,13 @@ class AutoTMController(ModuleController):
 
         TIMEOUT = 1  # s
         logger.debug("Switching to preamp")
-        self.send_command("cp")
-
-        start_time = time.time()
-        while self.module.model.signal_path != "preamp":
-            QApplication.processEvents()
-            # Check for timeout
-            if time.time() - start_time > TIMEOUT:
-                logger.error("Switching to preamp timed out")
-                break
+        future = self.send_command("cp")
+        self.wait_for(
+            lambda: self.module.model.signal_path == "preamp",
+            TIMEOUT,
+            "Switching to preamp",
+            future,
+        )
 
     def switch_to_atm(self) -> None:
         """This method is used to send the command 'ca' to the atm system. This switches the signal pathway of the atm system to 'RX' to 'ATM.
@@ -834,82 +1602,204 @@ class AutoTMController(ModuleController):
 
         TIMEOUT = 1  # s
         logger.debug("Switching to atm")
-        self.send_command("ca")
-
-        start_time = time.time()
-        while self.module.model.signal_path != "atm":
-            QApplication.processEvents()
-            # Check for timeout
-            if time.time() - start_time > TIMEOUT:
-                logger.error("Switching to atm timed out")
-                break
+        future = self.send_command("ca")
+        self.wait_for(
+            lambda: self.module.model.signal_path == "atm",
+            TIMEOUT,
+            "Switching to atm",
+            future,
+        )
 
-    def process_signalpath_data(self, text: str) -> None:
+    def process_signalpath_data(self, message: SerialMessage) -> None:
         """This method is called when data is received from the serial connection.
 
         It processes the data and adds it to the model.
 
         Args:
-            text (str): The data received from the serial connection.
+            message (SerialMessage): The data received from the serial connection.
         """
-        if text.startswith("c"):
-            text = text[1:]
-            if text == "p":
-                self.module.model.signal_path = "preamp"
-            elif text == "a":
-                self.module.model.signal_path = "atm"
+        text = message.payload
+        if text == "p":
+            self.module.model.signal_path = "preamp"
+        elif text == "a":
+            self.module.model.signal_path = "atm"
 
-    def send_command(self, command: str) -> bool:
+    def send_command(self, command: str) -> CommandFuture:
         """This method is used to send a command to the active serial connection.
 
+        The command is queued and the method returns right away.
+        The commands are written in order and the ATM system confirms them in order.
+
         Args:
             command (str): The command that should be send to the atm system.
 
         Returns:
-            bool: True if the command was send successfully, False otherwise.
+            CommandFuture: The future of the command. It is done when the command was confirmed or failed.
         """
         logger.debug("Sending command %s", command)
-        timeout = 10000  # ms
 
+        error = None
         if self.module.model.serial is None:
-            logger.error("Could not send command. No serial connection")
-            self.module.view.add_error_text(
-                "Could not send command. No serial connection"
-            )
-            return False
+            error = "Could not send command. No serial connection"
+        elif self.module.model.serial.isOpen() is False:
+            error = "Could not send command. Serial connection is not open"
 
-        if self.module.model.serial.isOpen() is False:
-            logger.error("Could not send command. Serial connection is not open")
-            self.module.view.add_error_text(
-                "Could not send command. Serial connection is not open"
-            )
-            return False
+        if error is not None:
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            future = CommandFuture(command, 0)
+            future.set_failed(error)
+            return future
+
+        future = self.command_engine.submit(command)
+        future.add_done_callback(self.on_command_finished)
+        return future
 
+    def on_command_finished(self, future: CommandFuture) -> None:
+        """This method is called when a command was confirmed or failed.
+
+        Args:
+            future (CommandFuture): The command.
+        """
+        if future.confirmed():
+            logger.debug("Command %s sent successfully", future.command)
+            self.command_latency.on_command_confirmed(future)
+        else:
+            error = f"Could not send command {future.command}. {future.error}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+
+    def export_command_latency(self, filename: str) -> None:
+        """Export the latency histograms of the commands to a CSV file.
+
+        Args:
+            filename (str): The file the histograms are written to.
+        """
         try:
-            self.module.model.serial.write(command.encode("utf-8"))
-            # Wait for the confirmation of the command ('c') to be read with a timeout of 1 second
+            self.command_latency.export_csv(filename)
+        except OSError as e:
+            error = f"Could not export the command latencies to {filename}: {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return
 
-            if not self.module.model.serial.waitForReadyRead(timeout):
-                logger.error("Could not send command. Timeout")
-                self.module.view.add_error_text("Could not send command. Timeout")
-                return False
+        self.module.view.add_info_text(f"Exported the command latencies to {filename}")
 
-            confirmation = self.module.model.serial.readLine().data().decode("utf-8")
-            logger.debug("Confirmation: %s", confirmation)
+    ### Recording and Replay ###
 
-            if confirmation == "c":
-                logger.debug("Command sent successfully")
-                return True
-            else:
-                logger.error("Could not send command. No confirmation received")
-                self.module.view.add_error_text(
-                    "Could not send command. No confirmation received"
-                )
-                return False
+    def start_recording(self, filename: str) -> None:
+        """Record the commands and the messages of the serial connection to a file until stop_recording is called.
 
-        except Exception as e:
-            logger.error("Could not send command. %s", e)
-            self.module.view.add_error_text(f"Could not send command. {e}")
+        Args:
+            filename (str): The file the recording is written to.
+        """
+        self.stop_recording()
+        try:
+            self.recorder = SessionRecorder(filename)
+        except OSError as e:
+            error = f"Could not record the serial connection to {filename}: {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return
+
+        logger.debug("Recording the serial connection to %s", filename)
+        self.module.view.add_info_text(f"Recording the serial connection to {filename}")
+
+    def stop_recording(self) -> None:
+        """Stop the recording of the serial connection."""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def on_command_written(self, future: CommandFuture) -> None:
+        """This method is called when the command engine has written a command to the serial connection.
+
+        Args:
+            future (CommandFuture): The command.
+        """
+        if self.recorder is not None:
+            self.recorder.record_command(future.command, future.sent_at)
+            self.recorder.flush()
+
+    def replay_session(self, filename: str, speed: float = 1.0) -> SessionReplay:
+        """Replay a recording through the message handlers, without a serial connection.
+
+        The received lines and frames are parsed and handled like during the recorded session.
+        Frequency sweeps are prepared when their command is replayed, so the model and the plot are updated like during a measurement.
+        The handlers change the state of the module, e.g. the stepper positions and the calibration,
+        so a recording can't be replayed while a serial connection is open.
+
+        Args:
+            filename (str): The file of the recording.
+            speed (float): The replay speed relative to the recording, e.g. 10 for ten times faster, 0 for as fast as possible.
+
+        Returns:
+            SessionReplay: The running replay, None if a serial connection is open or the recording couldn't be read.
+        """
+        serial = self.module.model.serial
+        if serial is not None and serial.isOpen():
+            error = f"Could not replay {filename}. Disconnect from the device first"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return None
+
+        try:
+            records = SessionRecorder.read(filename)
+            replay = SessionReplay(
+                records, self.handle_messages, self.line_parsers, speed
+            )
+        except (OSError, ValueError, struct.error) as e:
+            error = f"Could not replay {filename}: {e}"
+            logger.error(error)
+            self.module.view.add_error_text(error)
+            return None
+
+        if self.replay is not None:
+            self.replay.stop()
+        self.replay = replay
+        replay.command_replayed.connect(self.on_command_replayed)
+        replay.finished.connect(self.on_replay_finished)
+        logger.debug("Replaying %s records of %s", len(records), filename)
+        replay.start()
+        return replay
+
+    def on_command_replayed(self, command: str, timestamp: float) -> None:
+        """This method is called when a replay reaches a command that was written during the recorded session.
+
+        Args:
+            command (str): The command.
+            timestamp (float): The recorded monotonic time the command was written at.
+        """
+        if not command.startswith("f"):
+            return
+
+        # The command of a frequency sweep is 'f<start>f<stop>f<step>'
+        try:
+            start_frequency, stop_frequency, frequency_step = (
+                float(value) for value in command[1:].split("f")
+            )
+        except ValueError:
+            logger.warning("Could not replay frequency sweep command %s", command)
+            return
+
+        n_points = round((stop_frequency - start_frequency) / frequency_step)
+        key = CalibrationStore.make_key(
+            start_frequency, stop_frequency, n_points, self.module.model.signal_path
+        )
+        # A replayed sweep is timed with the recorded times, it isn't archived so no wall-clock time is needed
+        self.module.model.frequency_sweep_start = timestamp
+        self.prepare_frequency_sweep(key, n_points)
+
+    def on_replay_finished(self) -> None:
+        """This method is called when a replay has handled all records of its recording or was stopped."""
+        replay = self.sender()
+        if replay is not self.replay:
+            return
+
+        self.replay = None
+        message = f"Replayed {replay.position} of {len(replay.records)} records in {replay.duration:.3f} s"
+        logger.debug(message)
+        self.module.view.add_info_text(message)
 
     ### Stepper Motor Control ###
 
@@ -978,12 +1868,15 @@ class AutoTMController(ModuleController):
         current_position = stepper.position
         return target_position - current_position
 
-    def send_stepper_command(self, steps: int, stepper: Stepper) -> None:
+    def send_stepper_command(self, steps: int, stepper: Stepper) -> CommandFuture:
         """Send a command to the stepper motor based on the number of steps.
         
         Args:
             steps (int): The number of steps to move.
             stepper (Stepper): The stepper that is being moved.
+
+        Returns:
+            CommandFuture: The future of the command.
         """
         # Here we handle backlash of the tuner
         # Determine the direction of the current steps
@@ -1000,8 +1893,7 @@ class AutoTMController(ModuleController):
 
         motor_identifier = stepper.TYPE.lower()[0]
         command = f"m{motor_identifier}{steps},{backlash}"
-        confirmation = self.send_command(command)
-        return confirmation
+        return self.send_command(command)
 
     def on_relative_move(self, steps: str, stepper: Stepper = None) -> None:
         """This method is called when the relative move button is pressed.
@@ -1011,7 +1903,6 @@ class AutoTMController(ModuleController):
             stepper (Stepper): The stepper that is being moved. Default is None.
         """
         timeout_duration = 15  # timeout in seconds
-        start_time = time.time()
 
         if stepper is None:
             stepper = self.module.model.active_stepper
@@ -1023,18 +1914,16 @@ class AutoTMController(ModuleController):
             return
 
         if self.validate_position(future_position, stepper):
-            confirmation = self.send_stepper_command(
+            future = self.send_stepper_command(
                 int(steps), stepper
             )  # Convert the steps string to an integer
 
-            while stepper_position == stepper.position:
-                QApplication.processEvents()
-                # Check for timeout
-                if time.time() - start_time > timeout_duration:
-                    logger.error("Relative move timed out")
-                    break  # or handle timeout differently
-
-            return confirmation
+            return self.wait_for(
+                lambda: stepper.position != stepper_position,
+                timeout_duration,
+                "Relative move",
+                future,
+            )
 
     def on_absolute_move(self, steps: str, stepper: Stepper = None) -> None:
         """This method is called when the absolute move button is pressed.
@@ -1044,7 +1933,6 @@ class AutoTMController(ModuleController):
             stepper (Stepper): The stepper that is being moved. Default is None.
         """
         timeout_duration = 15  # timeout in seconds
-        start_time = time.time()
 
         if stepper is None:
             stepper = self.module.model.active_stepper
@@ -1060,16 +1948,14 @@ class AutoTMController(ModuleController):
             actual_steps = self.calculate_steps_for_absolute_move(
                 future_position, stepper
             )
-            confirmation = self.send_stepper_command(actual_steps, stepper)
-
-            while stepper_position == stepper.position:
-                QApplication.processEvents()
-                # Check for timeout
-                if time.time() - start_time > timeout_duration:
-                    logger.error("Absolute move timed out")
-                    break  # or handle timeout differently
+            future = self.send_stepper_command(actual_steps, stepper)
 
-            return confirmation
+            return self.wait_for(
+                lambda: stepper.position != stepper_position,
+                timeout_duration,
+                "Absolute move",
+                future,
+            )
 
     ### Position Saving and Loading ###
 
@@ -1233,45 +2119,44 @@ class AutoTMController(ModuleController):
         matching_last_direction = self.module.model.matching_stepper.last_direction
         command = f"p{next_frequency}t{TUNING_RANGE},{TUNER_STEP_SIZE},{tuning_backlash},{tuning_last_direction}m{MATCHING_RANGE},{MATCHER_STEP_SIZE},{matching_backlash},{matching_last_direction}"
 
-        _ = self.send_command(command)
+        self.send_command(command)
 
-    @pyqtSlot(str)
-    def process_position_sweep_result(self, text) -> None:
+    def process_position_sweep_result(self, message: SerialMessage) -> None:
         """Process the result of the position sweep.
         
         Args:
-            text (str): The text received from the serial connection.
+            message (SerialMessage): The message received from the serial connection.
         """
-        if text.startswith("z"):
-            text = text[1:]
-            # Format is z<tuning_position>,<tuning_last_direction>m<matching_position>,<matching_last_direction>
-            text = text.split("m")
-            tuning_position, tuning_last_direction = map(int, text[0].split(","))
-            matching_position, matching_last_direction = map(int, text[1].split(","))
+        (
+            tuning_position,
+            tuning_last_direction,
+            matching_position,
+            matching_last_direction,
+        ) = message.values
+
+        # Keep backlash compensation consistent
+        self.module.model.tuning_stepper.last_direction = tuning_last_direction
+        self.module.model.matching_stepper.last_direction = matching_last_direction
+
+        # Update the positions
+        self.module.model.tuning_stepper.position = tuning_position
+        self.module.model.matching_stepper.position = matching_position
+        self.module.view.on_active_stepper_changed()
 
-            # Keep backlash compensation consistent
-            self.module.model.tuning_stepper.last_direction = tuning_last_direction
-            self.module.model.matching_stepper.last_direction = matching_last_direction
-
-            # Update the positions
-            self.module.model.tuning_stepper.position = tuning_position
-            self.module.model.matching_stepper.position = matching_position
-            self.module.view.on_active_stepper_changed()
-
-            logger.debug(
-                "Tuning position: %s, Matching position: %s",
-                tuning_position,
-                matching_position,
-            )
+        logger.debug(
+            "Tuning position: %s, Matching position: %s",
+            tuning_position,
+            matching_position,
+        )
 
-            LUT = self.module.model.mech_lut
-            logger.debug(
-                "Received position sweep result: %s %s",
-                matching_position,
-                tuning_position,
-            )
-            LUT.add_positions(tuning_position, matching_position)
-            self.continue_or_finish_position_sweep(LUT)
+        LUT = self.module.model.mech_lut
+        logger.debug(
+            "Received position sweep result: %s %s",
+            matching_position,
+            tuning_position,
+        )
+        LUT.add_positions(tuning_position, matching_position)
+        self.continue_or_finish_position_sweep(LUT)
 
     def continue_or_finish_position_sweep(self, LUT) -> None:
         """Continue or finish the position sweep.
@@ -1326,48 +2211,32 @@ class AutoTMController(ModuleController):
         # We send the command to the atm system
         command = f"r{frequency}"
         try:
-            confirmation = self.send_command(command)
-            QApplication.processEvents()
-            if confirmation:
+            # Set the timeout duration (e.g., 5 seconds)
+            timeout_duration = 5
+            future = self.send_command(command)
+            if self.wait_for(
+                lambda: self.module.model.last_reflection is not None,
+                timeout_duration,
+                "Reading reflection",
+                future,
+            ):
                 reflection = self.module.model.last_reflection
 
-                # Set the timeout duration (e.g., 5 seconds)
-                timeout_duration = 5
-                # Record the start time
-                start_time = time.time()
-
-                # Wait for reflection data until the timeout is reached
-                while reflection is None:
-                    # Check if the timeout has been reached
-                    if time.time() - start_time > timeout_duration:
-                        logger.error(
-                            "Reading reflection timed out after %d seconds",
-                            timeout_duration,
-                        )
-                        self.module.view.add_error_text(
-                            f"Could not read reflection. Timed out after {timeout_duration} seconds"
-                        )
-                        return None
-
-                    # Refresh the reflection data
-                    reflection = self.module.model.last_reflection
-                    QApplication.processEvents()
-
                 # Reset the reflection cache
                 self.module.model.last_reflection = None
 
-                magnitude = reflection[0]
-                CENTER_POINT_MAGNITUDE = 900  # mV
-                MAGNITUDE_SLOPE = 30  # dB/mV
-                magnitude = (magnitude - CENTER_POINT_MAGNITUDE) / MAGNITUDE_SLOPE
-
-                return -magnitude
+                # The frequency of the reflection command is in MHz
+                return_loss_mv, phase_mv = reflection
+                data = S11Data.from_arrays(
+                    np.array([frequency * 1e6]),
+                    np.array([return_loss_mv]),
+                    np.array([phase_mv]),
+                )
+                # The calibration isn't applied. It needs the sign of the phase, which can't be resolved from a single point
+                return -float(data.return_loss_db[0])
 
             else:
-                logger.error("Could not read reflection. No confirmation received")
-                self.module.view.add_error_text(
-                    "Could not read reflection. No confirmation received"
-                )
+                # The timeout or the failed command has already been reported
                 return None
 
         except Exception as e:
@@ -0,0 +1,255 @@
+"""Round-trip latency histograms of the commands to the ATM system.
+
+The latencies are recorded in log-linear histograms like HdrHistogram: the values are counted in buckets whose width grows
+with the value, so the relative error of every bucket is bounded and the memory doesn't depend on the range of the values.
+"""
+
+import csv
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """A histogram of latencies with a bounded relative error.
+
+    The latencies are counted in µs. Values below 2**SUB_BUCKET_BITS µs are counted exactly.
+    Above that every power of two is split into 2**(SUB_BUCKET_BITS - 1) buckets, so the relative error is below 2**(1 - SUB_BUCKET_BITS).
+    """
+
+    SUB_BUCKET_BITS = 7  # relative error < 1.6 %
+    UNIT = 1e-6  # s
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram."""
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def bucket_index(cls, value: int) -> int:
+        """The index of the bucket that counts the value.
+
+        Args:
+            value (int): The latency in µs.
+
+        Returns:
+            int: The index of the bucket.
+        """
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (cls.SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @classmethod
+    def bucket_range(cls, index: int) -> tuple:
+        """The range of the values that are counted in a bucket.
+
+        Args:
+            index (int): The index of the bucket.
+
+        Returns:
+            tuple: The lowest value and the highest value plus one in µs.
+        """
+        half = 1 << (cls.SUB_BUCKET_BITS - 1)
+        if index < 2 * half:
+            return index, index + 1
+        shift = index // half - 1
+        lowest = (index - shift * half) << shift
+        return lowest, lowest + (1 << shift)
+
+    def record(self, latency: float) -> None:
+        """Count a latency.
+
+        Args:
+            latency (float): The latency in s.
+        """
+        value = max(0, round(latency / self.UNIT))
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self) -> float:
+        """The mean latency in s, None if the histogram is empty."""
+        if not self.count:
+            return None
+        return self.total / self.count * self.UNIT
+
+    def percentile(self, percentile: float) -> float:
+        """The latency below which the given percentage of the latencies lie.
+
+        Args:
+            percentile (float): The percentage between 0 and 100.
+
+        Returns:
+            float: The highest value of the bucket that contains the percentile in s, None if the histogram is empty.
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, percentile / 100 * self.count)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                _, highest = self.bucket_range(index)
+                return min(highest - 1, self.max) * self.UNIT
+        return self.max * self.UNIT
+
+    def buckets(self) -> list:
+        """The buckets that counted latencies.
+
+        Returns:
+            list: Tuples of the lowest latency in s, the highest latency in s, the count and the cumulative percentage.
+        """
+        rows = []
+        seen = 0
+        for index in sorted(self.counts):
+            lowest, highest = self.bucket_range(index)
+            seen += self.counts[index]
+            rows.append(
+                (
+                    lowest * self.UNIT,
+                    highest * self.UNIT,
+                    self.counts[index],
+                    100 * seen / self.count,
+                )
+            )
+        return rows
+
+
+class CommandLatency:
+    """The latency histograms of the commands by their first character.
+
+    Two latencies are recorded for every command: from writing the command to its confirmation,
+    and from the confirmation to the line with the result of the command.
+    """
+
+    CONFIRMATION = "confirmation"
+    RESULT = "result"
+
+    # The first character of the result line by the first character of the command
+    RESULT_LINES = {
+        "v": "v",  # voltages
+        "s": "v",  # voltage sweep
+        "p": "z",  # position sweep
+        "r": "m",  # reflection
+        "f": "r",  # end of the frequency sweep
+        "m": "p",  # stepper move
+        "h": "p",  # homing
+    }
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self) -> None:
+        """Initialize the histograms."""
+        self.histograms = {}
+        # The confirmed commands that wait for their result line by the first character of the result line
+        self.awaiting_result = {}
+
+    def histogram(self, letter: str, stage: str) -> LatencyHistogram:
+        """The histogram of a command and a stage, it is created if it doesn't exist.
+
+        Args:
+            letter (str): The first character of the command.
+            stage (str): CONFIRMATION or RESULT.
+
+        Returns:
+            LatencyHistogram: The histogram.
+        """
+        key = (letter, stage)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        return self.histograms[key]
+
+    def on_command_confirmed(self, future) -> None:
+        """This method is called when a command is confirmed.
+
+        Args:
+            future (CommandFuture): The confirmed command.
+        """
+        if future.sent_at is None or future.confirmed_at is None:
+            return
+
+        self.histogram(future.letter, self.CONFIRMATION).record(
+            future.confirmed_at - future.sent_at
+        )
+        prefix = self.RESULT_LINES.get(future.letter)
+        if prefix is not None:
+            # The ATM system answers in order, a command that didn't get its result line won't get it anymore
+            self.awaiting_result[prefix] = (future.letter, future.confirmed_at)
+
+    def on_message(self, message) -> None:
+        """This method is called for every line received from the ATM system.
+
+        Args:
+            message (SerialMessage): The received line.
+        """
+        pending = self.awaiting_result.pop(message.prefix, None)
+        if pending is None:
+            return
+
+        letter, confirmed_at = pending
+        self.histogram(letter, self.RESULT).record(message.received - confirmed_at)
+
+    def reset(self) -> None:
+        """Clear all histograms."""
+        self.histograms.clear()
+        self.awaiting_result.clear()
+
+    def summary(self) -> list:
+        """The statistics of the histograms, sorted by command and stage.
+
+        Returns:
+            list: Tuples of the command, the stage, the count, the minimum, the mean, the PERCENTILES and the maximum latency in s.
+        """
+        rows = []
+        for (letter, stage), histogram in sorted(self.histograms.items()):
+            rows.append(
+                (
+                    letter,
+                    stage,
+                    histogram.count,
+                    histogram.min * histogram.UNIT,
+                    histogram.mean(),
+                    *(histogram.percentile(p) for p in self.PERCENTILES),
+                    histogram.max * histogram.UNIT,
+                )
+            )
+        return rows
+
+    def export_csv(self, filename: str) -> None:
+        """Export the buckets of all histograms to a CSV file.
+
+        Args:
+            filename (str): The file the histograms are written to.
+        """
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                [
+                    "command",
+                    "stage",
+                    "lowest_ms",
+                    "highest_ms",
+                    "count",
+                    "cumulative_percent",
+                ]
+            )
+            for (letter, stage), histogram in sorted(self.histograms.items()):
+                for lowest, highest, count, cumulative in histogram.buckets():
+                    writer.writerow(
+                        [
+                            letter,
+                            stage,
+                            f"{lowest * 1e3:.3f}",
+                            f"{highest * 1e3:.3f}",
+                            count,
+                            f"{cumulative:.3f}",
+                        ]
+                    )
+        logger.debug("Exported command latencies to %s", filename)
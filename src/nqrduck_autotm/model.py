@@ -6,16 +6,54 @@ The S11Data class is used to store the S11 data that is read in via the serial c
 """
 
 import cmath
+import hashlib
+import itertools
+import json
+import struct
 import numpy as np
 import logging
+from collections import Counter
 from scipy.signal import find_peaks
-from PyQt6.QtCore import pyqtSignal
-from PyQt6.QtSerialPort import QSerialPort
+from PyQt6.QtCore import pyqtSignal, QTimer
 from nqrduck.module.module_model import ModuleModel
 
 logger = logging.getLogger(__name__)
 
 
+def interpolation_weights(frequency: np.ndarray, target: np.ndarray) -> tuple:
+    """Calculates the indices and weights for a linear interpolation from one frequency grid onto another.
+
+    An interpolated value is values[lower] * (1 - weight) + values[lower + 1] * weight.
+
+    Args:
+        frequency (np.ndarray): The ascending frequency grid of the data.
+        target (np.ndarray): The frequency grid to interpolate onto. It must lie within the range of the data.
+
+    Returns:
+        tuple: The lower neighbour indices and the interpolation weights.
+    """
+    frequency = np.asarray(frequency, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    if len(frequency) < 2:
+        raise ValueError("At least two frequency points are needed for interpolation")
+
+    # Small deviations at the edges are allowed for float errors
+    tolerance = 1e-6 * (frequency[-1] - frequency[0])
+    if len(target) and (
+        target.min() < frequency[0] - tolerance
+        or target.max() > frequency[-1] + tolerance
+    ):
+        raise ValueError(
+            f"Frequencies must be between {frequency[0] / 1e6} and {frequency[-1] / 1e6} MHz"
+        )
+
+    lower = np.clip(
+        np.searchsorted(frequency, target, side="right") - 1, 0, len(frequency) - 2
+    )
+    weight = (target - frequency[lower]) / (frequency[lower + 1] - frequency[lower])
+    return lower, weight
+
+
 class S11Data:
     """This class is used to store the S11 data that is read in via the serial connection."""
     FILE_EXTENSION = "s11"
@@ -25,12 +63,155 @@ class S11Data:
     CENTER_POINT_PHASE = 0  # mV
     MAGNITUDE_SLOPE = 30  # dB/mV
     PHASE_SLOPE = 10  # deg/mV
+    # Parameters of the phase sign correction
+    PHASE_FILTER_WINDOW = 5  # points
+    PHASE_EXTREMUM_HEIGHT = 100  # deg
+    # Binary file format: the header is followed by the frequency, return loss and phase arrays as little-endian float64
+    BINARY_MAGIC = b"S11D"
+    BINARY_VERSION = 1
+    BINARY_HEADER = struct.Struct("<4sHHQ")  # magic, version, reserved, number of points
+    BINARY_DTYPE = np.dtype("<f8")
 
     def __init__(self, data_points: list) -> None:
-        """Initialize the S11 data."""
-        self.frequency = np.array([data_point[0] for data_point in data_points])
-        self.return_loss_mv = np.array([data_point[1] for data_point in data_points])
-        self.phase_mv = np.array([data_point[2] for data_point in data_points])
+        """Initialize the S11 data.
+
+        Args:
+            data_points (list): The data points as (frequency, return loss, phase) tuples.
+        """
+        data = np.array(data_points, dtype=np.float64).reshape(-1, 3)
+        self._set_data(data[:, 0], data[:, 1], data[:, 2])
+
+    @classmethod
+    def from_arrays(
+        cls,
+        frequency: np.ndarray,
+        return_loss_mv: np.ndarray,
+        phase_mv: np.ndarray,
+        phase_deg: np.ndarray = None,
+    ) -> "S11Data":
+        """Create an S11Data object from one array per column.
+
+        NumPy arrays are adopted without copying, so this also works for memory-mapped data.
+
+        Args:
+            frequency (np.ndarray): The frequency in Hz.
+            return_loss_mv (np.ndarray): The return loss in mV.
+            phase_mv (np.ndarray): The absolute value of the phase in mV.
+            phase_deg (np.ndarray, optional): The already corrected phase in degrees, e.g. from a PhaseSignResolver. Defaults to None.
+
+        Returns:
+            S11Data: The S11 data.
+        """
+        s11_data = cls.__new__(cls)
+        s11_data._set_data(frequency, return_loss_mv, phase_mv)
+        if phase_deg is not None:
+            s11_data._cache["phase_deg"] = cls._read_only(phase_deg)
+        return s11_data
+
+    def copy(self) -> "S11Data":
+        """Return a copy with its own cache of the derived quantities.
+
+        The raw data and the cached quantities are read-only, so they are shared with the copy instead of being copied.
+        A copy can be processed in the thread pool while the original is used in the GUI thread.
+
+        Returns:
+            S11Data: The copy.
+        """
+        data = S11Data.from_arrays(self.frequency, self.return_loss_mv, self.phase_mv)
+        data._cache.update(self._cache)
+        return data
+
+    def _set_data(
+        self, frequency: np.ndarray, return_loss_mv: np.ndarray, phase_mv: np.ndarray
+    ) -> None:
+        """Set the raw data and reset the cache of the derived quantities."""
+        if not len(frequency) == len(return_loss_mv) == len(phase_mv):
+            raise ValueError(
+                "frequency, return_loss_mv and phase_mv must be the same length"
+            )
+
+        # Derived quantities are calculated lazily and cached until the raw data changes
+        self._cache = {}
+        self.cache_hits = Counter()
+        self.cache_misses = Counter()
+
+        self.frequency = frequency
+        self.return_loss_mv = return_loss_mv
+        self.phase_mv = phase_mv
+
+    @property
+    def frequency(self) -> np.ndarray:
+        """The frequency points of the S11 data in Hz."""
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, value):
+        self._frequency = self._read_only(value)
+        self.invalidate_cache()
+
+    @property
+    def return_loss_mv(self) -> np.ndarray:
+        """The return loss in mV as read in via the serial connection."""
+        return self._return_loss_mv
+
+    @return_loss_mv.setter
+    def return_loss_mv(self, value):
+        self._return_loss_mv = self._read_only(value)
+        self.invalidate_cache()
+
+    @property
+    def phase_mv(self) -> np.ndarray:
+        """The absolute value of the phase in mV as read in via the serial connection."""
+        return self._phase_mv
+
+    @phase_mv.setter
+    def phase_mv(self, value):
+        self._phase_mv = self._read_only(value)
+        self.invalidate_cache()
+
+    @staticmethod
+    def _read_only(value) -> np.ndarray:
+        """Returns a read-only view of the given data.
+
+        The raw data can then only be changed by assigning new arrays, which invalidates the cache.
+        """
+        array = np.asarray(value).view()
+        array.flags.writeable = False
+        return array
+
+    def _cached(self, key: str, calculate) -> np.ndarray:
+        """Returns the cached derived quantity for the given key.
+
+        On a cache miss the quantity is calculated and stored until the raw data changes.
+
+        Args:
+            key (str): The name of the derived quantity.
+            calculate (callable): Calculates the quantity on a cache miss.
+
+        Returns:
+            np.ndarray: The derived quantity.
+        """
+        if key in self._cache:
+            self.cache_hits[key] += 1
+            return self._cache[key]
+
+        self.cache_misses[key] += 1
+        value = calculate()
+        value.flags.writeable = False
+        self._cache[key] = value
+        return value
+
+    def invalidate_cache(self) -> None:
+        """Discards all cached derived quantities. This is done automatically when the raw data changes."""
+        self._cache.clear()
+
+    @property
+    def cache_info(self) -> dict:
+        """The number of cache hits and misses for each derived quantity."""
+        return {
+            key: {"hits": self.cache_hits[key], "misses": self.cache_misses[key]}
+            for key in self.cache_hits.keys() | self.cache_misses.keys()
+        }
 
     @property
     def millivolts(self):
@@ -40,9 +221,11 @@ class S11Data:
     @property
     def return_loss_db(self):
         """Returns the return loss in dB calculated from the return loss in mV."""
-        return (
-            self.return_loss_mv - self.CENTER_POINT_MAGNITUDE
-        ) / self.MAGNITUDE_SLOPE
+        return self._cached(
+            "return_loss_db",
+            lambda: (self.return_loss_mv - self.CENTER_POINT_MAGNITUDE)
+            / self.MAGNITUDE_SLOPE,
+        )
 
     @property
     def phase_deg(self, phase_correction=True) -> np.array:
@@ -54,27 +237,46 @@ class S11Data:
         Returns:
             np.array: The absolute value of the phase in degrees.
         """
-        phase_deg = (self.phase_mv - self.CENTER_POINT_PHASE) / self.PHASE_SLOPE
-        if phase_correction:
-            phase_deg = self.phase_correction(self.frequency, phase_deg)
 
-        return phase_deg
+        def calculate_phase_deg():
+            phase_deg = (self.phase_mv - self.CENTER_POINT_PHASE) / self.PHASE_SLOPE
+            if phase_correction:
+                phase_deg = self.phase_correction(self.frequency, phase_deg)
+            return phase_deg
+
+        return self._cached("phase_deg", calculate_phase_deg)
 
     @property
     def phase_rad(self):
         """Returns the phase in radians."""
-        return self.phase_deg * cmath.pi / 180
+        return self._cached("phase_rad", lambda: self.phase_deg * cmath.pi / 180)
 
     @property
-    def gamma(self):
+    def gamma(self) -> np.ndarray:
         """Complex reflection coefficient."""
-        if len(self.return_loss_db) != len(self.phase_rad):
-            raise ValueError("return_loss_db and phase_rad must be the same length")
+        return self._cached(
+            "gamma", lambda: self.calculate_gamma(self.return_loss_db, self.phase_rad)
+        )
 
-        return [
-            cmath.rect(10 ** (-loss_db / 20), phase_rad)
-            for loss_db, phase_rad in zip(self.return_loss_db, self.phase_rad)
-        ]
+    @staticmethod
+    def calculate_gamma(return_loss_db: np.ndarray, phase_rad: np.ndarray) -> np.ndarray:
+        """Calculates the complex reflection coefficient from the return loss and the phase.
+
+        The calculation is vectorized and works on arrays of any shape. A stack of sweeps can be passed as 2D arrays of shape (n_sweeps, n_points).
+
+        Args:
+            return_loss_db (np.ndarray): The return loss in dB.
+            phase_rad (np.ndarray): The phase in radians.
+
+        Returns:
+            np.ndarray: The complex reflection coefficient as complex128 array.
+        """
+        return_loss_db = np.asarray(return_loss_db, dtype=np.float64)
+        phase_rad = np.asarray(phase_rad, dtype=np.float64)
+        if return_loss_db.shape != phase_rad.shape:
+            raise ValueError("return_loss_db and phase_rad must be the same shape")
+
+        return 10 ** (-return_loss_db / 20) * np.exp(1j * phase_rad)
 
     def phase_correction(
         self, frequency_data: np.array, phase_data: np.array
@@ -92,74 +294,153 @@ class S11Data:
         Returns:
             np.array: The corrected phase data.
         """
-        # First we apply a moving average filter to the phase data
-        WINDOW_SIZE = 5
-        phase_data_filtered = (
-            np.convolve(phase_data, np.ones(WINDOW_SIZE), "same") / WINDOW_SIZE
+        return self.phase_correction_batch(frequency_data, phase_data[np.newaxis, :])[0]
+
+    @classmethod
+    def phase_correction_batch(
+        cls, frequency_data: np.array, phase_data: np.array
+    ) -> np.array:
+        """This method fixes the phase sign of a stack of sweeps at once.
+
+        See phase_correction for the details of the correction. Only the peak search is done per sweep, everything else is vectorized over all sweeps.
+
+        Args:
+            frequency_data (np.array): The frequency data.
+            phase_data (np.array): The phase data of shape (n_sweeps, n_points).
+
+        Returns:
+            np.array: The corrected phase data of shape (n_sweeps, n_points).
+        """
+        phase_data = np.atleast_2d(np.asarray(phase_data, dtype=np.float64))
+
+        # The phase sign can't be determined for sweeps shorter than the filter window
+        if phase_data.shape[1] < cls.PHASE_FILTER_WINDOW:
+            return phase_data.copy()
+
+        phase_data_filtered = cls._filter_phase(phase_data)
+        boundaries = cls._find_phase_boundaries(phase_data_filtered)
+        return cls._apply_phase_sign(phase_data_filtered, boundaries)
+
+    @classmethod
+    def _filter_phase(cls, phase_data: np.array) -> np.array:
+        """Applies the moving average filter of the phase correction.
+
+        Args:
+            phase_data (np.array): The phase data of shape (n_sweeps, n_points).
+
+        Returns:
+            np.array: The filtered phase data.
+        """
+        WINDOW_SIZE = cls.PHASE_FILTER_WINDOW
+        # Every window is summed from left to right, like the PhaseSignResolver does, so both give the same plateaus
+        windows = np.lib.stride_tricks.sliding_window_view(
+            phase_data, WINDOW_SIZE, axis=1
+        )
+        phase_data_filtered = phase_data.copy()
+        phase_data_filtered[:, WINDOW_SIZE // 2 : WINDOW_SIZE // 2 + windows.shape[1]] = (
+            windows.sum(axis=-1) / WINDOW_SIZE
         )
 
         # Fix transient response
-        phase_data_filtered[: WINDOW_SIZE // 2] = phase_data[: WINDOW_SIZE // 2]
-        phase_data_filtered[-WINDOW_SIZE // 2 :] = phase_data[-WINDOW_SIZE // 2 :]
+        phase_data_filtered[:, : WINDOW_SIZE // 2] = phase_data[:, : WINDOW_SIZE // 2]
+        phase_data_filtered[:, -WINDOW_SIZE // 2 :] = phase_data[:, -WINDOW_SIZE // 2 :]
 
-        # Now we find the peaks and valleys of the data
-        HEIGHT = 100
-        distance = len(phase_data_filtered) / 10
+        return phase_data_filtered
 
-        peaks, _ = find_peaks(phase_data_filtered, distance=distance, height=HEIGHT)
+    @classmethod
+    def _find_phase_boundaries(cls, phase_data_filtered: np.array) -> np.array:
+        """Finds the peaks and valleys of the filtered phase data.
 
-        valleys, _ = find_peaks(
-            180 - phase_data_filtered, distance=distance, height=HEIGHT
-        )
+        Together with the first and the last point they are the boundaries of the sections with the same phase sign.
 
-        # Determine if the first point is a peak or a valley
-        if phase_data_filtered[0] > phase_data_filtered[1]:
-            peaks = np.insert(peaks, 0, 0)
-        else:
-            valleys = np.insert(valleys, 0, 0)
+        Args:
+            phase_data_filtered (np.array): The filtered phase data of shape (n_sweeps, n_points).
 
-        # Determine if the last point is a peak or a valley
-        if phase_data_filtered[-1] > phase_data_filtered[-2]:
-            peaks = np.append(peaks, len(phase_data_filtered) - 1)
-        else:
-            valleys = np.append(valleys, len(phase_data_filtered) - 1)
+        Returns:
+            np.array: Boolean mask of the boundaries.
+        """
+        HEIGHT = cls.PHASE_EXTREMUM_HEIGHT
+        distance = max(phase_data_filtered.shape[1] / 10, 1)
+
+        boundaries = np.zeros(phase_data_filtered.shape, dtype=bool)
+        boundaries[:, [0, -1]] = True
+        # find_peaks only works on one dimensional data
+        for sweep_boundaries, sweep_filtered in zip(boundaries, phase_data_filtered):
+            peaks, _ = find_peaks(sweep_filtered, distance=distance, height=HEIGHT)
+            valleys, _ = find_peaks(
+                180 - sweep_filtered, distance=distance, height=HEIGHT
+            )
+            sweep_boundaries[peaks] = True
+            sweep_boundaries[valleys] = True
 
-        frequency_peaks = frequency_data[peaks]
-        frequency_valleys = frequency_data[valleys]
+        return boundaries
 
-        # Combine the peaks and valleys
-        frequency_peaks_valleys = np.sort(
-            np.concatenate((frequency_peaks, frequency_valleys))
-        )
-        peaks_valleys = np.sort(np.concatenate((peaks, valleys)))
+    @staticmethod
+    def _apply_phase_sign(phase_data_filtered: np.array, boundaries: np.array) -> np.array:
+        """Applies the phase sign to the sections between the boundaries.
+
+        Args:
+            phase_data_filtered (np.array): The filtered phase data of shape (n_sweeps, n_points).
+            boundaries (np.array): Boolean mask of the section boundaries. The first and the last point of every sweep must be boundaries.
+
+        Returns:
+            np.array: The corrected phase data.
+        """
+        # The sections of all sweeps are handled at once on the flattened data
+        # Every sweep starts and ends with a boundary, so the section spanning from the end of one sweep to the start of the next one is never used
+        boundaries = boundaries.ravel()
+        boundary_phase = phase_data_filtered.ravel()[boundaries]
 
         # Now we can determine the slope of the phase
-        # For this we compare the phase of our peaks_valleys array to the next point
+        # For this we compare the phase of the boundaries to the next boundary
         # If the phase is increasing, the slope is positive, if it is decreasing, the slope is negative
-        phase_slope = np.zeros(len(peaks_valleys) - 1)
-        for i in range(len(peaks_valleys) - 1):
-            phase_slope[i] = (
-                phase_data_filtered[peaks_valleys[i + 1]]
-                - phase_data_filtered[peaks_valleys[i]]
-            )
+        phase_slope = np.diff(boundary_phase)
 
         # Now we can determine the sign of the phase
         # If the slope is negative, the phase is positive and vice versa
         phase_sign = np.sign(phase_slope) * -1
 
         # Now we can correct the phase for the different sections
-        phase_data_corrected = np.zeros(len(phase_data))
-        for i in range(len(peaks_valleys) - 1):
-            phase_data_corrected[peaks_valleys[i] : peaks_valleys[i + 1]] = (
-                phase_data_filtered[peaks_valleys[i] : peaks_valleys[i + 1]]
-                * phase_sign[i]
-            )
+        section = np.minimum(np.cumsum(boundaries) - 1, len(phase_sign) - 1)
+        phase_data_corrected = (
+            phase_data_filtered.ravel() * phase_sign[section]
+        ).reshape(phase_data_filtered.shape)
 
         # Murks: The last point is always wrong so just set it to the previous value
-        phase_data_corrected[-1] = phase_data_corrected[-2]
+        phase_data_corrected[:, -1] = phase_data_corrected[:, -2]
 
         return phase_data_corrected
 
+    def resample(self, frequencies: np.ndarray) -> "S11Data":
+        """Interpolate the S11 data onto another frequency grid.
+
+        The raw data, the magnitude and the corrected phase are interpolated linearly.
+        The complex reflection coefficient is interpolated in the complex plane.
+
+        Args:
+            frequencies (np.ndarray): The target frequency grid in Hz. It must lie within the measured frequency range.
+
+        Returns:
+            S11Data: The S11 data on the target frequency grid.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        if np.array_equal(frequencies, self.frequency):
+            return self
+
+        lower, weight = interpolation_weights(self.frequency, frequencies)
+
+        def interpolate(values: np.ndarray) -> np.ndarray:
+            return values[lower] * (1 - weight) + values[lower + 1] * weight
+
+        resampled = S11Data.from_arrays(
+            frequencies,
+            interpolate(self.return_loss_mv),
+            interpolate(self.phase_mv),
+            phase_deg=interpolate(self.phase_deg),
+        )
+        resampled._cache["gamma"] = self._read_only(interpolate(self.gamma))
+        return resampled
+
     def to_json(self):
         """Convert the S11 data to a JSON serializable format."""
         return {
@@ -171,11 +452,846 @@ class S11Data:
     @classmethod
     def from_json(cls, json):
         """Create an S11Data object from a JSON serializable format."""
-        f = json["frequency"]
-        rl = json["return_loss_mv"]
-        p = json["phase_mv"]
-        data = [(f[i], rl[i], p[i]) for i in range(len(f))]
-        return cls(data)
+        return cls.from_arrays(
+            np.asarray(json["frequency"], dtype=np.float64),
+            np.asarray(json["return_loss_mv"], dtype=np.float64),
+            np.asarray(json["phase_mv"], dtype=np.float64),
+        )
+
+    def save(self, filename: str) -> None:
+        """Save the S11 data to a file in the binary .s11 format.
+
+        Args:
+            filename (str): Path to file.
+        """
+        with open(filename, "wb") as f:
+            f.write(
+                self.BINARY_HEADER.pack(
+                    self.BINARY_MAGIC, self.BINARY_VERSION, 0, len(self.frequency)
+                )
+            )
+            for column in self.millivolts:
+                np.asarray(column, dtype=self.BINARY_DTYPE).tofile(f)
+
+    @classmethod
+    def load(cls, filename: str) -> "S11Data":
+        """Load S11 data from a file.
+
+        Binary .s11 files are memory-mapped, older JSON files are detected automatically.
+
+        Args:
+            filename (str): Path to file.
+
+        Returns:
+            S11Data: The S11 data.
+        """
+        with open(filename, "rb") as f:
+            header = f.read(cls.BINARY_HEADER.size)
+
+        if not header.startswith(cls.BINARY_MAGIC):
+            with open(filename) as f:
+                return cls.from_json(json.load(f))
+
+        if len(header) < cls.BINARY_HEADER.size:
+            raise ValueError(f"Incomplete header in S11 file {filename}")
+
+        _, version, _, n_points = cls.BINARY_HEADER.unpack(header)
+        if version > cls.BINARY_VERSION:
+            raise ValueError(
+                f"Unsupported S11 file version {version} in {filename}"
+            )
+
+        if n_points == 0:
+            return cls.from_arrays(*np.empty((3, 0), dtype=cls.BINARY_DTYPE))
+
+        data = np.memmap(
+            filename,
+            dtype=cls.BINARY_DTYPE,
+            mode="r",
+            offset=cls.BINARY_HEADER.size,
+            shape=(3, n_points),
+        )
+        return cls.from_arrays(data[0], data[1], data[2])
+
+
+class PhaseSignResolver:
+    """This class is used to resolve the phase sign incrementally while a frequency sweep is running.
+
+    The phase is filtered as the data points arrive and the peaks and valleys are tracked on the fly.
+    This way a signed phase estimate is available during the sweep, and finishing the sweep only has to handle its last points.
+    """
+
+    def __init__(self, n_points: int = None) -> None:
+        """Initialize the phase sign resolver.
+
+        Args:
+            n_points (int, optional): The expected number of points of the sweep. It sets the minimal distance between peaks. If it is None, the number of points received so far is used.
+        """
+        self.n_points = n_points
+        self.phase = []
+        self.filtered = []
+        # Candidates for peaks and valleys found so far as (index, height) tuples
+        self.peaks = []
+        self.valleys = []
+
+        # Number of filtered points that have been checked for peaks and valleys
+        self._checked = 0
+        self._rise_start = None
+        self._fall_start = None
+
+    def __len__(self) -> int:
+        """The number of data points received so far."""
+        return len(self.phase)
+
+    def add_point(self, phase: float) -> None:
+        """Add the absolute value of the phase of the next data point.
+
+        Args:
+            phase (float): The absolute value of the phase in degrees.
+        """
+        WINDOW_SIZE = S11Data.PHASE_FILTER_WINDOW
+        self.phase.append(phase)
+        n_points = len(self.phase)
+
+        if n_points <= WINDOW_SIZE // 2:
+            # Transient response at the start of the sweep
+            self.filtered.append(phase)
+        elif n_points >= WINDOW_SIZE:
+            self.filtered.append(sum(self.phase[-WINDOW_SIZE:]) / WINDOW_SIZE)
+
+        # The last filtered points are replaced by the raw data when the sweep is finished
+        # So we only look for peaks and valleys on points that are followed by enough data points
+        while (
+            self._checked < len(self.filtered)
+            and self._checked - WINDOW_SIZE // 2 < n_points - WINDOW_SIZE
+        ):
+            self._check_extremum(self._checked)
+            self._checked += 1
+
+    def _check_extremum(self, index: int) -> None:
+        """Check if a peak or valley ends at the given filtered point.
+
+        Plateaus are handled the same way as in scipy's find_peaks.
+
+        Args:
+            index (int): The index of the filtered point.
+        """
+        if index == 0:
+            return
+
+        HEIGHT = S11Data.PHASE_EXTREMUM_HEIGHT
+        current, previous = self.filtered[index], self.filtered[index - 1]
+
+        if current > previous:
+            if self._fall_start is not None:
+                height = 180 - self.filtered[self._fall_start]
+                if height >= HEIGHT:
+                    self.valleys.append(((self._fall_start + index - 1) // 2, height))
+                self._fall_start = None
+            self._rise_start = index
+
+        elif current < previous:
+            if self._rise_start is not None:
+                height = self.filtered[self._rise_start]
+                if height >= HEIGHT:
+                    self.peaks.append(((self._rise_start + index - 1) // 2, height))
+                self._rise_start = None
+            self._fall_start = index
+
+    def _select_by_distance(self, extrema: list) -> list:
+        """Select the peaks or valleys that fulfill the minimal distance.
+
+        Like scipy's find_peaks, the higher extrema are kept and the lower ones close to them are discarded.
+
+        Args:
+            extrema (list): The peaks or valleys as (index, height) tuples.
+
+        Returns:
+            list: The indices of the selected extrema.
+        """
+        if not extrema:
+            return []
+
+        n_points = self.n_points if self.n_points is not None else len(self.phase)
+        distance = max(n_points / 10, 1)
+
+        indices, heights = np.array(extrema).T
+        keep = np.ones(len(indices), dtype=bool)
+        for i in np.argsort(heights)[::-1]:
+            if keep[i]:
+                close = np.abs(indices - indices[i]) < distance
+                close[i] = False
+                keep &= ~close
+
+        return indices[keep].astype(int).tolist()
+
+    @property
+    def phase_deg(self) -> np.ndarray:
+        """The signed phase in degrees estimated from the data points received so far.
+
+        It has one value per data point. The last points that can't be filtered yet are taken unfiltered.
+        """
+        phase = np.asarray(
+            self.filtered + self.phase[len(self.filtered) :], dtype=np.float64
+        )
+        if len(phase) < 2:
+            return phase
+
+        boundaries = np.zeros(len(phase), dtype=bool)
+        boundaries[[0, -1]] = True
+        boundaries[self._select_by_distance(self.peaks)] = True
+        boundaries[self._select_by_distance(self.valleys)] = True
+
+        return S11Data._apply_phase_sign(
+            phase[np.newaxis, :], boundaries[np.newaxis, :]
+        )[0]
+
+    def finish(self) -> np.ndarray:
+        """Finish the sweep and return the corrected phase.
+
+        The filtered points and the peaks and valleys found so far are kept. Like in S11Data.phase_correction,
+        the last points are replaced by the unfiltered data and only they are checked for peaks and valleys,
+        so the result is the same as the one of S11Data.phase_correction.
+
+        Returns:
+            np.ndarray: The corrected phase in degrees.
+        """
+        WINDOW_SIZE = S11Data.PHASE_FILTER_WINDOW
+        n_points = len(self.phase)
+        self.n_points = n_points
+
+        # The phase sign can't be determined for sweeps shorter than the filter window
+        if n_points < WINDOW_SIZE:
+            return np.asarray(self.phase, dtype=np.float64)
+
+        # The filter of the full sweep takes the last (WINDOW_SIZE + 1) // 2 points unfiltered
+        unfiltered = n_points - (WINDOW_SIZE + 1) // 2
+        self.filtered = self.filtered[:unfiltered] + self.phase[unfiltered:]
+        while self._checked < n_points:
+            self._check_extremum(self._checked)
+            self._checked += 1
+
+        return self.phase_deg
+
+
+class SweepAverager:
+    """This class is used to average repeated frequency sweeps without keeping the single sweeps in memory.
+
+    The mean and the variance of the return loss and phase readings are updated with Welford's algorithm when a sweep has finished.
+    """
+
+    def __init__(self, n_sweeps: int = 1) -> None:
+        """Initialize the sweep averager.
+
+        Args:
+            n_sweeps (int): The number of sweeps to average.
+        """
+        if n_sweeps < 1:
+            raise ValueError("At least one sweep is needed for an average")
+
+        self.n_sweeps = n_sweeps
+        self.count = 0
+        self.frequency = None
+        # Running mean and sum of squared deviations of the readings with the shape (2, N)
+        self._mean = None
+        self._m2 = None
+
+    @property
+    def finished(self) -> bool:
+        """True if all sweeps of the average have been added."""
+        return self.count >= self.n_sweeps
+
+    def add(self, data: S11Data) -> None:
+        """Add a sweep to the average.
+
+        Args:
+            data (S11Data): The S11 data of the sweep.
+
+        Raises:
+            ValueError: If the sweep has another frequency grid than the previous sweeps.
+        """
+        readings = np.stack((data.return_loss_mv, data.phase_mv)).astype(np.float64)
+
+        if self.count == 0:
+            self.frequency = np.array(data.frequency, dtype=np.float64)
+            self._mean = readings
+            self._m2 = np.zeros_like(readings)
+            self.count = 1
+            return
+
+        if not np.array_equal(self.frequency, data.frequency):
+            raise ValueError(
+                "All sweeps of an average must have the same frequency grid"
+            )
+
+        self.count += 1
+        delta = readings - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (readings - self._mean)
+
+    @property
+    def mean(self) -> S11Data:
+        """The S11 data of the averaged readings."""
+        return S11Data.from_arrays(
+            self.frequency, self._mean[0].copy(), self._mean[1].copy()
+        )
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The sample variance of the return loss and phase readings in mV^2 with the shape (2, N). It is NaN for a single sweep."""
+        if self.count < 2:
+            return np.full_like(self._mean, np.nan)
+        return self._m2 / (self.count - 1)
+
+
+class CalibrationStandard:
+    """This class is used to describe the frequency dependent reflection coefficient of a short, open or load standard.
+
+    A standard is either described by tabulated complex reflection coefficients or by a model.
+    The model consists of an offset delay and the terminating element: a capacitance for an open, an inductance for a short and a resistance for a load.
+    The capacitance and inductance are polynomials of the frequency like in the standard definitions of vector network analyzers.
+    """
+
+    KINDS = ("short", "open", "load")
+    REFERENCE_IMPEDANCE = 50  # Ohm
+
+    def __init__(
+        self,
+        kind: str,
+        delay: float = 0,
+        capacitance: tuple = (0,),
+        inductance: tuple = (0,),
+        resistance: float = REFERENCE_IMPEDANCE,
+        frequency: np.ndarray = None,
+        gamma: np.ndarray = None,
+    ) -> None:
+        """Initialize the calibration standard. Without parameters the standard is ideal.
+
+        Args:
+            kind (str): The kind of standard, one of "short", "open" and "load".
+            delay (float): The one-way offset delay in s.
+            capacitance (tuple): The polynomial coefficients of the capacitance of an open in F, F/Hz, F/Hz^2, ...
+            inductance (tuple): The polynomial coefficients of the inductance of a short or load in H, H/Hz, H/Hz^2, ...
+            resistance (float): The resistance of a load in Ohm.
+            frequency (np.ndarray, optional): The frequencies of tabulated reflection coefficients in Hz.
+            gamma (np.ndarray, optional): The tabulated complex reflection coefficients. If they are given the model parameters are not used.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown calibration standard {kind}")
+        if (frequency is None) != (gamma is None):
+            raise ValueError(
+                "Tabulated calibration standards need frequencies and reflection coefficients"
+            )
+
+        self.kind = kind
+        self.delay = float(delay)
+        self.capacitance = tuple(float(value) for value in capacitance)
+        self.inductance = tuple(float(value) for value in inductance)
+        self.resistance = float(resistance)
+        self.frequency = None
+        self.gamma = None
+        if frequency is not None:
+            order = np.argsort(frequency)
+            self.frequency = np.asarray(frequency, dtype=np.float64)[order]
+            self.gamma = np.asarray(gamma, dtype=np.complex128)[order]
+            if self.frequency.shape != self.gamma.shape:
+                raise ValueError(
+                    "Frequencies and reflection coefficients must have the same length"
+                )
+
+        # The reflection coefficients of the last evaluated frequency grid
+        self._evaluated = (None, None)
+
+    @property
+    def tabulated(self) -> bool:
+        """True if the standard is described by tabulated reflection coefficients."""
+        return self.frequency is not None
+
+    def evaluate(self, frequency: np.ndarray) -> np.ndarray:
+        """Evaluate the reflection coefficient of the standard on a frequency grid.
+
+        Args:
+            frequency (np.ndarray): The frequency grid in Hz.
+
+        Returns:
+            np.ndarray: The complex reflection coefficients.
+
+        Raises:
+            ValueError: If the frequency grid is not covered by tabulated reflection coefficients.
+        """
+        frequency = np.asarray(frequency, dtype=np.float64)
+        evaluated_frequency, evaluated_gamma = self._evaluated
+        if evaluated_frequency is not None and np.array_equal(
+            evaluated_frequency, frequency
+        ):
+            return evaluated_gamma
+
+        if self.tabulated:
+            lower, weight = interpolation_weights(self.frequency, frequency)
+            gamma = self.gamma[lower] * (1 - weight) + self.gamma[lower + 1] * weight
+        else:
+            omega = 2 * np.pi * frequency
+            z0 = self.REFERENCE_IMPEDANCE
+            if self.kind == "open":
+                # The admittance is used so an ideal open doesn't divide by zero
+                admittance = 1j * omega * np.polynomial.polynomial.polyval(
+                    frequency, self.capacitance
+                )
+                gamma = (1 - admittance * z0) / (1 + admittance * z0)
+            else:
+                impedance = 1j * omega * np.polynomial.polynomial.polyval(
+                    frequency, self.inductance
+                )
+                if self.kind == "load":
+                    impedance = impedance + self.resistance
+                gamma = (impedance - z0) / (impedance + z0)
+            gamma = gamma * np.exp(-2j * omega * self.delay)
+
+        gamma = S11Data._read_only(np.asarray(gamma, dtype=np.complex128))
+        self._evaluated = (frequency, gamma)
+        return gamma
+
+    def to_json(self):
+        """Convert the calibration standard to a JSON serializable format."""
+        if self.tabulated:
+            return {
+                "frequency": self.frequency.tolist(),
+                "real": self.gamma.real.tolist(),
+                "imag": self.gamma.imag.tolist(),
+            }
+        return {
+            "delay": self.delay,
+            "capacitance": list(self.capacitance),
+            "inductance": list(self.inductance),
+            "resistance": self.resistance,
+        }
+
+    @classmethod
+    def from_json(cls, kind: str, json):
+        """Create a calibration standard from a JSON serializable format.
+
+        Args:
+            kind (str): The kind of standard, one of "short", "open" and "load".
+            json (dict): The definition of the standard.
+
+        Returns:
+            CalibrationStandard: The calibration standard.
+        """
+        if "frequency" in json:
+            gamma = np.asarray(json["real"], dtype=np.float64) + 1j * np.asarray(
+                json["imag"], dtype=np.float64
+            )
+            return cls(kind, frequency=json["frequency"], gamma=gamma)
+
+        return cls(
+            kind,
+            delay=json.get("delay", 0),
+            capacitance=json.get("capacitance", (0,)),
+            inductance=json.get("inductance", (0,)),
+            resistance=json.get("resistance", cls.REFERENCE_IMPEDANCE),
+        )
+
+    @classmethod
+    def load_definitions(cls, filename: str) -> tuple:
+        """Load the definitions of the short, open and load standards from a JSON file.
+
+        Standards that are missing in the file are ideal.
+
+        Args:
+            filename (str): The filename of the JSON file.
+
+        Returns:
+            tuple: The short, open and load CalibrationStandard objects.
+        """
+        with open(filename) as f:
+            return cls.definitions_from_json(json.load(f))
+
+    @classmethod
+    def definitions_from_json(cls, json) -> tuple:
+        """Create the short, open and load standards from a JSON serializable format.
+
+        Standards that are missing are ideal.
+
+        Args:
+            json (dict): The definitions of the standards by kind.
+
+        Returns:
+            tuple: The short, open and load CalibrationStandard objects.
+        """
+        return tuple(
+            cls.from_json(kind, json[kind]) if kind in json else cls(kind)
+            for kind in cls.KINDS
+        )
+
+
+class Calibration:
+    """This class is used to store the error terms of a short, open and load calibration and to apply them to S11 data.
+
+    The three-term error model relates the measured reflection coefficient to the actual reflection coefficient of the device under test.
+    The error terms are stored as complex arrays over the frequency grid the calibration has been calculated for.
+    """
+
+    FILE_VERSION = 1
+    STANDARDS = ("short", "open", "load")
+    # Every calibration gets its own number for the caching of calibrated data
+    _instances = itertools.count()
+
+    def __init__(
+        self,
+        frequency: np.ndarray,
+        e_00: np.ndarray,
+        e_11: np.ndarray,
+        delta_e: np.ndarray,
+        standards: tuple = None,
+        standards_hash: str = None,
+        variance: np.ndarray = None,
+        definitions: tuple = None,
+    ) -> None:
+        """Initialize the calibration.
+
+        Args:
+            frequency (np.ndarray): The frequency grid of the error terms in Hz.
+            e_00 (np.ndarray): The directivity error term.
+            e_11 (np.ndarray): The source match error term.
+            delta_e (np.ndarray): The determinant e_00 * e_11 - e_01 * e_10 of the error terms.
+            standards (tuple, optional): The S11 data of the short, open and load standards the calibration has been calculated from.
+            standards_hash (str, optional): The hash of the standards. It is calculated from the standards if they are given.
+            variance (np.ndarray, optional): The variance of the return loss and phase readings in mV^2 of the averaged short, open and load sweeps with the shape (3, 2, N). NaN where it is unknown.
+            definitions (tuple, optional): The CalibrationStandard definitions of the short, open and load standards. Defaults to ideal standards.
+        """
+        self.frequency = np.asarray(frequency, dtype=np.float64)
+        self.e_00 = np.asarray(e_00, dtype=np.complex128)
+        self.e_11 = np.asarray(e_11, dtype=np.complex128)
+        self.delta_e = np.asarray(delta_e, dtype=np.complex128)
+        self._cache_key = f"calibration_{next(self._instances)}"
+        self._standards = standards
+        # The file the standards are loaded from when they are first accessed
+        self._standards_file = None
+        if standards is not None and standards_hash is None:
+            standards_hash = self.hash_standards(*standards)
+        self.standards_hash = standards_hash
+        if definitions is None:
+            definitions = tuple(CalibrationStandard(kind) for kind in self.STANDARDS)
+        self.definitions = tuple(definitions)
+        self.variance = variance
+        if variance is not None:
+            self.variance = np.asarray(variance, dtype=np.float64)
+
+        if not (
+            self.frequency.shape
+            == self.e_00.shape
+            == self.e_11.shape
+            == self.delta_e.shape
+        ):
+            raise ValueError(
+                "Frequency and error terms of the calibration must have the same length"
+            )
+        variance_shape = (3, 2) + self.frequency.shape
+        if self.variance is not None and self.variance.shape != variance_shape:
+            raise ValueError(
+                "The variance of the calibration must have the shape (3, 2, N)"
+            )
+
+    @classmethod
+    def from_standards(
+        cls,
+        frequency: np.ndarray,
+        short: S11Data,
+        open: S11Data,
+        load: S11Data,
+        definitions: tuple = None,
+        variances: tuple = None,
+    ) -> "Calibration":
+        """Calculate the calibration from measurements of the short, open and load standards.
+
+        Standards that were measured on another frequency grid are resampled onto the given grid.
+        The error model is solved for all frequency points at once.
+
+        Args:
+            frequency (np.ndarray): The frequency grid of the calibration in Hz.
+            short (S11Data): The measurement of the short standard.
+            open (S11Data): The measurement of the open standard.
+            load (S11Data): The measurement of the load standard.
+            definitions (tuple, optional): The CalibrationStandard definitions of the short, open and load standards. Defaults to ideal standards.
+            variances (tuple, optional): The variance of the return loss and phase readings of the short, open and load standards with the shape (2, n) on the grid of the standard. None for standards that were not averaged.
+
+        Returns:
+            Calibration: The calibration on the given frequency grid.
+
+        Raises:
+            ValueError: If the standards don't cover the frequency grid or can't be distinguished.
+        """
+        frequency = np.asarray(frequency, dtype=np.float64)
+        measured_gamma = np.stack(
+            [standard.resample(frequency).gamma for standard in (short, open, load)],
+            axis=-1,
+        )
+        if definitions is None:
+            definitions = tuple(CalibrationStandard(kind) for kind in cls.STANDARDS)
+        ideal_gamma = np.stack(
+            [definition.evaluate(frequency) for definition in definitions], axis=-1
+        )
+
+        # The three-term error model e_00 + ideal * measured * e_11 - ideal * delta_e = measured
+        # is solved for all frequency points at once, A has the shape (N, 3, 3)
+        A = np.empty(measured_gamma.shape + (3,), dtype=np.complex128)
+        A[..., 0] = 1
+        A[..., 1] = ideal_gamma * measured_gamma
+        A[..., 2] = -ideal_gamma
+
+        try:
+            error_terms = np.linalg.solve(A, measured_gamma[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            raise ValueError(
+                "The short, open and load measurements are not distinguishable"
+            )
+
+        variance = None
+        if variances is not None and any(v is not None for v in variances):
+            variance = np.full((3, 2, len(frequency)), np.nan)
+            for i, (standard, standard_variance) in enumerate(
+                zip((short, open, load), variances)
+            ):
+                if standard_variance is None:
+                    continue
+                if np.array_equal(standard.frequency, frequency):
+                    variance[i] = standard_variance
+                else:
+                    lower, weight = interpolation_weights(standard.frequency, frequency)
+                    variance[i] = (
+                        standard_variance[:, lower] * (1 - weight)
+                        + standard_variance[:, lower + 1] * weight
+                    )
+
+        return cls(
+            frequency,
+            *error_terms.T,
+            standards=(short, open, load),
+            variance=variance,
+            definitions=definitions,
+        )
+
+    @staticmethod
+    def hash_standards(short: S11Data, open: S11Data, load: S11Data) -> str:
+        """Calculate the hash of the raw data of the short, open and load standards.
+
+        Args:
+            short (S11Data): The measurement of the short standard.
+            open (S11Data): The measurement of the open standard.
+            load (S11Data): The measurement of the load standard.
+
+        Returns:
+            str: The SHA-256 hash as hex string.
+        """
+        sha256 = hashlib.sha256()
+        for standard in (short, open, load):
+            for column in standard.millivolts:
+                sha256.update(np.ascontiguousarray(column, dtype="<f8").tobytes())
+        return sha256.hexdigest()
+
+    @property
+    def standards(self) -> tuple:
+        """The S11 data of the short, open and load standards or None if they are not available.
+
+        Standards stored in a calibration file are only read from the file when they are first accessed.
+        They are not used if the file can't be read anymore or if they don't match the hash of the calibration.
+        """
+        if self._standards is None and self._standards_file is not None:
+            filename, self._standards_file = self._standards_file, None
+            try:
+                with np.load(filename) as data:
+                    if all(standard in data for standard in self.STANDARDS):
+                        standards = tuple(
+                            S11Data.from_arrays(*data[standard])
+                            for standard in self.STANDARDS
+                        )
+                    else:
+                        standards = None
+            except (OSError, ValueError) as e:
+                logger.error("Could not read the calibration standards from %s: %s", filename, e)
+                return None
+
+            if standards is not None and self.hash_standards(*standards) != self.standards_hash:
+                logger.error("The calibration standards in %s don't match the calibration", filename)
+                return None
+            self._standards = standards
+        return self._standards
+
+    def uses_definitions(self, definitions: tuple = None) -> bool:
+        """Check if the calibration has been calculated with the given standard definitions.
+
+        Args:
+            definitions (tuple, optional): The CalibrationStandard definitions of the short, open and load standards. Defaults to ideal standards.
+
+        Returns:
+            bool: True if the definitions describe the same standards as the ones of the calibration.
+        """
+        if definitions is None:
+            definitions = tuple(CalibrationStandard(kind) for kind in self.STANDARDS)
+        return [definition.to_json() for definition in self.definitions] == [
+            definition.to_json() for definition in definitions
+        ]
+
+    def covers(self, frequency: np.ndarray) -> bool:
+        """Check if the calibration has been calculated for the given frequency grid.
+
+        Args:
+            frequency (np.ndarray): The frequency grid in Hz.
+
+        Returns:
+            bool: True if the frequency grid is the one of the calibration.
+        """
+        return np.array_equal(self.frequency, frequency)
+
+    def correct(self, gamma: np.ndarray) -> np.ndarray:
+        """Correct measured reflection coefficients on the frequency grid of the calibration.
+
+        Args:
+            gamma (np.ndarray): The measured complex reflection coefficients.
+
+        Returns:
+            np.ndarray: The corrected complex reflection coefficients.
+        """
+        return (gamma - self.e_00) / (gamma * self.e_11 - self.delta_e)
+
+    def apply(self, data: S11Data) -> tuple:
+        """Apply the calibration to S11 data.
+
+        The result is cached with the S11 data, so the calibration can be applied in the background before the data is plotted.
+
+        Args:
+            data (S11Data): The S11 data. It must be on the frequency grid of the calibration.
+
+        Returns:
+            tuple: The corrected complex reflection coefficient and the corrected return loss in dB.
+
+        Raises:
+            ValueError: If the S11 data is on another frequency grid than the calibration.
+        """
+        if not self.covers(data.frequency):
+            raise ValueError(
+                "The calibration has been calculated for another frequency grid"
+            )
+
+        gamma = data._cached(
+            f"{self._cache_key}_gamma", lambda: self.correct(data.gamma)
+        )
+        return_loss_db = data._cached(
+            f"{self._cache_key}_return_loss_db",
+            lambda: -20 * np.log10(np.abs(gamma + 1e-12)),
+        )
+        return gamma, return_loss_db
+
+    def resample(self, frequencies: np.ndarray) -> "Calibration":
+        """Interpolate the error terms onto another frequency grid.
+
+        Args:
+            frequencies (np.ndarray): The target frequency grid in Hz. It must lie within the frequency range of the calibration.
+
+        Returns:
+            Calibration: The calibration on the target frequency grid.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        if self.covers(frequencies):
+            return self
+
+        lower, weight = interpolation_weights(self.frequency, frequencies)
+
+        def interpolate(values: np.ndarray) -> np.ndarray:
+            return values[lower] * (1 - weight) + values[lower + 1] * weight
+
+        def interpolate_variance() -> np.ndarray:
+            return (
+                self.variance[..., lower] * (1 - weight)
+                + self.variance[..., lower + 1] * weight
+            )
+
+        resampled = Calibration(
+            frequencies,
+            interpolate(self.e_00),
+            interpolate(self.e_11),
+            interpolate(self.delta_e),
+            standards=self._standards,
+            standards_hash=self.standards_hash,
+            variance=None if self.variance is None else interpolate_variance(),
+            definitions=self.definitions,
+        )
+        resampled._standards_file = self._standards_file
+        return resampled
+
+    def save(self, filename: str, include_standards: bool = False) -> None:
+        """Save the calibration to a versioned .npz file.
+
+        The file contains the error terms, the frequency grid and the hash of the standards.
+        Optionally the raw data of the standards is stored as well.
+
+        Args:
+            filename (str): The filename of the file to save to.
+            include_standards (bool): If True, the raw data of the standards is saved if it is available.
+        """
+        arrays = {
+            "version": np.array(self.FILE_VERSION),
+            "frequency": self.frequency,
+            "e_00": self.e_00,
+            "e_11": self.e_11,
+            "delta_e": self.delta_e,
+            "standards_hash": np.array(self.standards_hash or ""),
+        }
+        if self.variance is not None:
+            arrays["variance"] = self.variance
+        arrays["definitions"] = np.array(
+            json.dumps(
+                {
+                    definition.kind: definition.to_json()
+                    for definition in self.definitions
+                }
+            )
+        )
+        if include_standards and self.standards is not None:
+            for name, standard in zip(self.STANDARDS, self.standards):
+                arrays[name] = np.stack(standard.millivolts)
+
+        # A file object is used, otherwise numpy would append .npz to the filename
+        with open(filename, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, filename: str) -> "Calibration":
+        """Load a calibration from a .npz file.
+
+        Only the error terms and the frequency grid are read, the standards are read when they are first accessed.
+
+        Args:
+            filename (str): The filename of the file to load from.
+
+        Returns:
+            Calibration: The loaded calibration.
+        """
+        with np.load(filename) as data:
+            # The first calibration files had no version and only contained the error terms
+            version = int(data["version"]) if "version" in data else 0
+            if version > cls.FILE_VERSION:
+                raise ValueError(
+                    f"Unsupported calibration file version {version} in {filename}"
+                )
+            calibration = cls(
+                data["frequency"],
+                data["e_00"],
+                data["e_11"],
+                data["delta_e"],
+                standards_hash=str(data["standards_hash"]) or None
+                if "standards_hash" in data
+                else None,
+                variance=data["variance"] if "variance" in data else None,
+                definitions=CalibrationStandard.definitions_from_json(
+                    json.loads(str(data["definitions"]))
+                )
+                if "definitions" in data
+                else None,
+            )
+
+        calibration._standards_file = filename
+        return calibration
 
 
 class LookupTable:
@@ -410,8 +1526,9 @@ class MechanicalLookupTable(LookupTable):
 class AutoTMModel(ModuleModel):
     """The module model for the NQRduck AutoTM module. It is used to store the data and state of the AutoTM module."""
     available_devices_changed = pyqtSignal(list)
-    serial_changed = pyqtSignal(QSerialPort)
-    data_points_changed = pyqtSignal(list)
+    serial_changed = pyqtSignal(object)
+    data_points_added = pyqtSignal(list)
+    data_points_cleared = pyqtSignal()
     active_stepper_changed = pyqtSignal(Stepper)
     saved_positions_changed = pyqtSignal(list)
     serial_data_received = pyqtSignal(str)
@@ -425,9 +1542,20 @@ class AutoTMModel(ModuleModel):
         """Initialize the AutoTM model."""
         super().__init__(module)
         self.data_points = []
+        self.phase_resolver = PhaseSignResolver()
+        # New data points are announced in chunks, at the latest after the interval
+        self.data_point_chunk_size = 50  # points
+        self.data_point_interval = 50  # ms
+        self.expected_data_points = None
+        self.announced_data_points = 0
+        self.data_point_timer = QTimer(self)
+        self.data_point_timer.setSingleShot(True)
+        self.data_point_timer.timeout.connect(self.flush_data_points)
         self.active_calibration = None
         self.calibration = None
         self.serial = None
+        # True if the ATM system sends the points of frequency sweeps as binary frames
+        self.binary_frames = False
 
         self.tuning_stepper = TuningStepper()
         self.matching_stepper = MatchingStepper()
@@ -441,6 +1569,22 @@ class AutoTMModel(ModuleModel):
 
         self.last_reflection = None
 
+        # Append-only archive of the finished frequency sweeps
+        self.sweep_archive = None
+        # Calculated calibrations by the frequency sweep they have been calculated for
+        self.calibration_store = None
+        # The settings of the last frequency sweep and of the sweeps of the calibration standards
+        self.frequency_sweep_key = None
+        self.standard_keys = {}
+        # Number of sweeps averaged per calibration standard
+        self.calibration_averages = 1
+        self.standard_averager = None
+        self.calibration_sweep_range = None
+        # The variance of the readings of the averaged calibration standards
+        self.standard_variances = {}
+        # The definitions of the short, open and load standards, None for ideal standards
+        self.standard_definitions = None
+
         self.tuning_voltage = None
         self.matching_voltage = None
 
@@ -475,12 +1619,74 @@ class AutoTMModel(ModuleModel):
         They will be saved in the according properties later on.
         """
         self.data_points.append((frequency, return_loss, phase))
-        self.data_points_changed.emit(self.data_points)
+        self.phase_resolver.add_point(
+            (phase - S11Data.CENTER_POINT_PHASE) / S11Data.PHASE_SLOPE
+        )
+        self.schedule_data_point_notification()
 
-    def clear_data_points(self) -> None:
-        """Clear all data points from the model."""
+    def add_data_points(
+        self, frequency: np.ndarray, return_loss: np.ndarray, phase: np.ndarray
+    ) -> None:
+        """Add a chunk of data points to the model, e.g. from a binary sweep frame.
+
+        Args:
+            frequency (np.ndarray): The frequencies in Hz.
+            return_loss (np.ndarray): The return losses in mV.
+            phase (np.ndarray): The phases in mV.
+        """
+        columns = [
+            np.asarray(column, dtype=np.float64).tolist()
+            for column in (frequency, return_loss, phase)
+        ]
+        self.data_points.extend(zip(*columns))
+        for phase in columns[2]:
+            self.phase_resolver.add_point(
+                (phase - S11Data.CENTER_POINT_PHASE) / S11Data.PHASE_SLOPE
+            )
+        self.schedule_data_point_notification()
+
+    def schedule_data_point_notification(self) -> None:
+        """Announce the new data points if a chunk is complete, otherwise when the interval has passed."""
+        if (
+            len(self.data_points) - self.announced_data_points
+            >= self.data_point_chunk_size
+        ):
+            self.flush_data_points()
+        elif not self.data_point_timer.isActive():
+            self.data_point_timer.start(self.data_point_interval)
+
+    def flush_data_points(self) -> None:
+        """Emit the data points that were added since the last notification. This is called at the end of a sweep."""
+        self.data_point_timer.stop()
+        chunk = self.data_points[self.announced_data_points :]
+        if chunk:
+            self.announced_data_points = len(self.data_points)
+            self.data_points_added.emit(chunk)
+
+    def get_s11_data(self) -> S11Data:
+        """Create an S11Data object from the current data points.
+
+        The phase sign has already been resolved while the data points were added.
+        """
+        frequency, return_loss, phase = np.array(
+            self.data_points, dtype=np.float64
+        ).reshape(-1, 3).T
+        return S11Data.from_arrays(
+            frequency, return_loss, phase, phase_deg=self.phase_resolver.finish()
+        )
+
+    def clear_data_points(self, n_points: int = None) -> None:
+        """Clear all data points from the model.
+
+        Args:
+            n_points (int, optional): The expected number of data points of the next sweep. Defaults to None.
+        """
+        self.data_point_timer.stop()
         self.data_points.clear()
-        self.data_points_changed.emit(self.data_points)
+        self.announced_data_points = 0
+        self.expected_data_points = n_points
+        self.phase_resolver = PhaseSignResolver(n_points)
+        self.data_points_cleared.emit()
 
     @property
     def saved_positions(self):
@@ -590,8 +1796,8 @@ class AutoTMModel(ModuleModel):
         self.clear_data_points()
 
     @property
-    def calibration(self):
-        """The calibration data."""
+    def calibration(self) -> Calibration:
+        """The calibration calculated from the short, open and load measurements."""
         return self._calibration
 
     @calibration.setter
@@ -0,0 +1,274 @@
+"""Recording and replay of the serial traffic of the AutoTM module.
+
+A recording contains every command that was written and every line, binary frame and confirmation that was received,
+with the monotonic time and the direction. A recording can be replayed through the message handlers of the controller,
+at the original speed, faster or as fast as possible, to reproduce and profile a session without hardware.
+
+The file starts with a header and is followed by one record per message:
+
+    time (float64, s), kind (1 byte), length (uint32), payload (length bytes)
+
+The kinds are COMMAND for written commands, LINE for received lines, FRAME for received binary frames and CONFIRMATION for confirmations.
+"""
+
+import logging
+import struct
+import time
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from .serial_io import SerialMessage, decode_frame, encode_frame
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRecord:
+    """A single record of a recording."""
+
+    def __init__(self, timestamp: float, kind: bytes, payload: bytes) -> None:
+        """Initialize the record.
+
+        Args:
+            timestamp (float): The monotonic time in s.
+            kind (bytes): The kind of the record.
+            payload (bytes): The command, line or frame.
+        """
+        self.timestamp = timestamp
+        self.kind = kind
+        self.payload = payload
+
+    def to_message(self, parsers: dict) -> SerialMessage:
+        """Create the message of a received record, like the serial reader does. The message keeps the recorded time.
+
+        Args:
+            parsers (dict): The parsers of the lines by their first character.
+
+        Returns:
+            SerialMessage: The message, None for a written command.
+        """
+        if self.kind == SessionRecorder.LINE:
+            return SerialMessage.parse(
+                self.payload.decode("utf-8", errors="replace"), parsers, self.timestamp
+            )
+        if self.kind == SessionRecorder.FRAME:
+            message, _ = decode_frame(self.payload, self.timestamp)
+            return message
+        if self.kind == SessionRecorder.CONFIRMATION:
+            return SerialMessage("c", received=self.timestamp, confirmation=True)
+        return None
+
+
+class SessionRecorder:
+    """This class writes the serial traffic to a recording."""
+
+    MAGIC = b"ATMS"
+    VERSION = 1
+    HEADER = struct.Struct("<4sH10x")  # magic, version, padding
+    RECORD = struct.Struct("<dcI")  # time, kind, length
+
+    COMMAND = b"t"
+    LINE = b"l"
+    FRAME = b"f"
+    CONFIRMATION = b"c"
+
+    def __init__(self, filename: str) -> None:
+        """Initialize the recorder and create the recording.
+
+        Args:
+            filename (str): The file the recording is written to.
+        """
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+        self.n_records = 0
+
+    def record(self, kind: bytes, payload: bytes, timestamp: float = None) -> None:
+        """Append a record to the recording.
+
+        Args:
+            kind (bytes): The kind of the record.
+            payload (bytes): The command, line or frame.
+            timestamp (float): The monotonic time in s. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.file.write(self.RECORD.pack(timestamp, kind, len(payload)) + payload)
+        self.n_records += 1
+
+    def record_command(self, command: str, timestamp: float = None) -> None:
+        """Record a command that was written to the serial connection.
+
+        Args:
+            command (str): The command.
+            timestamp (float): The monotonic time the command was written at. Defaults to now.
+        """
+        self.record(self.COMMAND, command.encode("utf-8"), timestamp)
+
+    def record_message(self, message: SerialMessage) -> None:
+        """Record a message that was received from the serial connection.
+
+        Args:
+            message (SerialMessage): The message.
+        """
+        if message.confirmation:
+            self.record(self.CONFIRMATION, b"", message.received)
+        elif isinstance(message.values, tuple) and message.prefix == "F":
+            sequence, samples = message.values
+            self.record(self.FRAME, encode_frame(sequence, samples), message.received)
+        else:
+            self.record(self.LINE, message.text.encode("utf-8"), message.received)
+
+    def flush(self) -> None:
+        """Write the buffered records to the recording."""
+        self.file.flush()
+
+    def close(self) -> None:
+        """Close the recording."""
+        self.file.close()
+        logger.debug("Recorded %s messages to %s", self.n_records, self.filename)
+
+    @classmethod
+    def read(cls, filename: str) -> list:
+        """Read a recording.
+
+        Args:
+            filename (str): The file of the recording.
+
+        Returns:
+            list: The records in the order they were recorded. A record that was only partially written is ignored.
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        magic, version = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{filename} is not a serial recording")
+        if version > cls.VERSION:
+            raise ValueError(f"Unsupported recording version {version} in {filename}")
+
+        records = []
+        offset = cls.HEADER.size
+        while offset + cls.RECORD.size <= len(data):
+            timestamp, kind, length = cls.RECORD.unpack_from(data, offset)
+            offset += cls.RECORD.size
+            if offset + length > len(data):
+                break
+            records.append(SessionRecord(timestamp, kind, data[offset : offset + length]))
+            offset += length
+
+        return records
+
+
+class SessionReplay(QObject):
+    """This class replays a recording through the message handlers of the controller.
+
+    The received messages are passed to the handlers in batches, like the serial reader does.
+    The written commands are not sent anywhere, they are announced with the command_replayed signal together with their recorded time.
+    The finished signal is emitted when all records were replayed or the replay was stopped.
+    """
+
+    MAX_BATCH = 256  # messages handled per event loop iteration at maximum speed
+
+    command_replayed = pyqtSignal(str, float)
+    finished = pyqtSignal()
+
+    def __init__(self, records: list, handle_messages, parsers: dict, speed: float = 1.0) -> None:
+        """Initialize the replay.
+
+        Args:
+            records (list): The records of the recording.
+            handle_messages (callable): Called with a list of received messages.
+            parsers (dict): The parsers of the lines by their first character.
+            speed (float): The replay speed relative to the recording, 0 to replay as fast as possible.
+        """
+        super().__init__()
+        if speed < 0:
+            raise ValueError("The replay speed must not be negative")
+
+        self.records = records
+        self.handle_messages = handle_messages
+        self.parsers = parsers
+        self.speed = speed
+        self.position = 0
+        self.started = None
+        self.duration = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.replay_due)
+
+    def start(self) -> None:
+        """Start the replay."""
+        self.position = 0
+        self.started = time.monotonic()
+        self.duration = None
+        self.replay_due()
+
+    def stop(self) -> None:
+        """Stop the replay. The records that weren't replayed yet are skipped."""
+        self.timer.stop()
+        if self.started is not None and self.duration is None:
+            self.finish()
+
+    def replay_due(self) -> None:
+        """Replay the records that are due and schedule the next ones."""
+        if not self.records:
+            self.finish()
+            return
+
+        first = self.records[0].timestamp
+        elapsed = time.monotonic() - self.started
+        messages = []
+        while self.position < len(self.records):
+            record = self.records[self.position]
+            if self.speed:
+                if (record.timestamp - first) / self.speed > elapsed:
+                    break
+            elif len(messages) >= self.MAX_BATCH:
+                break
+
+            self.position += 1
+            if record.kind == SessionRecorder.COMMAND:
+                # The messages received before the command are handled first
+                self._handle(messages)
+                messages = []
+                self.command_replayed.emit(
+                    record.payload.decode("utf-8"), record.timestamp
+                )
+                continue
+
+            # The commands aren't sent, so there is nothing to confirm
+            message = record.to_message(self.parsers)
+            if message is not None and not message.confirmation:
+                messages.append(message)
+
+        self._handle(messages)
+
+        if self.position >= len(self.records):
+            self.finish()
+        elif self.speed:
+            delay = (self.records[self.position].timestamp - first) / self.speed - (
+                time.monotonic() - self.started
+            )
+            self.timer.start(max(0, int(delay * 1000)))
+        else:
+            # The event loop runs between the batches, so the view is updated during the replay
+            self.timer.start(0)
+
+    def _handle(self, messages: list) -> None:
+        """Pass received messages to the handlers.
+
+        Args:
+            messages (list): The messages.
+        """
+        if messages:
+            self.handle_messages(messages)
+
+    def finish(self) -> None:
+        """This method is called when all records were replayed or the replay was stopped."""
+        self.duration = time.monotonic() - self.started
+        logger.debug(
+            "Replayed %s of %s records in %.3f s",
+            self.position,
+            len(self.records),
+            self.duration,
+        )
+        self.finished.emit()
@@ -0,0 +1,536 @@
+"""Serial connection to the ATM system that is read in its own thread.
+
+The serial port is owned by a QThread. Received data is split into lines and parsed into SerialMessage objects in that thread.
+The messages are handed to the GUI thread in batches through a queue, so a busy GUI thread doesn't delay reading the port.
+
+If the ATM system supports it, the points of a frequency sweep are sent as binary frames instead of text lines.
+A frame starts at the start of a line with the byte 0x02, which doesn't start any text line:
+
+    start (0x02), type (b"F"), sequence (uint16), number of samples (uint16), samples, Fletcher-16 checksum (uint16)
+
+All integers are little-endian. The checksum covers the type, sequence, number of samples and samples.
+A sample of a sweep frame is the frequency in Hz (uint32), the return loss and the phase in mV (uint16 each).
+"""
+
+import logging
+import struct
+import time
+from collections import deque
+import numpy as np
+from PyQt6.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtSerialPort import QSerialPort
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sweep_point(payload: str) -> tuple:
+    """Parse a frequency sweep point. Format is f<frequency>r<return_loss>p<phase>.
+
+    Args:
+        payload (str): The line without its first character.
+
+    Returns:
+        tuple: The frequency in Hz, the return loss and the phase in mV.
+    """
+    frequency, reflection = payload.split("r")
+    return_loss, phase = reflection.split("p")
+    return float(frequency), float(return_loss), float(phase)
+
+
+def parse_voltages(payload: str) -> tuple:
+    """Parse the result of a voltage sweep. Format is v<tuning_voltage>t<matching_voltage>.
+
+    Args:
+        payload (str): The line without its first character.
+
+    Returns:
+        tuple: The tuning and matching voltage in V.
+    """
+    tuning_voltage, matching_voltage = payload.split("t")
+    return float(tuning_voltage), float(matching_voltage)
+
+
+def parse_positions(payload: str) -> tuple:
+    """Parse the stepper positions. Format is p<tuning_position>m<matching_position>.
+
+    Args:
+        payload (str): The line without its first character.
+
+    Returns:
+        tuple: The tuning and matching position in steps.
+    """
+    tuning_position, matching_position = payload.split("m")
+    return int(tuning_position), int(matching_position)
+
+
+def parse_reflection(payload: str) -> tuple:
+    """Parse a reflection measurement. Format is m<return_loss>p<phase>.
+
+    Args:
+        payload (str): The line without its first character.
+
+    Returns:
+        tuple: The return loss and the phase in mV.
+    """
+    return_loss, phase = payload.split("p")
+    return float(return_loss), float(phase)
+
+
+def parse_position_sweep_result(payload: str) -> tuple:
+    """Parse the result of a position sweep.
+
+    Format is z<tuning_position>,<tuning_last_direction>m<matching_position>,<matching_last_direction>.
+
+    Args:
+        payload (str): The line without its first character.
+
+    Returns:
+        tuple: The tuning position and last direction and the matching position and last direction.
+    """
+    tuning, matching = payload.split("m")
+    tuning_position, tuning_last_direction = tuning.split(",")
+    matching_position, matching_last_direction = matching.split(",")
+    return (
+        int(tuning_position),
+        int(tuning_last_direction),
+        int(matching_position),
+        int(matching_last_direction),
+    )
+
+
+FRAME_START = 0x02
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<BcHH")  # start, type, sequence, number of samples
+FRAME_CHECKSUM = struct.Struct("<H")
+MAX_FRAME_SAMPLES = 4096
+SWEEP_SAMPLE_DTYPE = np.dtype(
+    [("frequency", "<u4"), ("return_loss", "<u2"), ("phase", "<u2")]
+)
+# The dtypes of the samples by the type of the frame
+FRAME_TYPES = {b"F": SWEEP_SAMPLE_DTYPE}
+
+
+def fletcher16(data: bytes) -> int:
+    """Calculate the Fletcher-16 checksum of the data.
+
+    Args:
+        data (bytes): The data.
+
+    Returns:
+        int: The checksum.
+    """
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+    # The second sum adds every byte once for each byte from its position to the end
+    weights = np.arange(len(values), 0, -1, dtype=np.uint64)
+    sum1 = int(values.sum()) % 255
+    sum2 = int((values * weights).sum()) % 255
+    return (sum2 << 8) | sum1
+
+
+def encode_frame(
+    sequence: int, samples: np.ndarray, frame_type: bytes = b"F"
+) -> bytes:
+    """Encode samples as a binary frame, the way the ATM system sends them.
+
+    Args:
+        sequence (int): The sequence number of the frame.
+        samples (np.ndarray): The samples with the dtype of the frame type.
+        frame_type (bytes): The type of the frame.
+
+    Returns:
+        bytes: The frame.
+    """
+    samples = np.asarray(samples, dtype=FRAME_TYPES[frame_type])
+    header = FRAME_HEADER.pack(
+        FRAME_START, frame_type, sequence & 0xFFFF, len(samples)
+    )
+    # The start byte isn't covered by the checksum
+    body = header[1:] + samples.tobytes()
+    return bytes((FRAME_START,)) + body + FRAME_CHECKSUM.pack(fletcher16(body))
+
+
+def decode_frame(buffer: bytes, received: float = None) -> tuple:
+    """Decode the binary frame at the start of the buffer.
+
+    Args:
+        buffer (bytes): The received data, starting with the start byte of a frame.
+        received (float): The monotonic time the frame was read at. Defaults to now.
+
+    Returns:
+        tuple: The message and the number of bytes of the frame. The size is 0 if the frame isn't complete yet.
+        The message is None if the frame is corrupt, the size is then the number of bytes to skip.
+        The values of the message are the sequence number and the samples.
+    """
+    if len(buffer) < FRAME_HEADER.size:
+        return None, 0
+
+    _, frame_type, sequence, n_samples = FRAME_HEADER.unpack_from(buffer)
+    dtype = FRAME_TYPES.get(frame_type)
+    if dtype is None or n_samples > MAX_FRAME_SAMPLES:
+        # Not the start of a frame, the start byte is skipped to find the next line or frame
+        return None, 1
+
+    size = FRAME_HEADER.size + n_samples * dtype.itemsize + FRAME_CHECKSUM.size
+    if len(buffer) < size:
+        return None, 0
+
+    (checksum,) = FRAME_CHECKSUM.unpack_from(buffer, size - FRAME_CHECKSUM.size)
+    if fletcher16(buffer[1 : size - FRAME_CHECKSUM.size]) != checksum:
+        return None, size
+
+    samples = np.frombuffer(
+        buffer, dtype=dtype, count=n_samples, offset=FRAME_HEADER.size
+    )
+    message = SerialMessage(
+        frame_type.decode(), (sequence, samples), received=received
+    )
+    return message, size
+
+
+# The lines that start with the character of a confirmation
+SIGNAL_PATH_LINES = (b"ca\n", b"cp\n", b"ca\r\n", b"cp\r\n")
+
+# The parsers of the lines by their first character. Lines without a parser only have a payload.
+LINE_PARSERS = {
+    "f": parse_sweep_point,
+    "v": parse_voltages,
+    "p": parse_positions,
+    "m": parse_reflection,
+    "z": parse_position_sweep_result,
+}
+
+
+class SerialMessage:
+    """A line received from the ATM system.
+
+    The confirmation of a command isn't terminated by a newline. It is passed on as a message with the text 'c' and confirmation set to True.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        values: tuple = None,
+        error: str = None,
+        received: float = None,
+        confirmation: bool = False,
+    ) -> None:
+        """Initialize the message.
+
+        Args:
+            text (str): The line without the line ending.
+            values (tuple): The values parsed from the line, None if the line has no parser.
+            error (str): The reason why the line couldn't be parsed, None if it was parsed.
+            received (float): The monotonic time the line was read at. Defaults to now.
+            confirmation (bool): True for the confirmation of a command.
+        """
+        self.text = text
+        self.values = values
+        self.error = error
+        self.received = time.monotonic() if received is None else received
+        self.confirmation = confirmation
+
+    @property
+    def prefix(self) -> str:
+        """The first character of the line, it defines the type of the message."""
+        return self.text[:1]
+
+    @property
+    def payload(self) -> str:
+        """The line without its first character."""
+        return self.text[1:]
+
+    @classmethod
+    def parse(
+        cls, text: str, parsers: dict = LINE_PARSERS, received: float = None
+    ) -> "SerialMessage":
+        """Parse a line with the parser for its first character.
+
+        Args:
+            text (str): The line without the line ending.
+            parsers (dict): The parsers by the first character of the line.
+            received (float): The monotonic time the line was read at. Defaults to now.
+
+        Returns:
+            SerialMessage: The message. If the line couldn't be parsed its error is set.
+        """
+        parser = parsers.get(text[:1])
+        if parser is None:
+            return cls(text, received=received)
+
+        try:
+            return cls(text, parser(text[1:]), received=received)
+        except (ValueError, IndexError) as e:
+            return cls(text, error=str(e), received=received)
+
+
+class SerialReader(QObject):
+    """This class owns the serial connection to the ATM system and reads it in its own thread.
+
+    It has the isOpen, portName, write and close methods of a QSerialPort, so it can be used in place of one from the GUI thread.
+    The messages are collected in a queue until the GUI thread takes them. If the GUI thread falls behind by more than the high-water mark,
+    new lines are dropped. Lines that waited longer than the late threshold in the queue are counted as late.
+    """
+
+    DEFAULT_HIGH_WATER_MARK = 10000  # lines
+    DEFAULT_LATE_THRESHOLD = 0.1  # s
+
+    # Emitted when messages were added to an empty queue
+    messages_available = pyqtSignal()
+    # Emitted when the connection was opened, couldn't be opened or was lost, with the error of the port
+    connection_changed = pyqtSignal(bool, str)
+
+    _write_requested = pyqtSignal(bytes)
+    _close_requested = pyqtSignal()
+
+    def __init__(
+        self,
+        device: str,
+        baudrate: int,
+        parsers: dict = None,
+        high_water_mark: int = DEFAULT_HIGH_WATER_MARK,
+        late_threshold: float = DEFAULT_LATE_THRESHOLD,
+    ) -> None:
+        """Initialize the serial reader. The port is opened when the reader is started.
+
+        Args:
+            device (str): The device port to connect to.
+            baudrate (int): The baudrate of the connection.
+            parsers (dict): The parsers of the lines by their first character. Defaults to LINE_PARSERS.
+            high_water_mark (int): The maximum number of messages waiting for the GUI thread.
+            late_threshold (float): The time in s after which a waiting message is counted as late.
+        """
+        super().__init__()
+        self.device = device
+        self.baudrate = baudrate
+        self.parsers = LINE_PARSERS if parsers is None else parsers
+        self.high_water_mark = high_water_mark
+        self.late_threshold = late_threshold
+
+        # Appending and popping from different ends of a deque is thread-safe
+        self.queue = deque()
+        self.received_lines = 0
+        self.dropped_lines = 0
+        self.late_lines = 0
+        self.received_frames = 0
+        self.corrupt_frames = 0
+        self.lost_frames = 0
+
+        self.port = None
+        self._is_open = False
+        self._notified = False
+        self._buffer = b""
+        self._pending_confirmations = 0
+        self._frame_sequence = None
+
+        self.io_thread = QThread()
+        self.io_thread.setObjectName(f"Serial {device}")
+        self.moveToThread(self.io_thread)
+        self.io_thread.started.connect(self._open_port)
+        self._write_requested.connect(self._write)
+        self._close_requested.connect(self._close_port)
+
+    def start(self) -> None:
+        """Start the thread of the reader and open the port in it."""
+        self.io_thread.start()
+
+    def isOpen(self) -> bool:
+        """Returns True if the serial connection is open."""
+        return self._is_open
+
+    def portName(self) -> str:
+        """Returns the device port of the serial connection."""
+        return self.device
+
+    def write(self, data: bytes) -> None:
+        """Write a command to the serial connection. Every command is confirmed by the ATM system.
+
+        Args:
+            data (bytes): The command.
+        """
+        self._write_requested.emit(data)
+
+    def close(self) -> None:
+        """Close the serial connection and stop the thread of the reader."""
+        self._is_open = False
+        self._close_requested.emit()
+        self.io_thread.wait()
+
+    def take_messages(self) -> list:
+        """Take all messages that are waiting in the queue. This method is called from the GUI thread.
+
+        Returns:
+            list: The messages in the order they were received.
+        """
+        # The flag is reset first, so messages that are added while the queue is emptied are announced again
+        self._notified = False
+        now = time.monotonic()
+        messages = []
+        while self.queue:
+            message = self.queue.popleft()
+            if now - message.received > self.late_threshold:
+                self.late_lines += 1
+            messages.append(message)
+
+        return messages
+
+    @pyqtSlot()
+    def _open_port(self) -> None:
+        """Open the serial port in the thread of the reader."""
+        self.port = QSerialPort(self.device)
+        self.port.setBaudRate(self.baudrate)
+        self.port.readyRead.connect(self._read)
+        self.port.errorOccurred.connect(self._on_error)
+        self._is_open = self.port.open(QSerialPort.OpenModeFlag.ReadWrite)
+
+        if self._is_open:
+            logger.debug("Opened serial port %s", self.device)
+            self.connection_changed.emit(True, "")
+        else:
+            self.connection_changed.emit(False, self.port.errorString())
+            self.io_thread.quit()
+
+    @pyqtSlot()
+    def _close_port(self) -> None:
+        """Close the serial port in the thread of the reader."""
+        if self.port is not None and self.port.isOpen():
+            self.port.close()
+            logger.debug("Closed serial port %s", self.device)
+        self.io_thread.quit()
+
+    @pyqtSlot(bytes)
+    def _write(self, data: bytes) -> None:
+        """Write to the serial port in the thread of the reader.
+
+        Args:
+            data (bytes): The command.
+        """
+        if self.port is None or not self.port.isOpen():
+            logger.error("Could not write %s. Serial port is not open", data)
+            return
+
+        self._pending_confirmations += 1
+        self.port.write(data)
+
+    @pyqtSlot(QSerialPort.SerialPortError)
+    def _on_error(self, error: QSerialPort.SerialPortError) -> None:
+        """This method is called when an error occurs on the serial port.
+
+        Args:
+            error (QSerialPort.SerialPortError): The error.
+        """
+        if error == QSerialPort.SerialPortError.NoError:
+            return
+
+        logger.error("Serial port error: %s", self.port.errorString())
+        # The device was removed
+        if error == QSerialPort.SerialPortError.ResourceError and self._is_open:
+            self._is_open = False
+            self.port.close()
+            self.connection_changed.emit(False, self.port.errorString())
+            self.io_thread.quit()
+
+    @pyqtSlot()
+    def _read(self) -> None:
+        """Read the available data, split it into lines and queue the parsed messages."""
+        self._buffer += self.port.readAll().data()
+        received = time.monotonic()
+        queued = False
+
+        while self._buffer:
+            if self._pending_confirmations:
+                confirmation = self._starts_with_confirmation()
+                if confirmation is None:
+                    break
+                if confirmation:
+                    self._pending_confirmations -= 1
+                    self._buffer = self._buffer[1:]
+                    queued |= self._enqueue(
+                        SerialMessage("c", received=received, confirmation=True),
+                        force=True,
+                    )
+                    continue
+
+            if self._buffer[0] == FRAME_START:
+                message, size = decode_frame(self._buffer, received)
+                if size == 0:
+                    break
+
+                self._buffer = self._buffer[size:]
+                if message is not None:
+                    self._check_frame_sequence(message.values[0])
+                    queued |= self._enqueue(message)
+                else:
+                    self.corrupt_frames += 1
+                    logger.error("Received corrupt binary frame")
+                continue
+
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+
+            line = self._buffer[:end]
+            self._buffer = self._buffer[end + 1 :]
+            text = line.decode("utf-8", errors="replace").rstrip("\r")
+            self.received_lines += 1
+            queued |= self._enqueue(
+                SerialMessage.parse(text, self.parsers, received)
+            )
+
+        if queued and not self._notified:
+            self._notified = True
+            self.messages_available.emit()
+
+    def _check_frame_sequence(self, sequence: int) -> None:
+        """Count the frames that were lost before a frame.
+
+        Args:
+            sequence (int): The sequence number of the frame.
+        """
+        self.received_frames += 1
+        if self._frame_sequence is not None:
+            lost = (sequence - self._frame_sequence - 1) & 0xFFFF
+            if lost:
+                self.lost_frames += lost
+                logger.error("Lost %s binary frames before frame %s", lost, sequence)
+        self._frame_sequence = sequence
+
+    def _starts_with_confirmation(self) -> bool:
+        """Check if the buffer starts with the confirmation of a command. It is only called at the start of a line.
+
+        A confirmation is a single 'c'. The signal path lines 'ca' and 'cp' also start with a 'c', but are terminated by a newline.
+
+        Returns:
+            bool: True for a confirmation, False for a line and None if more data is needed to decide.
+        """
+        head = self._buffer[:4]
+        if head[:1] != b"c" or head == b"c":
+            return head == b"c"
+
+        for line in SIGNAL_PATH_LINES:
+            if head == line[: len(head)]:
+                return None if len(head) < len(line) else False
+            if head.startswith(line):
+                return False
+
+        return True
+
+    def _enqueue(self, message: SerialMessage, force: bool = False) -> bool:
+        """Add a message to the queue unless the queue is above the high-water mark.
+
+        Args:
+            message (SerialMessage): The message.
+            force (bool): Add the message regardless of the high-water mark. Used for confirmations.
+
+        Returns:
+            bool: True if the message was added.
+        """
+        if not force and len(self.queue) >= self.high_water_mark:
+            self.dropped_lines += 1
+            if self.dropped_lines == 1 or self.dropped_lines % 1000 == 0:
+                logger.warning(
+                    "Serial queue is full, dropped %s lines", self.dropped_lines
+                )
+            return False
+
+        self.queue.append(message)
+        return True
@@ -0,0 +1,436 @@
+"""Virtual ATM system on a pseudo-terminal.
+
+The simulator implements the commands of the ATM system firmware and answers in the same serial protocol.
+It models a probe coil that is tuned and matched either by varactor voltages or by stepper motors.
+The AutoTM module connects to the pseudo-terminal like to any other serial device, so sweeps and LUT generation can be run without hardware.
+
+Usage:
+    nqrduck-autotm-simulator --latency 0.01 --noise 2
+    # Make the device selectable in the connection settings
+    export NQRDUCK_AUTOTM_DEVICES=/dev/pts/<n>
+
+Like the firmware, the simulator has no command terminator. A command is everything that was received before the line was idle for a short gap.
+"""
+
+import argparse
+import logging
+import os
+import select
+import threading
+import time
+import tty
+import numpy as np
+from .model import S11Data
+from .serial_io import FRAME_VERSION, SWEEP_SAMPLE_DTYPE, encode_frame
+
+logger = logging.getLogger(__name__)
+
+
+class ResonantProbe:
+    """Model of a probe coil with a tuning and a matching element.
+
+    The tuning and matching are normalized to 0 to 1 over the range of the varactors or the stepper motors.
+    The tuning shifts the resonance frequency, the matching changes the coupling. The probe is matched at the resonance frequency
+    if the matching is at its optimum for that frequency.
+    """
+
+    RESONANCE_FREQUENCY = 83.56e6  # Hz, at tuning 0.5
+    TUNING_RANGE = 0.6  # relative shift of the resonance frequency over the full tuning range
+    MATCHING_RANGE = 0.5  # shift of the optimal matching per relative frequency change
+    QUALITY_FACTOR = 80
+    CABLE_DELAY = 15e-9  # s
+
+    def __init__(self, tuning: float = 0.5, matching: float = 0.5) -> None:
+        """Initialize the probe.
+
+        Args:
+            tuning (float): The normalized tuning.
+            matching (float): The normalized matching.
+        """
+        self.tuning = tuning
+        self.matching = matching
+
+    def resonance_frequency(self, tuning: float = None) -> float:
+        """Returns the resonance frequency in Hz for the tuning. Defaults to the current tuning."""
+        tuning = self.tuning if tuning is None else tuning
+        return self.RESONANCE_FREQUENCY * (1 + self.TUNING_RANGE * (tuning - 0.5))
+
+    def optimum(self, frequency: float) -> tuple:
+        """Returns the normalized tuning and matching that match the probe at the frequency.
+
+        Args:
+            frequency (float): The frequency in Hz.
+
+        Returns:
+            tuple: The tuning and the matching, clipped to the range of the elements.
+        """
+        relative = frequency / self.RESONANCE_FREQUENCY - 1
+        tuning = 0.5 + relative / self.TUNING_RANGE
+        matching = 0.5 + self.MATCHING_RANGE * relative
+        return float(np.clip(tuning, 0, 1)), float(np.clip(matching, 0, 1))
+
+    def gamma(self, frequency: np.ndarray) -> np.ndarray:
+        """Returns the reflection coefficient at the frequencies.
+
+        Args:
+            frequency (np.ndarray): The frequencies in Hz.
+
+        Returns:
+            np.ndarray: The complex reflection coefficients.
+        """
+        frequency = np.asarray(frequency, dtype=np.float64)
+        resonance_frequency = self.resonance_frequency()
+        _, optimal_matching = self.optimum(resonance_frequency)
+        coupling = np.exp(8 * (self.matching - optimal_matching))
+
+        detuning = frequency / resonance_frequency - resonance_frequency / frequency
+        gamma = (coupling - 1 - 1j * self.QUALITY_FACTOR * detuning) / (
+            coupling + 1 + 1j * self.QUALITY_FACTOR * detuning
+        )
+        return gamma * np.exp(-2j * np.pi * frequency * self.CABLE_DELAY)
+
+
+class VirtualATMDevice:
+    """This class implements the commands of the ATM system on a pseudo-terminal."""
+
+    MAX_VOLTAGE = 5  # V
+    # Steps of the stepper motors over the full range of the tuning and matching elements
+    TUNING_STEPS = 4000
+    MATCHING_STEPS = 20000
+    COMMAND_GAP = 0.005  # s
+    FRAME_SAMPLES = 64
+
+    def __init__(
+        self,
+        probe: ResonantProbe = None,
+        latency: float = 0.0,
+        noise: float = 2.0,
+        baudrate: int = 115200,
+        binary_frames: bool = True,
+        seed: int = None,
+    ) -> None:
+        """Initialize the virtual device.
+
+        Args:
+            probe (ResonantProbe): The simulated probe coil. Defaults to a probe at its center settings.
+            latency (float): The time in s the device needs to process a command before it answers.
+            noise (float): The standard deviation of the measured voltages in mV.
+            baudrate (int): The simulated baudrate the answers are paced at, 0 for no pacing.
+            binary_frames (bool): Support binary frames for the points of frequency sweeps.
+            seed (int): The seed of the measurement noise.
+        """
+        self.probe = ResonantProbe() if probe is None else probe
+        self.latency = latency
+        self.noise = noise
+        self.baudrate = baudrate
+        self.binary_frames = binary_frames
+        self.rng = np.random.default_rng(seed)
+
+        self.frame_mode = False
+        self.frame_sequence = 0
+        self.signal_path = "preamp"
+        self.last_directions = [1, 1]
+        self.commands = {
+            "f": self.frequency_sweep,
+            "s": self.voltage_sweep,
+            "p": self.position_sweep,
+            "r": self.reflection,
+            "v": self.set_voltages,
+            "c": self.switch_signal_path,
+            "m": self.move_stepper,
+            "h": self.homing,
+            "b": self.set_frame_mode,
+        }
+
+        self.master = None
+        self.slave = None
+        self.path = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def voltages(self) -> tuple:
+        """The tuning and matching voltages in V."""
+        return (
+            round(self.probe.tuning * self.MAX_VOLTAGE, 3),
+            round(self.probe.matching * self.MAX_VOLTAGE, 3),
+        )
+
+    @property
+    def positions(self) -> tuple:
+        """The tuning and matching stepper positions."""
+        return (
+            round(self.probe.tuning * self.TUNING_STEPS),
+            round(self.probe.matching * self.MATCHING_STEPS),
+        )
+
+    def open(self) -> str:
+        """Open the pseudo-terminal.
+
+        Returns:
+            str: The path of the device the AutoTM module connects to.
+        """
+        self.master, self.slave = os.openpty()
+        # The bytes are passed through unchanged, like on a USB serial device
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        logger.info("Virtual ATM system on %s", self.path)
+        return self.path
+
+    def start(self) -> str:
+        """Open the pseudo-terminal and serve it in a background thread.
+
+        Returns:
+            str: The path of the device.
+        """
+        path = self.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return path
+
+    def stop(self) -> None:
+        """Stop serving and close the pseudo-terminal."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def serve_forever(self) -> None:
+        """Read commands and answer them until stop is called."""
+        buffer = b""
+        last_received = 0.0
+        while not self._stop.is_set():
+            timeout = self.COMMAND_GAP if buffer else 0.1
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if readable:
+                buffer += os.read(self.master, 4096)
+                last_received = time.monotonic()
+            elif buffer and time.monotonic() - last_received >= self.COMMAND_GAP:
+                command = buffer.decode("utf-8", errors="replace")
+                buffer = b""
+                self.handle(command)
+
+    def write(self, data: bytes) -> None:
+        """Write to the pseudo-terminal at the speed of the simulated baudrate.
+
+        Args:
+            data (bytes): The data.
+        """
+        if self.baudrate:
+            # 8 data bits, a start and a stop bit per byte
+            time.sleep(len(data) * 10 / self.baudrate)
+        os.write(self.master, data)
+
+    def write_line(self, line: str) -> None:
+        """Write a line of the serial protocol.
+
+        Args:
+            line (str): The line without the line ending.
+        """
+        self.write(f"{line}\r\n".encode())
+
+    def handle(self, command: str) -> None:
+        """Confirm a command and answer it.
+
+        Args:
+            command (str): The command.
+        """
+        logger.debug("Received command %s", command)
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.write(b"c")
+        handler = self.commands.get(command[:1])
+        try:
+            if handler is None:
+                raise ValueError("Unknown command")
+            handler(command[1:])
+        except (ValueError, IndexError) as e:
+            self.write_line(f"eCould not process command {command}: {e}")
+
+    def measure(self, frequency: np.ndarray) -> tuple:
+        """Measure the return loss and phase voltages of the AD8302 at the frequencies.
+
+        Args:
+            frequency (np.ndarray): The frequencies in Hz.
+
+        Returns:
+            tuple: The return loss and the phase in mV.
+        """
+        gamma = self.probe.gamma(frequency)
+        # The return loss is positive, the host calculates |gamma| = 10 ** (-return_loss_db / 20)
+        return_loss_db = -20 * np.log10(np.abs(gamma) + 1e-6)
+        noise = self.rng.normal(0, self.noise, (2, len(gamma)))
+        return_loss_mv = (
+            S11Data.CENTER_POINT_MAGNITUDE
+            + S11Data.MAGNITUDE_SLOPE * return_loss_db
+            + noise[0]
+        )
+        phase_mv = (
+            S11Data.CENTER_POINT_PHASE
+            + S11Data.PHASE_SLOPE * np.abs(np.degrees(np.angle(gamma)))
+            + noise[1]
+        )
+        return np.clip(return_loss_mv, 0, 1800), np.clip(phase_mv, 0, 1800)
+
+    def frequency_sweep(self, arguments: str) -> None:
+        """Sweep the frequency. Format is f<start>f<stop>f<step> in Hz."""
+        start, stop, step = map(float, arguments.split("f"))
+        n_points = int(round((stop - start) / step)) + 1
+        frequency = start + step * np.arange(n_points)
+        return_loss_mv, phase_mv = self.measure(frequency)
+
+        if self.frame_mode:
+            samples = np.empty(n_points, dtype=SWEEP_SAMPLE_DTYPE)
+            samples["frequency"] = np.round(frequency)
+            samples["return_loss"] = np.round(return_loss_mv)
+            samples["phase"] = np.round(phase_mv)
+            for first in range(0, n_points, self.FRAME_SAMPLES):
+                self.write(
+                    encode_frame(
+                        self.frame_sequence,
+                        samples[first : first + self.FRAME_SAMPLES],
+                    )
+                )
+                self.frame_sequence = (self.frame_sequence + 1) & 0xFFFF
+        else:
+            for f, return_loss, phase in zip(frequency, return_loss_mv, phase_mv):
+                self.write_line(f"f{f:.1f}r{return_loss:.1f}p{phase:.1f}")
+
+        self.write_line("r")
+
+    def voltage_sweep(self, arguments: str) -> None:
+        """Find the tuning and matching voltages for a frequency. Format is s<frequency in MHz>o<tuning>o<matching>."""
+        frequency = float(arguments.split("o")[0]) * 1e6
+        self.probe.tuning, self.probe.matching = self.probe.optimum(frequency)
+        self.write_line("v{}t{}".format(*self.voltages))
+
+    def position_sweep(self, arguments: str) -> None:
+        """Find the stepper positions for a frequency within a range around the current positions.
+
+        Format is p<frequency in MHz>t<range>,<step size>,<backlash>,<last direction>m<range>,<step size>,<backlash>,<last direction>.
+        """
+        frequency, settings = arguments.split("t")
+        tuning_settings, matching_settings = settings.split("m")
+        tuning_range = int(tuning_settings.split(",")[0])
+        matching_range = int(matching_settings.split(",")[0])
+
+        optimum = self.probe.optimum(float(frequency) * 1e6)
+        positions = []
+        for index, (current, target, steps, search_range) in enumerate(
+            zip(
+                self.positions,
+                optimum,
+                (self.TUNING_STEPS, self.MATCHING_STEPS),
+                (tuning_range, matching_range),
+            )
+        ):
+            position = int(
+                np.clip(
+                    round(target * steps),
+                    current - search_range,
+                    current + search_range,
+                )
+            )
+            if position != current:
+                self.last_directions[index] = 1 if position > current else -1
+            positions.append(position)
+
+        self.probe.tuning = positions[0] / self.TUNING_STEPS
+        self.probe.matching = positions[1] / self.MATCHING_STEPS
+        tuning_direction, matching_direction = self.last_directions
+        self.write_line(
+            f"z{positions[0]},{tuning_direction}m{positions[1]},{matching_direction}"
+        )
+
+    def reflection(self, arguments: str) -> None:
+        """Measure the reflection at a frequency. Format is r<frequency in MHz>."""
+        return_loss_mv, phase_mv = self.measure(np.array([float(arguments) * 1e6]))
+        self.write_line(f"m{return_loss_mv[0]:.1f}p{phase_mv[0]:.1f}")
+
+    def set_voltages(self, arguments: str) -> None:
+        """Set the tuning and matching voltages. Format is v<tuning>v<matching> in V."""
+        tuning_voltage, matching_voltage = map(float, arguments.split("v"))
+        self.probe.tuning = np.clip(tuning_voltage / self.MAX_VOLTAGE, 0, 1)
+        self.probe.matching = np.clip(matching_voltage / self.MAX_VOLTAGE, 0, 1)
+        self.write_line("v{}t{}".format(*self.voltages))
+
+    def switch_signal_path(self, arguments: str) -> None:
+        """Switch the signal path. Format is ca for the ATM system and cp for the preamplifier."""
+        if arguments not in ("a", "p"):
+            raise ValueError("Unknown signal path")
+        self.signal_path = "atm" if arguments == "a" else "preamp"
+        self.write_line(f"c{arguments}")
+
+    def move_stepper(self, arguments: str) -> None:
+        """Move a stepper motor. Format is m<t or m><steps>,<backlash>."""
+        steps = int(arguments[1:].split(",")[0])
+        tuning_position, matching_position = self.positions
+        if arguments[0] == "t":
+            tuning_position += steps
+        elif arguments[0] == "m":
+            matching_position += steps
+        else:
+            raise ValueError("Unknown stepper")
+
+        self.probe.tuning = tuning_position / self.TUNING_STEPS
+        self.probe.matching = matching_position / self.MATCHING_STEPS
+        self.write_line(f"p{tuning_position}m{matching_position}")
+
+    def homing(self, arguments: str) -> None:
+        """Move both stepper motors to their home position. Format is h."""
+        self.probe.tuning = self.probe.matching = 0
+        self.last_directions = [1, 1]
+        self.write_line("p0m0")
+
+    def set_frame_mode(self, arguments: str) -> None:
+        """Switch frequency sweeps to binary frames. Format is b<version>."""
+        self.frame_mode = self.binary_frames and int(arguments) == FRAME_VERSION
+        self.write_line(f"b{FRAME_VERSION if self.frame_mode else 0}")
+
+
+def main() -> None:
+    """Run the virtual ATM system until it is interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Command latency in s"
+    )
+    parser.add_argument(
+        "--noise", type=float, default=2.0, help="Measurement noise in mV"
+    )
+    parser.add_argument(
+        "--baudrate",
+        type=int,
+        default=115200,
+        help="Simulated baudrate, 0 for no pacing",
+    )
+    parser.add_argument(
+        "--no-binary-frames", action="store_true", help="Only send text lines"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the noise")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    device = VirtualATMDevice(
+        latency=arguments.latency,
+        noise=arguments.noise,
+        baudrate=arguments.baudrate,
+        binary_frames=not arguments.no_binary_frames,
+        seed=arguments.seed,
+    )
+    print(device.open(), flush=True)
+    try:
+        device.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.stop()
+
+
+if __name__ == "__main__":
+    main()
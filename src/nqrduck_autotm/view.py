@@ -2,8 +2,6 @@
 
 import logging
 from datetime import datetime
-import cmath
-from PyQt6.QtSerialPort import QSerialPort
 from PyQt6.QtWidgets import (
     QWidget,
     QLabel,
@@ -12,6 +10,7 @@ from PyQt6.QtWidgets import (
     QHBoxLayout,
     QLineEdit,
     QPushButton,
+    QSpinBox,
     QDialog,
     QFileDialog,
     QTableWidget,
@@ -24,6 +23,7 @@ from nqrduck.assets.icons import Logos
 from nqrduck.assets.animations import DuckAnimations
 from .widget import Ui_Form
 from .model import S11Data
+from .serial_io import SerialReader
 
 logger = logging.getLogger(__name__)
 
@@ -59,9 +59,28 @@ class AutoTMView(ModuleView):
         # Connect the serial changed signal to the on_serial_changed slot
         self.module.model.serial_changed.connect(self.on_serial_changed)
 
+        # The progress of a frequency sweep is shown in the spinner dialog
+        self.module.model.data_points_added.connect(self.on_data_points_added)
+
         # On clicking of the connect button call the connect method
         self._ui_form.connectButton.clicked.connect(self.on_connect_button_clicked)
 
+        # The latencies of the commands are shown in a dialog
+        self.latency_button = QPushButton("Command Latency")
+        self._ui_form.verticalLayout_2.insertWidget(
+            self._ui_form.verticalLayout_2.indexOf(self._ui_form.connectButton) + 1,
+            self.latency_button,
+        )
+        self.latency_button.clicked.connect(self.view_command_latency)
+
+        # A recording of the serial traffic is replayed without a connection
+        self.replay_button = QPushButton("Replay Session")
+        self._ui_form.verticalLayout_2.insertWidget(
+            self._ui_form.verticalLayout_2.indexOf(self.latency_button) + 1,
+            self.replay_button,
+        )
+        self.replay_button.clicked.connect(self.on_replay_button_clicked)
+
         # On clicking of the start button call the start_frequency_sweep method
         self._ui_form.startButton.clicked.connect(
             lambda: self.module.controller.start_frequency_sweep(
@@ -233,12 +252,12 @@ class AutoTMView(ModuleView):
         selected_device = self._ui_form.portBox.currentText()
         self.module.controller.handle_connection(selected_device)
 
-    @pyqtSlot(QSerialPort)
-    def on_serial_changed(self, serial: QSerialPort) -> None:
+    @pyqtSlot(object)
+    def on_serial_changed(self, serial: SerialReader) -> None:
         """Update the serial 'connectionLabel' according to the current serial connection.
 
         Args:
-        serial (serial.Serial): The current serial connection.
+        serial (SerialReader): The current serial connection.
         """
         logger.debug("Updating serial connection label")
         if serial.isOpen():
@@ -300,8 +319,6 @@ class AutoTMView(ModuleView):
         return_loss_db = data.return_loss_db
         phase = data.phase_deg
 
-        gamma = data.gamma
-
         self._ui_form.S11Plot.canvas.ax.clear()
 
         magnitude_ax = self._ui_form.S11Plot.canvas.ax
@@ -311,20 +328,10 @@ class AutoTMView(ModuleView):
         logger.debug("Shape of phase: %s", phase.shape)
 
         # Calibration for visualization happens here.
-        if self.module.model.calibration is not None:
-            calibration = self.module.model.calibration
-            e_00 = calibration[0]
-            e11 = calibration[1]
-            delta_e = calibration[2]
-
-            gamma_corr = [
-                (data_point - e_00[i]) / (data_point * e11[i] - delta_e[i])
-                for i, data_point in enumerate(gamma)
-            ]
-
-            return_loss_db_corr = [
-                -20 * cmath.log10(abs(g + 1e-12)) for g in gamma_corr
-            ]
+        # It can only be applied if it has been calculated for the frequency grid of the data
+        calibration = self.module.model.calibration
+        if calibration is not None and calibration.covers(frequency):
+            _, return_loss_db_corr = calibration.apply(data)
             magnitude_ax.plot(frequency, return_loss_db_corr, color="red")
 
         else:
@@ -392,6 +399,19 @@ class AutoTMView(ModuleView):
             self._ui_form.scrollArea.verticalScrollBar().maximum()
         )
 
+    @pyqtSlot(list)
+    def on_data_points_added(self, data_points: list) -> None:
+        """Update the progress of the frequency sweep spinner dialog.
+
+        Args:
+            data_points (list): The data points that were added since the last update.
+        """
+        if self.frequency_sweep_spinner.isVisible():
+            self.frequency_sweep_spinner.set_progress(
+                len(self.module.model.data_points),
+                self.module.model.expected_data_points,
+            )
+
     def create_frequency_sweep_spinner_dialog(self) -> None:
         """Creates a frequency sweep spinner dialog."""
         self.frequency_sweep_spinner = self.LoadingSpinner(
@@ -431,6 +451,24 @@ class AutoTMView(ModuleView):
         self.lut_window = self.LutWindow(self.module)
         self.lut_window.show()
 
+    def view_command_latency(self) -> None:
+        """Creates a new Dialog that shows the round-trip latencies of the commands."""
+        logger.debug("View command latency")
+        self.latency_window = self.LatencyWindow(self.module)
+        self.latency_window.show()
+
+    @pyqtSlot()
+    def on_replay_button_clicked(self) -> None:
+        """Slot for when the replay button is clicked. The selected recording is replayed as fast as possible."""
+        logger.debug("Replay button clicked")
+        filedialog = QFileDialog()
+        filedialog.setAcceptMode(QFileDialog.AcceptMode.AcceptOpen)
+        filedialog.setNameFilter("recordings (*.rec)")
+        if filedialog.exec():
+            filename = filedialog.selectedFiles()[0]
+            logger.debug(f"Replaying {filename}")
+            self.module.controller.replay_session(filename, speed=0)
+
     @pyqtSlot()
     def on_export_button_clicked(self) -> None:
         """Slot for when the export button is clicked."""
@@ -662,12 +700,25 @@ class AutoTMView(ModuleView):
             self.spinner_label = QLabel(self)
             self.spinner_label.setMovie(self.spinner_movie)
 
+            self.text = text
+            self.text_label = QLabel(text)
+
             self.layout = QVBoxLayout(self)
-            self.layout.addWidget(QLabel(text))
+            self.layout.addWidget(self.text_label)
             self.layout.addWidget(self.spinner_label)
 
             self.spinner_movie.start()
 
+        def set_progress(self, done: int, total: int = None) -> None:
+            """Show the progress below the text of the spinner.
+
+            Args:
+                done (int): The number of finished steps.
+                total (int, optional): The total number of steps. Defaults to None if it is unknown.
+            """
+            progress = f"{done}" if total is None else f"{done} / {total}"
+            self.text_label.setText(f"{self.text}\n{progress}")
+
     class LutWindow(QDialog):
         """This class implements a window that shows the LUT."""
         def __init__(self, module, parent=None):
@@ -754,6 +805,75 @@ class AutoTMView(ModuleView):
                 matching_voltage = str(self.module.model.LUT.data[frequency][0])
                 self.module.controller.set_voltages(tuning_voltage, matching_voltage)
 
+    class LatencyWindow(QDialog):
+        """This class implements a window that shows the round-trip latencies of the commands."""
+        def __init__(self, module, parent=None):
+            """Initializes the LatencyWindow."""
+            super().__init__()
+            self.module = module
+            self.setParent(parent)
+            self.setWindowTitle("Command Latency")
+
+            self.resize(900, 400)
+
+            main_layout = QVBoxLayout()
+
+            latency = self.module.controller.command_latency
+            self.table_widget = QTableWidget()
+            self.table_widget.setColumnCount(5 + len(latency.PERCENTILES))
+            self.table_widget.setHorizontalHeaderLabels(
+                ["Command", "Stage", "Count", "Min (ms)", "Mean (ms)"]
+                + [f"p{percentile:g} (ms)" for percentile in latency.PERCENTILES]
+                + ["Max (ms)"]
+            )
+            main_layout.addWidget(self.table_widget)
+
+            button_layout = QHBoxLayout()
+            refresh_button = QPushButton("Refresh")
+            refresh_button.clicked.connect(self.on_refresh_button_clicked)
+            button_layout.addWidget(refresh_button)
+
+            reset_button = QPushButton("Reset")
+            reset_button.clicked.connect(self.on_reset_button_clicked)
+            button_layout.addWidget(reset_button)
+
+            export_button = QPushButton("Export CSV")
+            export_button.clicked.connect(self.on_export_button_clicked)
+            button_layout.addWidget(export_button)
+            main_layout.addLayout(button_layout)
+
+            self.setLayout(main_layout)
+            self.on_refresh_button_clicked()
+
+        def on_refresh_button_clicked(self) -> None:
+            """This method is called when the Refresh button is clicked. It shows the current latencies."""
+            summary = self.module.controller.command_latency.summary()
+            self.table_widget.setRowCount(len(summary))
+            for row, (letter, stage, count, *latencies) in enumerate(summary):
+                self.table_widget.setItem(row, 0, QTableWidgetItem(letter))
+                self.table_widget.setItem(row, 1, QTableWidgetItem(stage))
+                self.table_widget.setItem(row, 2, QTableWidgetItem(str(count)))
+                for column, value in enumerate(latencies, start=3):
+                    self.table_widget.setItem(
+                        row, column, QTableWidgetItem(f"{value * 1e3:.3f}")
+                    )
+
+        def on_reset_button_clicked(self) -> None:
+            """This method is called when the Reset button is clicked. It clears the latencies."""
+            self.module.controller.command_latency.reset()
+            self.on_refresh_button_clicked()
+
+        def on_export_button_clicked(self) -> None:
+            """This method is called when the Export CSV button is clicked."""
+            filedialog = QFileDialog()
+            filedialog.setAcceptMode(QFileDialog.AcceptMode.AcceptSave)
+            filedialog.setNameFilter("CSV files (*.csv)")
+            filedialog.setDefaultSuffix("csv")
+            if filedialog.exec():
+                filename = filedialog.selectedFiles()[0]
+                logger.debug(f"Exporting command latency to {filename}")
+                self.module.controller.export_command_latency(filename)
+
     class CalibrationWindow(QDialog):
         """The calibration Dialog."""
         def __init__(self, module, parent=None):
@@ -779,6 +899,14 @@ class AutoTMView(ModuleView):
             frequency_layout.addWidget(stop_edit)
             unit_label = QLabel("MHz")
             frequency_layout.addWidget(unit_label)
+            # Number of sweeps that are averaged per standard
+            averages_label = QLabel("Averages")
+            frequency_layout.addWidget(averages_label)
+            averages_spinbox = QSpinBox()
+            averages_spinbox.setRange(1, 100)
+            averages_spinbox.setValue(self.module.model.calibration_averages)
+            averages_spinbox.valueChanged.connect(self.on_averages_changed)
+            frequency_layout.addWidget(averages_spinbox)
             frequency_layout.addStretch()
 
             # Add horizontal layout for the calibration type
@@ -837,6 +965,10 @@ class AutoTMView(ModuleView):
             import_button = QPushButton("Import")
             import_button.clicked.connect(self.on_import_button_clicked)
             data_layout.addWidget(import_button)
+            # Standard definitions button
+            standards_button = QPushButton("Load standard definitions")
+            standards_button.clicked.connect(self.on_standards_button_clicked)
+            data_layout.addWidget(standards_button)
             # Apply button
             apply_button = QPushButton("Apply calibration")
             apply_button.clicked.connect(self.on_apply_button_clicked)
@@ -857,6 +989,10 @@ class AutoTMView(ModuleView):
                 self.on_load_calibration_finished
             )
 
+        def on_averages_changed(self, averages: int) -> None:
+            """This method is called when the number of averages per standard has been changed."""
+            self.module.model.calibration_averages = averages
+
         def on_short_calibration_finished(self, short_calibration: "S11Data") -> None:
             """This method is called when the short calibration has finished. It plots the calibration data on the short_plot widget."""
             self.on_calibration_finished("short", self.short_plot, short_calibration)
@@ -893,6 +1029,19 @@ class AutoTMView(ModuleView):
             magnitude_ax.set_title("S11")
             magnitude_ax.grid(True)
             magnitude_ax.plot(frequency, return_loss_db, color="blue")
+
+            # The standard deviation of averaged standards shows where more averaging is needed
+            variance = self.module.model.standard_variances.get(type)
+            if variance is not None and variance.shape[1] == len(frequency):
+                deviation_db = variance[0] ** 0.5 / data.MAGNITUDE_SLOPE
+                magnitude_ax.fill_between(
+                    frequency,
+                    return_loss_db - deviation_db,
+                    return_loss_db + deviation_db,
+                    color="blue",
+                    alpha=0.2,
+                )
+
             # make the y axis go down instead of up
             magnitude_ax.invert_yaxis()
 
@@ -921,8 +1070,19 @@ class AutoTMView(ModuleView):
             logger.debug(f"Importing calibration from {filename}")
             self.module.controller.import_calibration(filename)
 
+        def on_standards_button_clicked(self) -> None:
+            """This method is called when the standard definitions button is clicked."""
+            filedialog = QFileDialog()
+            filedialog.setAcceptMode(QFileDialog.AcceptMode.AcceptOpen)
+            filedialog.setNameFilter("standard definitions (*.json)")
+            filedialog.setDefaultSuffix("json")
+            filedialog.exec()
+            filename = filedialog.selectedFiles()[0]
+            logger.debug(f"Loading standard definitions from {filename}")
+            self.module.controller.load_standard_definitions(filename)
+
         def on_apply_button_clicked(self) -> None:
             """This method is called when the apply button is clicked."""
-            self.module.controller.calculate_calibration()
+            self.module.controller.calculate_calibration_in_background()
             # Close the calibration window
             self.close()
@@ -0,0 +1,51 @@
+"""Background workers of the AutoTM module.
+
+Calculations on large sweeps, like the calibration and the processing of a measurement, are run in the Qt thread pool.
+This way the GUI thread stays free to read the serial connection and to render.
+"""
+
+import logging
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerSignals(QObject):
+    """The signals of a worker. QRunnable is not a QObject, so the signals are defined in a separate class."""
+
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    """This class is used to run a function in the thread pool and to return its result by signal.
+
+    The function must not access Qt widgets. The signals are delivered to the GUI thread.
+    """
+
+    def __init__(self, function, *args, **kwargs) -> None:
+        """Initialize the worker.
+
+        Args:
+            function (callable): The function to run in the background.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+        """
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self) -> None:
+        """Run the function. This method is called by the thread pool."""
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            logger.exception("Background calculation failed")
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
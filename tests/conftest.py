@@ -0,0 +1,15 @@
+"""Shared fixtures for the tests of the AutoTM module."""
+
+import os
+import pytest
+from PyQt6.QtWidgets import QApplication
+
+# The timers and event loops of the tests need a QApplication, no display is needed
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+APP = QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def qapp():
+    """The QApplication that runs the event loop of the tests."""
+    return APP
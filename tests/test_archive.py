@@ -0,0 +1,87 @@
+"""Tests for the append-only sweep archive."""
+
+import numpy as np
+import pytest
+from nqrduck_autotm.archive import SweepArchive
+from nqrduck_autotm.model import S11Data
+
+
+def make_sweep(start: float, stop: float, n_points: int = 11) -> S11Data:
+    """A sweep with a recognizable return loss."""
+    frequency = np.linspace(start, stop, n_points)
+    return S11Data.from_arrays(
+        frequency, np.full(n_points, start / 1e6), np.arange(n_points, dtype=float)
+    )
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """An archive with three sweeps at the times 10, 20 and 30."""
+    archive = SweepArchive(tmp_path)
+    archive.append(make_sweep(80e6, 90e6), timestamp=10, lut_entry=(1.0, 2.0))
+    archive.append(make_sweep(100e6, 110e6), timestamp=20)
+    archive.append(make_sweep(120e6, 130e6), timestamp=30)
+    return archive
+
+
+def test_append_and_read_back(archive):
+    (record,) = archive.query(start_time=10, stop_time=10)
+    assert record.timestamp == 10
+    assert (record.tuning, record.matching) == (1.0, 2.0)
+    assert (record.start_frequency, record.stop_frequency) == (80e6, 90e6)
+    np.testing.assert_array_equal(record.data.frequency, np.linspace(80e6, 90e6, 11))
+    np.testing.assert_array_equal(record.data.phase_mv, np.arange(11))
+
+
+def test_unknown_lut_entry_is_nan(archive):
+    (record,) = archive.query(start_time=20, stop_time=20)
+    assert np.isnan(record.tuning) and np.isnan(record.matching)
+
+
+def test_query_by_time(archive):
+    assert [r.timestamp for r in archive.query()] == [10, 20, 30]
+    assert [r.timestamp for r in archive.query(start_time=15)] == [20, 30]
+    assert [r.timestamp for r in archive.query(stop_time=20)] == [10, 20]
+    assert archive.query(start_time=31) == []
+
+
+def test_query_by_frequency_window(archive):
+    records = archive.query(start_frequency=105e6, stop_frequency=125e6)
+    assert [r.timestamp for r in records] == [20, 30]
+    assert [r.timestamp for r in archive.query(stop_frequency=85e6)] == [10]
+
+
+def test_reopen_reads_index(archive, tmp_path):
+    reopened = SweepArchive(tmp_path)
+    assert len(reopened) == 3
+    assert reopened.sorted
+    assert [r.timestamp for r in reopened.query(start_time=20)] == [20, 30]
+
+
+def test_partial_index_entry_is_ignored(archive, tmp_path):
+    with open(archive.index_file, "ab") as f:
+        f.write(b"\x00" * 7)
+    reopened = SweepArchive(tmp_path)
+    assert len(reopened) == 3
+
+    # The next entry is appended where the partial entry started
+    reopened.append(make_sweep(140e6, 150e6), timestamp=40)
+    records = SweepArchive(tmp_path).query(start_time=30)
+    assert [record.timestamp for record in records] == [30, 40]
+    assert records[1].start_frequency == 140e6
+    np.testing.assert_array_equal(records[1].data.return_loss_mv, np.full(11, 140.0))
+
+
+def test_out_of_order_append_clears_sorted(archive, tmp_path):
+    assert archive.sorted
+    archive.append(make_sweep(140e6, 150e6), timestamp=15)
+    assert not archive.sorted
+    assert [r.timestamp for r in archive.query(start_time=12)] == [15, 20, 30]
+    assert not SweepArchive(tmp_path).sorted
+
+
+def test_empty_sweep(tmp_path):
+    archive = SweepArchive(tmp_path)
+    archive.append(S11Data.from_arrays(*np.empty((3, 0))), timestamp=1)
+    (record,) = archive.query()
+    assert len(record.data.frequency) == 0
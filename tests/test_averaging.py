@@ -0,0 +1,83 @@
+"""Tests for the averaging of repeated frequency sweeps."""
+
+import numpy as np
+import pytest
+from nqrduck_autotm.model import S11Data, SweepAverager
+
+N_SWEEPS = 7
+N_POINTS = 40
+
+
+@pytest.fixture
+def sweeps():
+    """Noisy sweeps on the same frequency grid with the shape (K, 2, N)."""
+    rng = np.random.default_rng(0)
+    readings = rng.normal(900, 25, (N_SWEEPS, 2, N_POINTS))
+    # A large offset makes a naive sum of squares lose precision
+    readings[:, 1] += 1e6
+    return readings
+
+
+def add_sweeps(averager: SweepAverager, readings: np.ndarray) -> None:
+    """Add the sweeps to the averager."""
+    frequency = np.linspace(50e6, 60e6, N_POINTS)
+    for return_loss_mv, phase_mv in readings:
+        averager.add(S11Data.from_arrays(frequency, return_loss_mv, phase_mv))
+
+
+def test_mean_and_variance(sweeps):
+    averager = SweepAverager(N_SWEEPS)
+    add_sweeps(averager, sweeps)
+
+    assert averager.finished and averager.count == N_SWEEPS
+    mean = averager.mean
+    np.testing.assert_allclose(mean.return_loss_mv, np.mean(sweeps[:, 0], axis=0))
+    np.testing.assert_allclose(mean.phase_mv, np.mean(sweeps[:, 1], axis=0))
+    np.testing.assert_array_equal(mean.frequency, np.linspace(50e6, 60e6, N_POINTS))
+    np.testing.assert_allclose(
+        averager.variance, np.var(sweeps, axis=0, ddof=1), rtol=1e-9
+    )
+
+
+def test_added_sweeps_are_not_modified(sweeps):
+    original = sweeps.copy()
+    averager = SweepAverager(N_SWEEPS)
+    add_sweeps(averager, sweeps)
+    np.testing.assert_array_equal(sweeps, original)
+
+
+def test_single_sweep_has_no_variance(sweeps):
+    averager = SweepAverager()
+    add_sweeps(averager, sweeps[:1])
+
+    assert averager.finished
+    np.testing.assert_array_equal(averager.mean.return_loss_mv, sweeps[0, 0])
+    assert averager.variance.shape == (2, N_POINTS)
+    assert np.isnan(averager.variance).all()
+
+
+def test_frequency_grid_mismatch(sweeps):
+    averager = SweepAverager(N_SWEEPS)
+    add_sweeps(averager, sweeps[:2])
+
+    shifted = S11Data.from_arrays(
+        np.linspace(50e6, 60e6, N_POINTS) + 1, sweeps[2, 0], sweeps[2, 1]
+    )
+    with pytest.raises(ValueError):
+        averager.add(shifted)
+    shorter = S11Data.from_arrays(
+        np.linspace(50e6, 60e6, N_POINTS - 1), sweeps[2, 0, 1:], sweeps[2, 1, 1:]
+    )
+    with pytest.raises(ValueError):
+        averager.add(shorter)
+
+    # The rejected sweeps aren't part of the average
+    assert averager.count == 2 and not averager.finished
+    np.testing.assert_allclose(
+        averager.mean.return_loss_mv, np.mean(sweeps[:2, 0], axis=0)
+    )
+
+
+def test_at_least_one_sweep():
+    with pytest.raises(ValueError):
+        SweepAverager(0)
@@ -0,0 +1,258 @@
+"""Tests for the short, open and load calibration."""
+
+import json
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from nqrduck_autotm.controller import AutoTMController
+from nqrduck_autotm.model import Calibration, CalibrationStandard, S11Data
+
+N_POINTS = 200
+
+
+def s11_from_gamma(frequency: np.ndarray, gamma: np.ndarray) -> S11Data:
+    """The S11 data that the ATM system reports for the given reflection coefficients."""
+    return_loss_mv = S11Data.CENTER_POINT_MAGNITUDE - S11Data.MAGNITUDE_SLOPE * 20 * np.log10(
+        np.abs(gamma)
+    )
+    phase_deg = np.degrees(np.angle(gamma))
+    phase_mv = S11Data.CENTER_POINT_PHASE + S11Data.PHASE_SLOPE * np.abs(phase_deg)
+    return S11Data.from_arrays(frequency, return_loss_mv, phase_mv, phase_deg=phase_deg)
+
+
+@pytest.fixture
+def error_terms():
+    """Smooth, frequency dependent error terms of a reflectometer."""
+    frequency = np.linspace(50e6, 100e6, N_POINTS)
+    x = np.linspace(0, 1, N_POINTS)
+    e_00 = 0.1 * np.exp(2j * np.pi * x)
+    e_11 = 0.2 * np.exp(-1j * np.pi * x)
+    e_01_e_10 = 0.8 * np.exp(0.5j * np.pi * x)
+    return frequency, e_00, e_11, e_00 * e_11 - e_01_e_10
+
+
+def measure(error_terms, actual_gamma) -> S11Data:
+    """Measure a device with the given actual reflection coefficients through the error model."""
+    frequency, e_00, e_11, delta_e = error_terms
+    measured = (e_00 - delta_e * actual_gamma) / (1 - e_11 * actual_gamma)
+    return s11_from_gamma(frequency, measured)
+
+
+def per_point_solution(short: S11Data, open: S11Data, load: S11Data) -> np.ndarray:
+    """The per-point least squares solution the batched solve replaced."""
+    terms = []
+    for gamma_s, gamma_o, gamma_l in zip(short.gamma, open.gamma, load.gamma):
+        A = np.array(
+            [
+                [1, -1 * gamma_s, 1],
+                [1, 1 * gamma_o, -1],
+                [1, 0 * gamma_l, 0],
+            ]
+        )
+        B = np.array([gamma_s, gamma_o, gamma_l])
+        terms.append(np.linalg.lstsq(A, B, rcond=None)[0])
+    return np.array(terms).T
+
+
+@pytest.fixture
+def standards(error_terms):
+    """The measured short, open and load standards."""
+    ones = np.ones(N_POINTS)
+    return tuple(measure(error_terms, ideal * ones) for ideal in (-1, 1, 0))
+
+
+def test_batched_solve_matches_per_point_solve(error_terms, standards):
+    calibration = Calibration.from_standards(error_terms[0], *standards)
+    e_00, e_11, delta_e = per_point_solution(*standards)
+    np.testing.assert_allclose(calibration.e_00, e_00, atol=1e-12)
+    np.testing.assert_allclose(calibration.e_11, e_11, atol=1e-12)
+    np.testing.assert_allclose(calibration.delta_e, delta_e, atol=1e-12)
+
+
+def test_solve_recovers_error_terms(error_terms, standards):
+    frequency, e_00, e_11, delta_e = error_terms
+    calibration = Calibration.from_standards(frequency, *standards)
+    np.testing.assert_allclose(calibration.e_00, e_00, atol=1e-9)
+    np.testing.assert_allclose(calibration.e_11, e_11, atol=1e-9)
+    np.testing.assert_allclose(calibration.delta_e, delta_e, atol=1e-9)
+
+
+def test_correct_recovers_actual_reflection(error_terms, standards):
+    calibration = Calibration.from_standards(error_terms[0], *standards)
+    actual = 0.3 * np.exp(1j * np.linspace(-3, 3, N_POINTS))
+    corrected = calibration.correct(measure(error_terms, actual).gamma)
+    np.testing.assert_allclose(corrected, actual, atol=1e-9)
+
+
+def test_indistinguishable_standards_raise(error_terms, standards):
+    short, _, load = standards
+    with pytest.raises(ValueError):
+        Calibration.from_standards(error_terms[0], short, short, load)
+
+
+def test_processing_does_not_touch_the_model(error_terms, standards):
+    frequency = error_terms[0]
+    calibration = Calibration.from_standards(frequency, *standards)
+    model = SimpleNamespace(
+        short_calibration=standards[0],
+        open_calibration=standards[1],
+        load_calibration=standards[2],
+        calibration=calibration,
+        standard_variances={},
+        standard_definitions=None,
+    )
+    controller = AutoTMController(SimpleNamespace(model=model, view=None))
+
+    # The measurement is on another frequency grid, so the calibration is recalculated
+    actual = 0.3 * np.exp(1j * np.linspace(-3, 3, N_POINTS))
+    measured = measure(error_terms, actual)
+    measurement = S11Data.from_arrays(*(column[::2] for column in measured.millivolts))
+    inputs = controller.get_processing_inputs(measurement, key=("sweep",))
+
+    model_caches = [dict(data._cache) for data in (measurement, *standards)]
+    result = AutoTMController.process_measurement(*inputs)
+    assert [data._cache for data in (measurement, *standards)] == model_caches
+
+    processed, key, source, matched, changed, error, sequence = result
+    assert processed is not measurement
+    assert key == ("sweep",)
+    assert source is calibration
+    assert changed and error is None
+    assert sequence == 1
+    np.testing.assert_array_equal(matched.frequency, measurement.frequency)
+
+
+def test_stale_measurement_is_dropped(error_terms, standards):
+    frequency = error_terms[0]
+    model = SimpleNamespace(calibration=None, measurement=None)
+    controller = AutoTMController(SimpleNamespace(model=model, view=None))
+    older = controller.get_processing_inputs(measure(error_terms, np.zeros(N_POINTS)))
+    newer = controller.get_processing_inputs(standards[0])
+
+    # The newer measurement finishes first, the older result must not replace it
+    controller.on_measurement_processed(AutoTMController.process_measurement(*newer))
+    assert model.measurement is newer[0]
+    controller.on_measurement_processed(AutoTMController.process_measurement(*older))
+    assert model.measurement is newer[0]
+
+    latest = controller.get_processing_inputs(standards[1])
+    controller.on_measurement_processed(AutoTMController.process_measurement(*latest))
+    assert model.measurement is latest[0]
+    np.testing.assert_array_equal(model.measurement.frequency, frequency)
+
+
+def test_read_reflection_is_not_calibrated(error_terms, standards):
+    model = SimpleNamespace(
+        calibration=Calibration.from_standards(error_terms[0], *standards),
+        last_reflection=None,
+    )
+    controller = AutoTMController(SimpleNamespace(model=model, view=None))
+
+    def send_command(command):
+        assert command == "r75.0"
+        model.last_reflection = (960.0, 300.0)
+        return None
+
+    controller.send_command = send_command
+    assert controller.read_reflection(75.0) == -2.0
+
+
+def test_ideal_standards():
+    frequency = np.linspace(50e6, 100e6, 11)
+    short, open_standard, load = (CalibrationStandard(kind) for kind in CalibrationStandard.KINDS)
+    np.testing.assert_allclose(short.evaluate(frequency), -1)
+    np.testing.assert_allclose(open_standard.evaluate(frequency), 1)
+    np.testing.assert_allclose(load.evaluate(frequency), 0)
+
+
+def test_offset_delay_rotates_the_phase():
+    frequency = np.linspace(50e6, 100e6, 11)
+    delay = 30e-12
+    short = CalibrationStandard("short", delay=delay)
+    gamma = short.evaluate(frequency)
+    np.testing.assert_allclose(gamma, -np.exp(-4j * np.pi * frequency * delay))
+    np.testing.assert_allclose(np.abs(gamma), 1)
+
+
+def test_terminating_elements():
+    frequency = np.linspace(50e6, 100e6, 11)
+    omega = 2 * np.pi * frequency
+    z0 = CalibrationStandard.REFERENCE_IMPEDANCE
+
+    open_standard = CalibrationStandard("open", capacitance=(10e-15, 1e-24))
+    admittance = 1j * omega * (10e-15 + 1e-24 * frequency)
+    np.testing.assert_allclose(
+        open_standard.evaluate(frequency), (1 - admittance * z0) / (1 + admittance * z0)
+    )
+
+    load = CalibrationStandard("load", resistance=75)
+    np.testing.assert_allclose(load.evaluate(frequency), 0.2)
+
+
+def test_tabulated_standard_is_interpolated():
+    # The tabulated points don't have to be sorted
+    short = CalibrationStandard(
+        "short", frequency=[60e6, 50e6], gamma=[-1j, -1 + 0j]
+    )
+    assert short.tabulated
+    np.testing.assert_allclose(
+        short.evaluate([50e6, 52.5e6, 60e6]), [-1, -0.75 - 0.25j, -1j]
+    )
+    with pytest.raises(ValueError):
+        short.evaluate([45e6])
+
+
+def test_definitions_from_json():
+    definitions = CalibrationStandard.definitions_from_json(
+        {
+            "open": {"delay": 20e-12, "capacitance": [10e-15]},
+            "load": {"frequency": [50e6, 60e6], "real": [0.1, 0.2], "imag": [0, 0.1]},
+        }
+    )
+    assert [definition.kind for definition in definitions] == ["short", "open", "load"]
+    # A missing standard is ideal
+    assert definitions[0].to_json() == CalibrationStandard("short").to_json()
+    assert definitions[1].delay == 20e-12
+    assert definitions[1].capacitance == (10e-15,)
+    assert definitions[2].tabulated
+
+    restored = CalibrationStandard.definitions_from_json(
+        {definition.kind: definition.to_json() for definition in definitions}
+    )
+    assert [definition.to_json() for definition in restored] == [
+        definition.to_json() for definition in definitions
+    ]
+
+
+def test_load_definitions(tmp_path):
+    filename = tmp_path / "standards.json"
+    with open(filename, "w") as f:
+        json.dump({"short": {"inductance": [5e-12]}}, f)
+    short, open_standard, load = CalibrationStandard.load_definitions(filename)
+    assert short.inductance == (5e-12,)
+    assert not open_standard.tabulated and open_standard.capacitance == (0,)
+    assert load.resistance == CalibrationStandard.REFERENCE_IMPEDANCE
+
+
+def test_unknown_kind_is_rejected():
+    with pytest.raises(ValueError):
+        CalibrationStandard("thru")
+
+
+def test_calibration_with_defined_standards(error_terms):
+    frequency, e_00, e_11, delta_e = error_terms
+    definitions = (
+        CalibrationStandard("short", delay=20e-12, inductance=(5e-12,)),
+        CalibrationStandard("open", delay=25e-12, capacitance=(10e-15,)),
+        CalibrationStandard("load", resistance=52),
+    )
+    standards = tuple(
+        measure(error_terms, definition.evaluate(frequency))
+        for definition in definitions
+    )
+    calibration = Calibration.from_standards(frequency, *standards, definitions)
+    np.testing.assert_allclose(calibration.e_00, e_00, atol=1e-9)
+    np.testing.assert_allclose(calibration.e_11, e_11, atol=1e-9)
+    np.testing.assert_allclose(calibration.delta_e, delta_e, atol=1e-9)
+    assert calibration.uses_definitions(definitions)
+    assert not calibration.uses_definitions()
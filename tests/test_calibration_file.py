@@ -0,0 +1,199 @@
+"""Tests for saving, loading and importing calibrations."""
+
+import json
+import shutil
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from nqrduck_autotm.controller import AutoTMController
+from nqrduck_autotm.model import Calibration, CalibrationStandard, S11Data
+
+N_POINTS = 50
+
+
+def make_standards() -> tuple:
+    """Short, open and load sweeps with distinguishable readings."""
+    frequency = np.linspace(50e6, 60e6, N_POINTS)
+    x = np.linspace(0, 1, N_POINTS)
+    return tuple(
+        S11Data.from_arrays(frequency, 900 + offset + 10 * x, 600 + offset * x)
+        for offset in (0.0, 20.0, 500.0)
+    )
+
+
+@pytest.fixture
+def calibration():
+    """A calibration with standards and variances."""
+    standards = make_standards()
+    variances = (np.ones((2, N_POINTS)), None, np.full((2, N_POINTS), 2.0))
+    return Calibration.from_standards(
+        standards[0].frequency, *standards, variances=variances
+    )
+
+
+def test_save_and_load(calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename, include_standards=True)
+    loaded = Calibration.load(filename)
+
+    for name in ("frequency", "e_00", "e_11", "delta_e", "variance"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(calibration, name))
+    assert loaded.standards_hash == calibration.standards_hash
+    assert loaded.uses_definitions(calibration.definitions)
+
+    # The standards are only read when they are needed
+    assert loaded._standards is None
+    for standard, original in zip(loaded.standards, calibration.standards):
+        for column, original_column in zip(standard.millivolts, original.millivolts):
+            np.testing.assert_array_equal(column, original_column)
+
+
+def test_save_and_load_definitions(tmp_path):
+    standards = make_standards()
+    definitions = (
+        CalibrationStandard("short", delay=20e-12, inductance=(5e-12, 1e-21)),
+        CalibrationStandard("open", capacitance=(10e-15,)),
+        CalibrationStandard(
+            "load", frequency=[50e6, 60e6], gamma=[0.01 + 0.02j, 0.03 - 0.01j]
+        ),
+    )
+    calibration = Calibration.from_standards(
+        standards[0].frequency, *standards, definitions=definitions
+    )
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename)
+    loaded = Calibration.load(filename)
+
+    assert loaded.uses_definitions(definitions)
+    assert not loaded.uses_definitions()
+    for definition, original in zip(loaded.definitions, definitions):
+        assert definition.kind == original.kind
+        np.testing.assert_allclose(
+            definition.evaluate(calibration.frequency),
+            original.evaluate(calibration.frequency),
+        )
+
+
+def test_save_without_standards(calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename)
+    loaded = Calibration.load(filename)
+    assert loaded.standards_hash == calibration.standards_hash
+    assert loaded.standards is None
+
+
+def test_hash_depends_on_the_standards():
+    standards = make_standards()
+    changed = S11Data.from_arrays(
+        standards[2].frequency, standards[2].return_loss_mv + 1, standards[2].phase_mv
+    )
+    assert Calibration.hash_standards(*standards) == Calibration.hash_standards(
+        *make_standards()
+    )
+    assert Calibration.hash_standards(*standards) != Calibration.hash_standards(
+        *standards[:2], changed
+    )
+
+
+def test_moved_file_has_no_standards(calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename, include_standards=True)
+    loaded = Calibration.load(filename)
+    shutil.move(filename, tmp_path / "moved.cal")
+    assert loaded.standards is None
+
+
+def test_standards_that_dont_match_the_hash_are_not_used(calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename, include_standards=True)
+    with np.load(filename) as data:
+        arrays = dict(data)
+    arrays["load"] = arrays["load"] + 1
+    with open(filename, "wb") as f:
+        np.savez(f, **arrays)
+
+    assert Calibration.load(filename).standards is None
+
+
+def test_load_unversioned_file(tmp_path):
+    # Calibration files without version only contain the error terms
+    filename = tmp_path / "calibration.npz"
+    frequency = np.linspace(50e6, 60e6, 5)
+    np.savez(
+        filename,
+        frequency=frequency,
+        e_00=np.zeros(5, dtype=complex),
+        e_11=np.zeros(5, dtype=complex),
+        delta_e=-np.ones(5, dtype=complex),
+    )
+    loaded = Calibration.load(filename)
+    np.testing.assert_array_equal(loaded.frequency, frequency)
+    assert loaded.standards_hash is None
+    assert loaded.standards is None
+    assert loaded.uses_definitions(None)
+
+
+def test_newer_version_is_rejected(calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename)
+    with np.load(filename) as data:
+        arrays = dict(data)
+    arrays["version"] = np.array(Calibration.FILE_VERSION + 1)
+    with open(filename, "wb") as f:
+        np.savez(f, **arrays)
+
+    with pytest.raises(ValueError):
+        Calibration.load(filename)
+
+
+@pytest.fixture
+def controller():
+    """A controller with a minimal model and view."""
+    model = SimpleNamespace(
+        standard_keys={"short": ("sweep",)},
+        standard_variances={"short": np.ones((2, N_POINTS))},
+        standard_definitions=None,
+        calibration=None,
+        short_calibration=None,
+        open_calibration=None,
+        load_calibration=None,
+    )
+    view = SimpleNamespace(errors=[])
+    view.add_error_text = view.errors.append
+    return AutoTMController(SimpleNamespace(model=model, view=view))
+
+
+def test_import_legacy_json(controller, tmp_path):
+    standards = make_standards()
+    filename = tmp_path / "calibration.json"
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                name: standard.to_json()
+                for name, standard in zip(Calibration.STANDARDS, standards)
+            },
+            f,
+        )
+
+    controller.import_calibration(filename)
+    model = controller.module.model
+    assert model.standard_keys == {}
+    assert model.standard_variances == {}
+    imported = (model.short_calibration, model.open_calibration, model.load_calibration)
+    assert Calibration.hash_standards(*imported) == Calibration.hash_standards(
+        *standards
+    )
+
+
+def test_import_calibration_file(controller, calibration, tmp_path):
+    filename = tmp_path / "calibration.cal"
+    calibration.save(filename, include_standards=True)
+    controller.import_calibration(filename)
+
+    model = controller.module.model
+    np.testing.assert_array_equal(model.calibration.e_00, calibration.e_00)
+    assert model.standard_definitions == model.calibration.definitions
+    # The standards of the imported calibration are used for recalculations
+    assert Calibration.hash_standards(
+        *controller.get_calibration_standards()
+    ) == calibration.standards_hash
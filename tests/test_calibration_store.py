@@ -0,0 +1,147 @@
+"""Tests for the LRU store of calculated calibrations."""
+
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from nqrduck_autotm.calibration_store import CalibrationStore
+from nqrduck_autotm.controller import AutoTMController
+from nqrduck_autotm.model import Calibration, CalibrationStandard, S11Data
+
+
+def make_calibration(n_points: int = 5, offset: float = 0) -> Calibration:
+    """A calibration with recognizable error terms."""
+    x = np.arange(n_points, dtype=float) + offset
+    return Calibration(np.linspace(50e6, 60e6, n_points), x + 1j, x - 1j, 2 * x + 0j)
+
+
+def key(n: int) -> tuple:
+    return CalibrationStore.make_key(50e6, 60e6 + n, 5, "atm")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CalibrationStore(tmp_path, capacity=2)
+
+
+def test_make_key_rounds_to_hz():
+    assert CalibrationStore.make_key(50e6 + 0.4, 60e6 - 0.4, 400.0) == (
+        50000000,
+        60000000,
+        400,
+        "",
+    )
+
+
+def test_capacity_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        CalibrationStore(tmp_path, capacity=0)
+
+
+def test_put_and_get(store):
+    calibration = make_calibration()
+    store.put(key(0), calibration)
+    assert key(0) in store
+    assert store.get(key(0)) is calibration
+    assert store.get(key(1)) is None
+
+
+def test_least_recently_used_is_evicted(store):
+    for n in range(3):
+        store.put(key(n), make_calibration(offset=n))
+    assert list(store.calibrations) == [key(1), key(2)]
+
+
+def test_get_marks_as_recently_used(store):
+    store.put(key(0), make_calibration())
+    store.put(key(1), make_calibration())
+    store.get(key(0))
+    store.put(key(2), make_calibration())
+    assert list(store.calibrations) == [key(0), key(2)]
+
+
+def test_evicted_calibration_is_loaded_from_disk(store):
+    for n in range(3):
+        store.put(key(n), make_calibration(offset=n))
+    assert key(0) in store
+    loaded = store.get(key(0))
+    np.testing.assert_array_equal(loaded.e_00, make_calibration(offset=0).e_00)
+    np.testing.assert_array_equal(loaded.delta_e, make_calibration(offset=0).delta_e)
+    assert len(store) == 2
+
+
+def test_calibrations_persist_across_stores(store, tmp_path):
+    store.put(key(0), make_calibration(offset=3))
+    reopened = CalibrationStore(tmp_path)
+    assert len(reopened) == 0
+    calibration = reopened.get(key(0))
+    np.testing.assert_array_equal(calibration.frequency, make_calibration().frequency)
+    np.testing.assert_array_equal(calibration.e_11, make_calibration(offset=3).e_11)
+
+
+def test_unreadable_file_is_ignored(store):
+    store.filename(key(0)).write_bytes(b"not a calibration")
+    assert store.get(key(0)) is None
+
+
+@pytest.fixture
+def controller(store):
+    """A controller whose model only has a calibration store."""
+    model = SimpleNamespace(
+        calibration_store=store,
+        calibration=None,
+        standard_definitions=None,
+        short_calibration=None,
+        open_calibration=None,
+        load_calibration=None,
+    )
+    return AutoTMController(SimpleNamespace(model=model, view=None))
+
+
+def test_stored_calibration_is_used_without_calibration(controller, store):
+    stored = make_calibration()
+    store.put(key(0), stored)
+    controller.load_stored_calibration(key(0))
+    assert controller.module.model.calibration is stored
+
+
+def test_covering_calibration_is_kept(controller, store):
+    # E.g. an imported calibration or one recalculated with new standard definitions
+    current = Calibration(
+        np.linspace(40e6, 70e6, 7), np.zeros(7), np.zeros(7), -np.ones(7)
+    )
+    controller.module.model.calibration = current
+    store.put(key(0), make_calibration())
+    controller.load_stored_calibration(key(0))
+    assert controller.module.model.calibration is current
+
+
+def test_stored_calibration_with_other_definitions_is_ignored(controller, store):
+    store.put(key(0), make_calibration())
+    controller.module.model.standard_definitions = (
+        CalibrationStandard("short", delay=25e-12),
+        CalibrationStandard("open"),
+        CalibrationStandard("load"),
+    )
+    controller.load_stored_calibration(key(0))
+    assert controller.module.model.calibration is None
+
+
+def test_stored_calibration_of_other_standards_is_ignored(controller, store):
+    frequency = np.linspace(50e6, 60e6, 5)
+    standards = [
+        S11Data.from_arrays(frequency, np.full(5, mv), np.full(5, 900.0))
+        for mv in (900.0, 910.0, 1500.0)
+    ]
+    stored = make_calibration()
+    stored.standards_hash = Calibration.hash_standards(*standards)
+    store.put(key(0), stored)
+
+    model = controller.module.model
+    model.short_calibration, model.open_calibration, model.load_calibration = standards
+    controller.load_stored_calibration(key(0))
+    assert model.calibration is stored
+
+    model.calibration = None
+    model.load_calibration = S11Data.from_arrays(frequency, np.full(5, 1400.0), np.zeros(5))
+    controller.load_stored_calibration(key(0))
+    assert model.calibration is None
@@ -0,0 +1,157 @@
+"""Tests for the command engine and the waits for the results of commands."""
+
+import time
+from types import SimpleNamespace
+import pytest
+from PyQt6.QtCore import QTimer
+from nqrduck_autotm.commands import CommandEngine, CommandFuture
+from nqrduck_autotm.controller import AutoTMController
+
+
+class FakeSerial:
+    """A serial connection that records the written commands."""
+
+    def __init__(self) -> None:
+        """Initialize the fake serial connection."""
+        self.written = []
+
+    def write(self, data: bytes) -> None:
+        """Record a written command."""
+        self.written.append(data)
+
+
+@pytest.fixture
+def serial():
+    """The fake serial connection."""
+    return FakeSerial()
+
+
+@pytest.fixture
+def engine(qapp, serial):
+    """A command engine with the default window of one command."""
+    return CommandEngine(serial, timeouts={"v": 2, "f": 10})
+
+
+def test_commands_are_serialized(engine, serial):
+    first = engine.submit("v")
+    second = engine.submit("f100f200f1")
+    # The second command waits until the first one is confirmed
+    assert serial.written == [b"v"]
+    assert first.state == CommandFuture.SENT
+    assert second.state == CommandFuture.PENDING
+
+    engine.on_confirmation(received=5.0)
+    assert first.confirmed() and first.confirmed_at == 5.0
+    assert serial.written == [b"v", b"f100f200f1"]
+    assert second.state == CommandFuture.SENT
+
+    engine.on_confirmation()
+    assert second.confirmed()
+    assert not engine.in_flight and not engine.queued
+
+
+def test_confirmations_match_commands_in_order(qapp, serial):
+    engine = CommandEngine(serial, max_in_flight=3)
+    futures = [engine.submit(command) for command in ("v", "r", "c")]
+    assert serial.written == [b"v", b"r", b"c"]
+
+    confirmed = []
+    for future in futures:
+        future.add_done_callback(lambda future: confirmed.append(future.command))
+    for _ in futures:
+        engine.on_confirmation()
+    assert confirmed == ["v", "r", "c"]
+
+
+def test_done_callback_of_a_done_future_is_called_right_away(engine):
+    future = engine.submit("v")
+    engine.on_confirmation()
+    called = []
+    future.add_done_callback(called.append)
+    assert called == [future]
+
+
+def test_confirmation_without_command_is_ignored(engine):
+    engine.on_confirmation()
+    assert not engine.in_flight
+
+
+def test_timeouts_by_letter(engine):
+    assert engine.submit("v").timeout == 2
+    assert engine.submit("f100f200f1").timeout == 10
+    assert engine.submit("x").timeout == CommandEngine.DEFAULT_TIMEOUT
+
+
+def test_timeout_fails_all_commands(engine):
+    first = engine.submit("v")
+    second = engine.submit("f100f200f1")
+    engine.last_activity -= 3
+    engine.check_timeout()
+    assert first.failed() and second.failed()
+    assert "timed out" in first.error
+    assert not engine.in_flight and not engine.queued
+    assert not engine.timer.isActive()
+
+
+def test_activity_restarts_the_timeout(engine):
+    future = engine.submit("v")
+    engine.last_activity -= 3
+    engine.on_activity()
+    engine.check_timeout()
+    assert future.state == CommandFuture.SENT
+    assert engine.timer.isActive()
+
+
+def test_cancel_all(engine):
+    futures = [engine.submit("v"), engine.submit("v")]
+    engine.cancel_all("Serial connection closed")
+    assert all(future.error == "Serial connection closed" for future in futures)
+
+
+def test_window_must_allow_a_command(qapp, serial):
+    with pytest.raises(ValueError):
+        CommandEngine(serial, max_in_flight=0)
+
+
+@pytest.fixture
+def controller(qapp):
+    """A controller with a minimal view that collects the error texts."""
+    view = SimpleNamespace(errors=[])
+    view.add_error_text = view.errors.append
+    return AutoTMController(SimpleNamespace(model=SimpleNamespace(), view=view))
+
+
+def test_wait_for_result_after_the_confirmation(controller):
+    future = CommandFuture("v1t2", timeout=2)
+    result = []
+
+    def receive_result():
+        # The handlers of the result line update the model, the waits are checked after the batch
+        result.append((1.0, 2.0))
+        controller.handle_messages([])
+
+    QTimer.singleShot(10, future.set_confirmed)
+    QTimer.singleShot(50, receive_result)
+
+    start = time.monotonic()
+    assert controller.wait_for(lambda: bool(result), 2, "Setting voltages", future)
+    assert time.monotonic() - start < 1
+    assert controller.module.view.errors == []
+
+
+def test_wait_for_ends_when_the_command_fails(controller):
+    future = CommandFuture("v1t2", timeout=2)
+    QTimer.singleShot(10, lambda: future.set_failed("Serial connection closed"))
+
+    start = time.monotonic()
+    assert not controller.wait_for(lambda: False, 2, "Setting voltages", future)
+    assert time.monotonic() - start < 1
+    # The failure is reported by the command, not as a timeout
+    assert controller.module.view.errors == []
+
+
+def test_wait_for_timeout(controller):
+    assert not controller.wait_for(lambda: False, 0.01, "Reading reflection")
+    assert controller.module.view.errors == [
+        "Reading reflection timed out after 0.01 s"
+    ]
@@ -0,0 +1,57 @@
+"""Tests for opening the serial connection through the controller."""
+
+import gc
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from nqrduck_autotm.controller import AutoTMController
+
+
+@pytest.fixture
+def controller(qapp):
+    """A controller with a minimal model and view that collects the error texts."""
+    model = SimpleNamespace(serial=None, binary_frames=False)
+    view = SimpleNamespace(errors=[])
+    view.add_error_text = view.errors.append
+    return AutoTMController(SimpleNamespace(model=model, view=view))
+
+
+def wait_until(qapp, condition, timeout: float = 5) -> None:
+    """Run the event loop until the condition is met."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        qapp.processEvents()
+        time.sleep(0.001)
+
+
+def test_open_connection_keeps_the_reader_alive(qapp, controller, monkeypatch):
+    # The commands sent after connecting aren't answered by a bare pseudo-terminal
+    monkeypatch.setattr(controller, "switch_to_atm", lambda: None)
+    monkeypatch.setattr(controller, "set_voltages", lambda *voltages: None)
+    master, slave = os.openpty()
+    try:
+        controller.open_connection(os.ttyname(slave))
+        # Only the controller references the reader while its port is opened
+        gc.collect()
+        wait_until(qapp, lambda: controller.module.model.serial is not None)
+
+        serial = controller.module.model.serial
+        assert serial.isOpen()
+        assert controller.pending_serial is None
+        assert controller.command_engine is not None
+        serial.close()
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def test_open_connection_releases_a_failed_reader(qapp, controller):
+    controller.open_connection("/dev/nqrduck-autotm-missing")
+    gc.collect()
+    wait_until(qapp, lambda: controller.module.view.errors)
+
+    assert "Could not connect" in controller.module.view.errors[0]
+    assert controller.pending_serial is None
+    assert controller.module.model.serial is None
@@ -0,0 +1,113 @@
+"""Tests for the latency histograms."""
+
+import csv
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from nqrduck_autotm.latency import CommandLatency, LatencyHistogram
+from nqrduck_autotm.serial_io import SerialMessage
+
+MAX_RELATIVE_ERROR = 2 ** (1 - LatencyHistogram.SUB_BUCKET_BITS)
+
+
+def test_buckets_cover_every_value():
+    values = np.concatenate(
+        (np.arange(200_000), np.geomspace(2e5, 1e12, 2000).astype(np.int64))
+    )
+    for value in values.tolist():
+        lowest, highest = LatencyHistogram.bucket_range(
+            LatencyHistogram.bucket_index(value)
+        )
+        assert lowest <= value < highest
+        assert highest - lowest <= max(1, lowest * MAX_RELATIVE_ERROR)
+
+
+def test_buckets_are_contiguous():
+    ranges = [LatencyHistogram.bucket_range(index) for index in range(5000)]
+    assert ranges[0][0] == 0
+    for (_, highest), (lowest, _) in zip(ranges, ranges[1:]):
+        assert highest == lowest
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.mean() is None
+    assert histogram.percentile(50) is None
+    assert histogram.buckets() == []
+
+
+def test_statistics():
+    rng = np.random.default_rng(0)
+    latencies = rng.lognormal(np.log(5e-3), 1, 10_000)
+    histogram = LatencyHistogram()
+    for latency in latencies:
+        histogram.record(latency)
+
+    assert histogram.count == len(latencies)
+    assert histogram.mean() == pytest.approx(latencies.mean(), rel=1e-3)
+    assert histogram.max * histogram.UNIT == pytest.approx(latencies.max(), abs=1e-6)
+    for percentile in (50, 90, 99, 99.9):
+        expected = np.percentile(latencies, percentile, method="inverted_cdf")
+        assert histogram.percentile(percentile) == pytest.approx(
+            expected, rel=MAX_RELATIVE_ERROR
+        )
+    assert histogram.percentile(100) == histogram.max * histogram.UNIT
+
+    rows = histogram.buckets()
+    assert sum(row[2] for row in rows) == len(latencies)
+    assert rows[-1][3] == pytest.approx(100)
+
+
+def test_negative_latencies_are_counted_as_zero():
+    histogram = LatencyHistogram()
+    histogram.record(-1e-3)
+    assert histogram.min == histogram.max == 0
+
+
+def command(letter: str, sent_at: float, confirmed_at: float):
+    """A confirmed command future."""
+    return SimpleNamespace(letter=letter, sent_at=sent_at, confirmed_at=confirmed_at)
+
+
+def test_command_latency_matches_results_to_commands():
+    latency = CommandLatency()
+    latency.on_command_confirmed(command("v", 10.0, 10.002))
+    latency.on_message(SerialMessage("i info", received=10.003))
+    latency.on_message(SerialMessage("v1.0t2.0", received=10.012))
+    # A second result line doesn't belong to a command
+    latency.on_message(SerialMessage("v1.0t2.0", received=10.1))
+
+    confirmation = latency.histogram("v", CommandLatency.CONFIRMATION)
+    result = latency.histogram("v", CommandLatency.RESULT)
+    assert (confirmation.count, confirmation.min) == (1, 2000)
+    assert (result.count, result.min) == (1, 10000)
+
+    (summary,) = (row for row in latency.summary() if row[1] == CommandLatency.RESULT)
+    assert summary[:3] == ("v", CommandLatency.RESULT, 1)
+
+    latency.reset()
+    assert latency.summary() == []
+
+
+def test_unsent_commands_are_ignored():
+    latency = CommandLatency()
+    latency.on_command_confirmed(command("v", None, 1.0))
+    assert latency.histograms == {}
+
+
+def test_export_csv(tmp_path):
+    latency = CommandLatency()
+    latency.on_command_confirmed(command("c", 0.0, 0.001))
+    latency.on_command_confirmed(command("f", 0.0, 0.0005))
+    filename = tmp_path / "latency.csv"
+    latency.export_csv(filename)
+
+    with open(filename, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["command"], row["stage"]) for row in rows] == [
+        ("c", CommandLatency.CONFIRMATION),
+        ("f", CommandLatency.CONFIRMATION),
+    ]
+    assert rows[0]["lowest_ms"] == "1.000"
+    assert rows[0]["count"] == "1"
+    assert rows[0]["cumulative_percent"] == "100.000"
@@ -0,0 +1,60 @@
+"""Tests for the phase sign correction and the incremental PhaseSignResolver."""
+
+import numpy as np
+import pytest
+from nqrduck_autotm.model import PhaseSignResolver, S11Data
+
+
+def resonance_phase(n_points: int, seed: int = 0) -> np.ndarray:
+    """The absolute phase of a resonance: it rises to 180 deg, falls to 0 and rises again, quantized to whole mV."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(-1, 1, n_points)
+    phase = 180 * np.abs(np.sin(np.pi * (x + 0.3) ** 2 * 1.5))
+    phase_mv = np.round(phase * S11Data.PHASE_SLOPE + rng.normal(0, 5, n_points))
+    return np.clip(phase_mv, 0, 1800) / S11Data.PHASE_SLOPE
+
+
+def resolve(phase: np.ndarray, n_points: int = None) -> PhaseSignResolver:
+    resolver = PhaseSignResolver(n_points)
+    for value in phase:
+        resolver.add_point(float(value))
+    return resolver
+
+
+@pytest.mark.parametrize("n_points", [5, 6, 50, 400, 1001])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_finish_matches_batch_correction(n_points, seed):
+    phase = resonance_phase(n_points, seed)
+    expected = S11Data.phase_correction_batch(None, phase[np.newaxis, :])[0]
+    np.testing.assert_array_equal(resolve(phase, n_points).finish(), expected)
+
+
+def test_finish_matches_batch_correction_with_plateaus():
+    # Coarse quantization produces exact plateaus at the extrema
+    phase = np.round(resonance_phase(400) / 10) * 10
+    expected = S11Data.phase_correction_batch(None, phase[np.newaxis, :])[0]
+    np.testing.assert_array_equal(resolve(phase).finish(), expected)
+
+
+def test_short_sweep_is_not_corrected():
+    phase = np.array([10.0, 20.0, 30.0])
+    np.testing.assert_array_equal(resolve(phase).finish(), phase)
+
+
+def test_live_estimate_is_aligned_with_the_data_points():
+    phase = resonance_phase(400)
+    resolver = PhaseSignResolver(400)
+    for n, value in enumerate(phase, start=1):
+        resolver.add_point(float(value))
+        if n % 37 == 0:
+            assert len(resolver.phase_deg) == n
+
+
+def test_batch_correction_matches_single_sweeps():
+    stack = np.stack([resonance_phase(200, seed) for seed in range(4)])
+    batch = S11Data.phase_correction_batch(None, stack)
+    for phase, corrected in zip(stack, batch):
+        data = S11Data.from_arrays(
+            np.arange(200.0), np.zeros(200), phase * S11Data.PHASE_SLOPE
+        )
+        np.testing.assert_array_equal(data.phase_deg, corrected)
@@ -0,0 +1,144 @@
+"""Tests for the recording and replay of the serial traffic."""
+
+from types import SimpleNamespace
+import pytest
+from PyQt6.QtCore import QThreadPool
+from nqrduck_autotm.controller import AutoTMController
+from nqrduck_autotm.model import S11Data
+from nqrduck_autotm.recorder import SessionRecorder, SessionReplay
+from nqrduck_autotm.serial_io import LINE_PARSERS, SerialMessage
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """A recording of a command, its confirmation and 300 sweep points."""
+    filename = tmp_path / "session.atm"
+    recorder = SessionRecorder(filename)
+    recorder.record_command("f1f300f1", timestamp=1.0)
+    recorder.record_message(SerialMessage("c", received=1.1, confirmation=True))
+    for index in range(300):
+        recorder.record_message(
+            SerialMessage(f"f{index + 1}r900p10", received=2.0 + index)
+        )
+    recorder.close()
+    return filename
+
+
+def replay(recording, speed: float = 0) -> tuple:
+    """A replay of the recording and the lists its commands and messages are collected in."""
+    commands, messages = [], []
+    replay = SessionReplay(
+        SessionRecorder.read(recording), messages.extend, LINE_PARSERS, speed
+    )
+    replay.command_replayed.connect(lambda *command: commands.append(command))
+    return replay, commands, messages
+
+
+def test_replay_keeps_recorded_times(qapp, recording):
+    session, commands, messages = replay(recording)
+    finished = []
+    session.finished.connect(lambda: finished.append(session.duration))
+    session.start()
+    while not finished:
+        qapp.processEvents()
+
+    assert commands == [("f1f300f1", 1.0)]
+    # The confirmation is dropped, there is no command it could confirm
+    assert len(messages) == 300
+    assert messages[0].values == (1.0, 900.0, 10.0)
+    assert [message.received for message in messages[:2]] == [2.0, 3.0]
+    assert finished[0] is not None
+
+
+def test_stop_finishes_the_replay_once(qapp, recording):
+    session, _, messages = replay(recording)
+    finished = []
+    session.finished.connect(lambda: finished.append(session.position))
+    session.start()
+    # At maximum speed the first batch is handled right away, the rest in the next event loop iteration
+    assert 0 < len(messages) < 300
+
+    session.stop()
+    session.stop()
+    qapp.processEvents()
+    assert finished == [session.position]
+    assert session.position < len(session.records)
+    assert session.duration is not None
+    assert len(messages) == SessionReplay.MAX_BATCH
+
+
+def test_truncated_record_is_ignored(recording):
+    with open(recording, "ab") as f:
+        f.write(SessionRecorder.RECORD.pack(5.0, SessionRecorder.LINE, 100) + b"f1")
+    assert len(SessionRecorder.read(recording)) == 302
+
+
+def test_replayed_sweeps_are_not_archived(qapp, recording):
+    archived = []
+    model = SimpleNamespace(
+        active_calibration=None,
+        frequency_sweep_key=("sweep",),
+        frequency_sweep_start=None,
+        frequency_sweep_stop=None,
+        calibration=None,
+        calibration_store=None,
+        signal_path="preamp",
+        clear_data_points=lambda n_points: None,
+        sweep_archive=SimpleNamespace(append=lambda *args, **kwargs: archived.append(args)),
+        get_s11_data=lambda: S11Data([(1e6, 900, 10), (2e6, 900, 20)]),
+    )
+    view = SimpleNamespace(
+        frequency_sweep_spinner=SimpleNamespace(hide=lambda: None),
+        create_frequency_sweep_spinner_dialog=lambda: None,
+        add_info_text=lambda text: None,
+    )
+    controller = AutoTMController(SimpleNamespace(model=model, view=view))
+    controller.replay, _, _ = replay(recording)
+    controller.on_command_replayed("f1f300f1", 1.0)
+
+    controller.process_measurement_data(SerialMessage("r", received=4.5))
+    assert archived == []
+    assert (model.frequency_sweep_start, model.frequency_sweep_stop) == (1.0, 4.5)
+    QThreadPool.globalInstance().waitForDone()
+
+
+def test_recording_is_flushed_per_batch(qapp, tmp_path):
+    filename = tmp_path / "session.rec"
+    serial = SimpleNamespace(take_messages=lambda: [SerialMessage("v1t2", received=1.0)])
+    controller = AutoTMController(SimpleNamespace(model=SimpleNamespace(), view=None))
+    controller.sender = lambda: serial
+    controller.handle_messages = lambda messages: None
+    controller.recorder = SessionRecorder(filename)
+
+    controller.on_ready_read()
+    # The batch can be read while the recording is still open
+    (record,) = SessionRecorder.read(filename)
+    assert record.payload == b"v1t2"
+    controller.stop_recording()
+
+
+def test_replay_is_refused_while_connected(qapp, recording):
+    view = SimpleNamespace(errors=[])
+    view.add_error_text = view.errors.append
+    model = SimpleNamespace(serial=SimpleNamespace(isOpen=lambda: True))
+    controller = AutoTMController(SimpleNamespace(model=model, view=view))
+
+    assert controller.replay_session(recording) is None
+    assert not controller.replaying
+    assert view.errors == [f"Could not replay {recording}. Disconnect from the device first"]
+
+
+def test_connecting_stops_the_replay(qapp, recording, monkeypatch):
+    controller = AutoTMController(SimpleNamespace(model=SimpleNamespace(), view=None))
+    session, _, messages = replay(recording, speed=1)
+    controller.replay = session
+    session.start()
+
+    def missing_device(*args, **kwargs):
+        raise OSError("No such device")
+
+    monkeypatch.setattr("nqrduck_autotm.controller.SerialReader", missing_device)
+
+    controller.open_connection("/dev/null")
+    assert session.duration is not None
+    assert len(messages) < 300
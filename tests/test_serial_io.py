@@ -0,0 +1,212 @@
+"""Tests for the line parsers, the binary frames and the serial reader."""
+
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from nqrduck_autotm.serial_io import (
+    FRAME_HEADER,
+    FRAME_START,
+    LINE_PARSERS,
+    MAX_FRAME_SAMPLES,
+    SWEEP_SAMPLE_DTYPE,
+    SerialMessage,
+    SerialReader,
+    decode_frame,
+    encode_frame,
+    fletcher16,
+)
+
+
+class FakePort:
+    """A serial port that returns the data fed to it on the next read."""
+
+    def __init__(self) -> None:
+        """Initialize the fake port."""
+        self.data = b""
+
+    def readAll(self):
+        """Return the fed data like QSerialPort.readAll."""
+        data, self.data = self.data, b""
+        return SimpleNamespace(data=lambda: data)
+
+
+@pytest.fixture
+def reader(qapp):
+    """A serial reader that reads from a fake port. The thread of the reader isn't started."""
+    reader = SerialReader("/dev/null", 115200)
+    reader.port = FakePort()
+    return reader
+
+
+def feed(reader: SerialReader, data: bytes) -> list:
+    """Feed data to the reader and return the queued messages."""
+    reader.port.data = data
+    reader._read()
+    return reader.take_messages()
+
+
+@pytest.mark.parametrize(
+    "text, values",
+    [
+        ("f83560000r900.5p450.0", (83560000.0, 900.5, 450.0)),
+        ("v1.25t3.5", (1.25, 3.5)),
+        ("p-120m4000", (-120, 4000)),
+        ("m880.0p1200.0", (880.0, 1200.0)),
+        ("z100,1m-200,-1", (100, 1, -200, -1)),
+    ],
+)
+def test_parse_lines(text, values):
+    message = SerialMessage.parse(text, received=1.0)
+    assert message.values == values
+    assert message.error is None
+    assert message.prefix == text[0]
+    assert message.payload == text[1:]
+    assert message.received == 1.0
+
+
+@pytest.mark.parametrize("text", ["f83560000r900.5", "v1.25", "pxm1", "z1m2", "m"])
+def test_malformed_lines_have_an_error(text):
+    message = SerialMessage.parse(text)
+    assert message.values is None
+    assert message.error
+
+
+def test_lines_without_parser_only_have_a_payload():
+    message = SerialMessage.parse("iStarting sweep")
+    assert message.values is None
+    assert message.error is None
+    assert message.payload == "Starting sweep"
+    assert "i" not in LINE_PARSERS
+
+
+def test_lines_are_split_across_reads(reader):
+    assert feed(reader, b"v1.0t2") == []
+    messages = feed(reader, b".0\r\nfoo\nba")
+    assert [message.text for message in messages] == ["v1.0t2.0", "foo"]
+    assert messages[0].values == (1.0, 2.0)
+    assert reader.received_lines == 2
+    assert [message.text for message in feed(reader, b"r\n")] == ["bar"]
+
+
+def test_confirmation_without_line_ending(reader):
+    reader._pending_confirmations = 2
+    messages = feed(reader, b"ccv1.0t2.0\n")
+    assert [message.confirmation for message in messages] == [True, True, False]
+    assert messages[2].values == (1.0, 2.0)
+    assert reader._pending_confirmations == 0
+
+
+def test_signal_path_lines_are_not_confirmations(reader):
+    reader._pending_confirmations = 1
+    # More data is needed to tell the line 'cp' from a confirmation followed by a 'p' line
+    assert feed(reader, b"cp") == []
+    messages = feed(reader, b"\nc")
+    assert [message.text for message in messages] == ["cp", "c"]
+    assert messages[1].confirmation
+    assert reader._pending_confirmations == 0
+
+
+def test_single_c_is_a_confirmation(reader):
+    # The confirmation isn't terminated, so it isn't held back for more data
+    reader._pending_confirmations = 1
+    (message,) = feed(reader, b"c")
+    assert message.confirmation
+
+
+def test_lines_starting_with_c_without_pending_command(reader):
+    messages = feed(reader, b"ca\n")
+    assert [message.text for message in messages] == ["ca"]
+    assert not messages[0].confirmation
+
+
+def test_high_water_mark_drops_lines_but_not_confirmations(reader):
+    reader.high_water_mark = 2
+    reader._pending_confirmations = 1
+    messages = feed(reader, b"a\nb\nd\nc")
+    assert [message.text for message in messages] == ["a", "b", "c"]
+    assert reader.dropped_lines == 1
+
+
+def test_late_lines_are_counted(reader):
+    reader.queue.append(SerialMessage("a", received=0))
+    reader.queue.append(SerialMessage("b"))
+    assert len(reader.take_messages()) == 2
+    assert reader.late_lines == 1
+
+
+def make_samples(n_samples: int, offset: int = 0) -> np.ndarray:
+    """Sweep samples with recognizable values."""
+    samples = np.empty(n_samples, dtype=SWEEP_SAMPLE_DTYPE)
+    samples["frequency"] = 80_000_000 + np.arange(n_samples) * 1000
+    samples["return_loss"] = np.arange(n_samples) + offset
+    samples["phase"] = 1800 - np.arange(n_samples)
+    return samples
+
+
+def reference_fletcher16(data: bytes) -> int:
+    """The textbook Fletcher-16 loop."""
+    sum1 = sum2 = 0
+    for byte in data:
+        sum1 = (sum1 + byte) % 255
+        sum2 = (sum2 + sum1) % 255
+    return (sum2 << 8) | sum1
+
+
+@pytest.mark.parametrize(
+    "data", [b"", b"abcde", b"abcdef", bytes(range(256)) * 40, b"\xff" * 5000]
+)
+def test_fletcher16_matches_reference(data):
+    assert fletcher16(data) == reference_fletcher16(data)
+
+
+def test_frame_round_trip():
+    samples = make_samples(300)
+    frame = encode_frame(70000, samples)
+    message, size = decode_frame(frame + b"v1.0t2.0\n", received=2.0)
+    assert size == len(frame)
+    assert message.prefix == "F"
+    assert message.received == 2.0
+    sequence, decoded = message.values
+    assert sequence == 70000 & 0xFFFF
+    np.testing.assert_array_equal(decoded, samples)
+
+
+def test_incomplete_frame_needs_more_data():
+    frame = encode_frame(1, make_samples(10))
+    for end in (1, FRAME_HEADER.size - 1, FRAME_HEADER.size, len(frame) - 1):
+        assert decode_frame(frame[:end]) == (None, 0)
+
+
+def test_corrupt_frame_is_skipped_whole():
+    frame = bytearray(encode_frame(1, make_samples(10)))
+    frame[FRAME_HEADER.size + 3] ^= 0x01
+    assert decode_frame(bytes(frame)) == (None, len(frame))
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        FRAME_HEADER.pack(FRAME_START, b"X", 0, 1),
+        FRAME_HEADER.pack(FRAME_START, b"F", 0, MAX_FRAME_SAMPLES + 1),
+    ],
+)
+def test_invalid_header_skips_the_start_byte(header):
+    assert decode_frame(header + bytes(64)) == (None, 1)
+
+
+def test_reader_decodes_frames_between_lines(reader):
+    frames = [encode_frame(sequence, make_samples(5, sequence)) for sequence in (0, 1, 3)]
+    stream = b"istart\n" + frames[0] + frames[1] + b"v1.0t2.0\n" + frames[2]
+    messages = feed(reader, stream[:20]) + feed(reader, stream[20:])
+    assert [message.prefix for message in messages] == ["i", "F", "F", "v", "F"]
+    assert [message.values[0] for message in messages if message.prefix == "F"] == [0, 1, 3]
+    assert reader.received_frames == 3
+    assert reader.lost_frames == 1
+
+
+def test_reader_counts_corrupt_frames(reader):
+    frame = bytearray(encode_frame(0, make_samples(5)))
+    frame[-1] ^= 0xFF
+    messages = feed(reader, bytes(frame) + b"foo\n")
+    assert [message.text for message in messages] == ["foo"]
+    assert reader.corrupt_frames == 1
@@ -0,0 +1,148 @@
+"""Tests for the virtual ATM system."""
+
+import os
+import select
+import subprocess
+import sys
+import time
+import tty
+import numpy as np
+import pytest
+from nqrduck_autotm.model import S11Data
+from nqrduck_autotm.serial_io import FRAME_START, FRAME_VERSION, SerialMessage, decode_frame
+from nqrduck_autotm.simulator import ResonantProbe, VirtualATMDevice
+
+
+@pytest.mark.parametrize("matching", [0.3, 0.45, 0.7])
+def test_measurement_round_trip(matching):
+    # The probe is not perfectly matched, a return loss above 30 dB is clipped by the AD8302
+    probe = ResonantProbe(tuning=0.5, matching=matching)
+    device = VirtualATMDevice(probe, noise=0)
+    frequency = np.linspace(60e6, 110e6, 501)
+    gamma = probe.gamma(frequency)
+
+    return_loss_mv, phase_mv = device.measure(frequency)
+    data = S11Data.from_arrays(frequency, return_loss_mv, phase_mv)
+
+    np.testing.assert_allclose(np.abs(data.gamma), np.abs(gamma), rtol=1e-4)
+    # The AD8302 only measures the absolute value of the phase, its sign is resolved by the phase correction
+    phase_deg = (data.phase_mv - S11Data.CENTER_POINT_PHASE) / S11Data.PHASE_SLOPE
+    np.testing.assert_allclose(phase_deg, np.abs(np.degrees(np.angle(gamma))), atol=1e-9)
+
+
+def test_matched_probe_has_the_highest_return_loss():
+    probe = ResonantProbe()
+    tuning, matching = probe.optimum(probe.RESONANCE_FREQUENCY)
+    probe.tuning, probe.matching = tuning, matching
+    device = VirtualATMDevice(probe, noise=0)
+    frequency = np.linspace(70e6, 100e6, 301)
+
+    data = S11Data.from_arrays(frequency, *device.measure(frequency))
+    resonance = np.argmax(data.return_loss_db)
+    assert abs(frequency[resonance] - probe.RESONANCE_FREQUENCY) <= 100e3
+
+
+class Client:
+    """The host side of the pseudo-terminal of a running virtual device."""
+
+    def __init__(self, path: str) -> None:
+        """Open the device."""
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+        self.buffer = b""
+
+    def command(self, command: str, end: bytes, timeout: float = 5) -> bytes:
+        """Write a command and read until the answer ends with end."""
+        os.write(self.fd, command.encode())
+        deadline = time.monotonic() + timeout
+        while not self.buffer.endswith(end):
+            assert time.monotonic() < deadline, f"No answer to {command}: {self.buffer}"
+            readable, _, _ = select.select([self.fd], [], [], 0.1)
+            if readable:
+                self.buffer += os.read(self.fd, 65536)
+        answer, self.buffer = self.buffer, b""
+        return answer
+
+    def close(self) -> None:
+        """Close the device."""
+        os.close(self.fd)
+
+
+@pytest.fixture
+def client():
+    """A client connected to a virtual device without latency, noise and pacing."""
+    device = VirtualATMDevice(noise=0, baudrate=0, seed=0)
+    client = Client(device.start())
+    client.device = device
+    yield client
+    client.close()
+    device.stop()
+
+
+def test_commands_are_confirmed_and_answered(client):
+    assert client.command("v1.25v2.5", b"\r\n") == b"cv1.25t2.5\r\n"
+    assert client.command("ca", b"\r\n") == b"cca\r\n"
+    assert client.device.signal_path == "atm"
+
+    answer = client.command("r83.56", b"\r\n")
+    assert answer[:1] == b"c"
+    message = SerialMessage.parse(answer[1:].decode().rstrip())
+    assert message.prefix == "m" and message.error is None
+    expected = client.device.measure(np.array([83.56e6]))
+    assert message.values == pytest.approx([value[0] for value in expected], abs=0.05)
+
+    assert client.command("x", b"\r\n").startswith(b"ceCould not process command x")
+
+
+def test_frequency_sweep_as_lines(client):
+    answer = client.command("f80000000f81000000f100000", b"r\r\n")
+    assert answer[:1] == b"c"
+    lines = answer[1:].decode().split("\r\n")[:-1]
+    assert lines[-1] == "r"
+    points = [SerialMessage.parse(line).values for line in lines[:-1]]
+    assert [point[0] for point in points] == pytest.approx(np.linspace(80e6, 81e6, 11))
+
+
+def test_frequency_sweep_as_frames(client):
+    assert client.command("b1", b"\r\n") == f"cb{FRAME_VERSION}\r\n".encode()
+    answer = client.command("f80000000f90000000f10000", b"r\r\n")
+    assert answer[:1] == b"c"
+
+    buffer = answer[1:]
+    samples = []
+    while buffer[:1] == bytes((FRAME_START,)):
+        message, size = decode_frame(buffer)
+        assert message is not None
+        samples.append(message.values[1])
+        buffer = buffer[size:]
+    assert buffer == b"r\r\n"
+
+    samples = np.concatenate(samples)
+    np.testing.assert_array_equal(
+        samples["frequency"], np.round(np.linspace(80e6, 90e6, 1001))
+    )
+    return_loss_mv, phase_mv = client.device.measure(samples["frequency"].astype(float))
+    np.testing.assert_array_equal(samples["return_loss"], np.round(return_loss_mv))
+    np.testing.assert_array_equal(samples["phase"], np.round(phase_mv))
+
+
+def test_simulator_runs_without_qapplication():
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..", "src")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "nqrduck_autotm.simulator", "--baudrate", "0"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=environment,
+        text=True,
+    )
+    try:
+        # The simulator prints the path of its device once it is ready
+        path = process.stdout.readline().strip()
+        assert path.startswith("/dev/"), process.stderr.read()
+        client = Client(path)
+        assert client.command("ca", b"\r\n") == b"cca\r\n"
+        client.close()
+    finally:
+        process.terminate()
+        process.wait(timeout=5)